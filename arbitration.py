@@ -0,0 +1,111 @@
+"""Slot arbitration: how long an MCU waits in INIT before it sends its SYN.
+
+Two MCUs that send in the same slot pull the line at the same instant.
+Each drops the other's SYN as its own echo and the handshake ends in a
+timeout or a blacklisted line. A strategy picks the slot from the timing
+profile's time_slots_ms and is told how each attempt ended, so it can
+spread the MCUs apart or shrink its window when nobody contends.
+
+Pass one instance per MCU as MCU(..., arbitration=...). Its state lives in
+the MCU's process like the rest of the FSM.
+"""
+import random
+import zlib
+from abc import ABC, abstractmethod
+
+
+class Arbitration(ABC):
+    """Base class, subclasses must pick the slot and the other hooks default to doing nothing"""
+    @abstractmethod
+    def slot(self, mcu_name, line_name, slots_ms):
+        """Slot (ms) to wait before sending SYN on `line_name`"""
+
+    def observed(self, line_name):
+        """Another MCU's pulse ended our slot wait"""
+
+    def collided(self, line_name):
+        """Our attempt failed: conflicting pulse, missing SYN or unanswered SYN"""
+
+    def succeeded(self, line_name):
+        """Handshake on `line_name` completed"""
+
+
+class UniformSlots(Arbitration):
+    """Uniform random slot from the whole window, the MCU's original behaviour"""
+    def slot(self, mcu_name, line_name, slots_ms):
+        return random.choice(slots_ms)
+
+
+class ExponentialBackoff(Arbitration):
+    """Binary exponential back-off: the first `initial` slots, doubled after every collision.
+
+    A success resets the window. A collision usually costs the line (it ends
+    blacklisted), so the first window must already keep collisions rare.
+    """
+    def __init__(self, initial=32):
+        self.initial = initial
+        self.collisions = 0
+
+    def window(self, slots_ms):
+        return min(len(slots_ms), self.initial << min(self.collisions, 16))
+
+    def slot(self, mcu_name, line_name, slots_ms):
+        return random.choice(slots_ms[:self.window(slots_ms)])
+
+    def collided(self, line_name):
+        self.collisions += 1
+
+    def succeeded(self, line_name):
+        self.collisions = 0
+
+
+class IdSlots(Arbitration):
+    """Slot derived from the MCU's name, so two MCUs with different names rarely pick the same one.
+
+    The slot is a CRC of (MCU name, line, attempt) within the first `window`
+    slots. Every collision on a line moves to the next attempt and so to an
+    unrelated slot, two names cannot keep colliding.
+    """
+    def __init__(self, window=16):
+        self.window = window
+        self.attempts = {}  # line name -> collisions so far
+
+    def slot(self, mcu_name, line_name, slots_ms):
+        key = f"{mcu_name}:{line_name}:{self.attempts.get(line_name, 0)}".encode('utf-8')
+        return slots_ms[zlib.crc32(key) % min(self.window, len(slots_ms))]
+
+    def collided(self, line_name):
+        self.attempts[line_name] = self.attempts.get(line_name, 0) + 1
+
+
+class AdaptiveSlots(Arbitration):
+    """Window sized by the line activity seen so far.
+
+    Collisions double the window, a peer's pulse during our slot wait (the
+    lines are contended) widens it by one slot and a success halves it, down
+    to `minimum` slots.
+    """
+    def __init__(self, initial=32, minimum=16):
+        self.size = initial
+        self.minimum = minimum
+
+    def slot(self, mcu_name, line_name, slots_ms):
+        self.size = max(self.minimum, min(self.size, len(slots_ms)))
+        return random.choice(slots_ms[:self.size])
+
+    def observed(self, line_name):
+        self.size += 1
+
+    def collided(self, line_name):
+        self.size *= 2
+
+    def succeeded(self, line_name):
+        self.size //= 2
+
+
+STRATEGIES = {
+    'uniform': UniformSlots,
+    'backoff': ExponentialBackoff,
+    'id': IdSlots,
+    'adaptive': AdaptiveSlots,
+}
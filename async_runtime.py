@@ -0,0 +1,148 @@
+import asyncio
+from time import monotonic
+
+from timebase import Sleep
+from simulation import SimulationManager, SimulationQueue
+from mcu import MCU, TOLERANCE
+from pinger import Pinger, PulseScheduler, Bridge
+
+
+class Wakeup:
+    """Resumes one routine blocked in WaitUntil"""
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self, *args):
+        self._event.set()
+
+    def reset(self):
+        # Events must belong to the loop that waits on them
+        self._event = asyncio.Event()
+
+    async def wait(self, timeout=None):
+        if not self._event.is_set():
+            if timeout is None:
+                await self._event.wait()
+            else:
+                handle = asyncio.get_running_loop().call_later(timeout, self._event.set)
+                await self._event.wait()
+                handle.cancel()
+        self._event.clear()
+
+
+class WakeupGroup:
+    def __init__(self, wakeups):
+        self.wakeups = wakeups
+
+    def notify(self, *args):
+        for wakeup in self.wakeups:
+            wakeup.notify()
+
+
+class AsyncRuntime:
+    """Runs MCUs, pingers and bridges as asyncio tasks in a single process, in real time.
+
+    The routines are the same ones the Process targets and the Simulation
+    drive. Sleep becomes asyncio.sleep. A WaitUntil parks the task until one
+    of the lines it is wired to changes, its queues get an item or the
+    deadline passes, so waking is local to the MCU and never a broadcast.
+
+    Every Sleep records how late the loop woke it up. A pulse is exactly one
+    Sleep long, so once that lateness reaches the tolerance of the strictest
+    MCU its peer can no longer classify the pulse.
+    """
+
+    def __init__(self):
+        self.manager = SimulationManager()
+        self.output_queue = SimulationQueue(self)
+        self.lateness = []  # Seconds every Sleep overshot its duration
+        self.tolerances = []  # ms, the timing tolerance of every MCU
+
+        self._routines = []  # (routine, wakeup)
+        self._monitor = Wakeup()
+
+    clock = staticmethod(monotonic)  # Same clock as the asyncio loop
+
+    def notify(self, *args):
+        self._monitor.notify()
+
+    def add_mcu(self, mcu: MCU):
+        routines = mcu._logic_routines() + [mcu._watch_edges()]
+        group = WakeupGroup([Wakeup() for _ in routines])
+        mcu.interrupt_queue = SimulationQueue(group)
+        mcu.edges = SimulationQueue(group)
+        if mcu.data_channel is not None:
+            mcu.data_requests = SimulationQueue(group)
+        for line in mcu.all_lines.values():
+            line.subscribe(group.notify)
+        self._routines.extend(zip(routines, group.wakeups))
+        self.tolerances.append(mcu.timing.tolerance)
+        return mcu
+
+    def add_pinger(self, pinger: Pinger):
+        self._routines.append((pinger._pulses(), Wakeup()))
+        return pinger
+
+    def add_scheduler(self, scheduler: PulseScheduler):
+        self._routines.append((scheduler._routine(), Wakeup()))
+        return scheduler
+
+    def add_bridge(self, bridge: Bridge):
+        # Bridged lines form a net that needs no routine, their edges already wake up the MCUs
+        bridge.start()
+        return bridge
+
+    @property
+    def max_lateness(self):
+        return max(self.lateness, default=0.0)
+
+    @property
+    def tolerance_violated(self):
+        return self.max_lateness * 1000 >= min(self.tolerances, default=TOLERANCE)
+
+    async def _drive(self, routine, wakeup):
+        clock = self.clock
+        try:
+            for request in routine:
+                if isinstance(request, Sleep):
+                    start = clock()
+                    await asyncio.sleep(request.duration)
+                    self.lateness.append(clock() - start - request.duration)
+                elif request.deadline is None:
+                    await wakeup.wait()
+                else:
+                    await wakeup.wait(max(0.0, request.deadline - clock()))
+        finally:
+            routine.close()
+
+    def run(self, until=None, stop_when=None):
+        """Run until all routines ended, `until` seconds passed or stop_when() is true"""
+        return asyncio.run(self._run(until, stop_when))
+
+    async def _run(self, until, stop_when):
+        for _, wakeup in self._routines:
+            wakeup.reset()
+        self._monitor.reset()
+
+        start = self.clock()
+        deadline = None if until is None else start + until
+        tasks = [asyncio.create_task(self._drive(routine, wakeup)) for routine, wakeup in self._routines]
+        for task in tasks:
+            task.add_done_callback(self.notify)
+
+        try:
+            while not (stop_when is not None and stop_when()):
+                if all(task.done() for task in tasks):
+                    break
+                if deadline is not None and self.clock() >= deadline:
+                    break
+                await self._monitor.wait(None if deadline is None else deadline - self.clock())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        return self.clock() - start
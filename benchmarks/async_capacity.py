@@ -0,0 +1,74 @@
+"""How many MCUs the asyncio runtime sustains before pulse timing breaks.
+
+Runs independent MCU pairs in one event loop, doubling the number of MCUs
+until the worst Sleep overshoot reaches TOLERANCE.
+
+    python -m benchmarks.async_capacity [--lines 1] [--max-mcus 1600]
+"""
+import argparse
+import contextlib
+import io
+import statistics
+from time import process_time
+
+from shared_lines import SharedLine
+from trace_buffer import TraceBuffer
+from mcu import MCU, TOLERANCE
+from async_runtime import AsyncRuntime
+
+
+def run(num_mcus, lines_per_pair, time_limit):
+    rt = AsyncRuntime()
+    for pair in range(num_mcus // 2):
+        lines = [(f"L{i + 1}", SharedLine(rt.manager, name=f"P{pair}L{i + 1}", clock=rt.clock,
+                                          data_log=TraceBuffer(capacity=256, shared=False)))
+                 for i in range(lines_per_pair)]
+        rt.add_mcu(MCU(f"A{pair}", lines, rt.output_queue, clock=rt.clock))
+        rt.add_mcu(MCU(f"B{pair}", lines, rt.output_queue, clock=rt.clock))
+
+    results = []
+
+    def all_completed():
+        while not rt.output_queue.empty():
+            results.append(rt.output_queue.get())
+        return sum(1 for r in results if r['status'] == 'COMPLETED') == num_mcus
+
+    cpu_start = process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = rt.run(until=time_limit, stop_when=all_completed)
+    cpu = process_time() - cpu_start
+
+    lateness_ms = sorted(x * 1000 for x in rt.lateness)
+    return {
+        'mcus': num_mcus,
+        'completed': sum(1 for r in results if r['status'] == 'COMPLETED'),
+        'working': sum(1 for r in results if r['status'] == 'WORKING'),
+        'failed': sum(1 for r in results if r['status'] == 'FAILED'),
+        'elapsed': elapsed,
+        'cpu': cpu,
+        'lateness_p50': statistics.median(lateness_ms) if lateness_ms else 0.0,
+        'lateness_max': lateness_ms[-1] if lateness_ms else 0.0,
+        'violated': rt.tolerance_violated,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=1, help="Lines per MCU pair")
+    parser.add_argument("--max-mcus", type=int, default=1600)
+    parser.add_argument("--time-limit", type=float, default=30.0)
+    args = parser.parse_args()
+
+    print(f"{'mcus':>6}{'completed':>11}{'failed':>8}{'elapsed':>9}{'cpu':>8}{'late p50':>10}{'late max':>10}")
+    sustained = 0
+    num_mcus = 2
+    while num_mcus <= args.max_mcus:
+        r = run(num_mcus, args.lines, args.time_limit)
+        print(f"{r['mcus']:>6}{r['completed']:>11}{r['failed']:>8}{r['elapsed']:>8.1f}s{r['cpu']:>7.1f}s"
+              f"{r['lateness_p50']:>8.2f}ms{r['lateness_max']:>8.2f}ms", flush=True)
+        if r['violated'] or r['completed'] < num_mcus:
+            break
+        sustained = num_mcus
+        num_mcus *= 2
+
+    print(f"\nSustained {sustained} MCUs within TOLERANCE = {TOLERANCE} ms")
@@ -0,0 +1,58 @@
+"""Full-wiring discovery time, one line after another vs. all lines at once.
+
+Two MCUs share N lines. Runs in virtual time, so the numbers are protocol
+time, not host speed.
+
+    python -m benchmarks.concurrent_lines [--lines 4 16 64] [--runs 5]
+"""
+import argparse
+import contextlib
+import io
+import random
+import statistics
+from time import process_time
+
+from shared_lines import SharedLine
+from mcu import MCU
+from simulation import Simulation
+
+
+def discover(num_lines, concurrent, seed):
+    random.seed(seed)
+    sim = Simulation()
+    wiring = [(f"L{i + 1}", sim.add_line(SharedLine(sim.manager, name=f"L{i + 1}", clock=sim.clock)))
+              for i in range(num_lines)]
+    for name in ("A", "B"):
+        sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock, concurrent=concurrent))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(until=10000.0)
+        sim.close()
+
+    completed, working = [], 0
+    while not sim.output_queue.empty():
+        data = sim.output_queue.get()
+        if data['status'] == 'COMPLETED':
+            completed.append(data['timestamp'])
+        elif data['status'] == 'WORKING':
+            working += 1
+    return max(completed) if len(completed) == 2 else None, working / 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'lines':>6}{'mode':>12}{'discovery':>12}{'working':>10}{'cpu/run':>10}")
+    for num_lines in args.lines:
+        for concurrent in (False, True):
+            cpu_start = process_time()
+            results = [discover(num_lines, concurrent, seed) for seed in range(args.runs)]
+            cpu = (process_time() - cpu_start) / args.runs
+            times = [t for t, _ in results if t is not None]
+            mean_time = statistics.fmean(times) if times else float('nan')
+            working = statistics.fmean(w for _, w in results)
+            mode = "concurrent" if concurrent else "sequential"
+            print(f"{num_lines:>6}{mode:>12}{mean_time:>11.1f}s{working:>10.1f}{cpu * 1000:>8.0f}ms")
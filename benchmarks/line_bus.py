@@ -0,0 +1,71 @@
+"""State reads per second: Manager-proxied lines vs. the shared memory line bus.
+
+Run from the repository root:
+
+    python -m benchmarks.line_bus [--duration 1.0] [--readers 2]
+"""
+import argparse
+from multiprocessing import Manager, Process, Queue, set_start_method
+from time import perf_counter
+
+from shared_lines import SharedLine, OneWaySharedLine, UnreliableSharedLine
+from line_bus import SharedMemoryLineBus, ShmSharedLine, ShmOneWaySharedLine, ShmUnreliableSharedLine
+
+
+def _count_reads(line, duration):
+    reads = 0
+    end = perf_counter() + duration
+    while perf_counter() < end:
+        for _ in range(100):
+            line.state()
+        reads += 100
+    return reads
+
+
+def _reader(line, duration, results):
+    results.put(_count_reads(line, duration))
+
+
+def _reads_per_second(line, duration, readers):
+    """Read one line, held high, from `readers` processes at the same time."""
+    line.pull_high("bench")
+    results = Queue()
+    procs = [Process(target=_reader, args=(line, duration, results)) for _ in range(readers)]
+    for p in procs:
+        p.start()
+    total = sum(results.get() for _ in procs)
+    for p in procs:
+        p.join()
+    line.release("bench")
+    return total / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=1.0)
+    parser.add_argument("--readers", type=int, default=2)
+    args = parser.parse_args()
+
+    set_start_method("fork")
+    manager = Manager()
+    bus = SharedMemoryLineBus(manager, num_lines=8)
+
+    pairs = [
+        ("SharedLine", SharedLine(manager), ShmSharedLine(bus)),
+        ("OneWaySharedLine", OneWaySharedLine(manager, "bench"), ShmOneWaySharedLine(bus, "bench")),
+        ("UnreliableSharedLine", UnreliableSharedLine(manager, failure_rate=0.0), ShmUnreliableSharedLine(bus, failure_rate=0.0)),
+    ]
+
+    print(f"{'line':<24}{'manager reads/s':>18}{'shm reads/s':>18}{'speedup':>10}")
+    try:
+        for label, manager_line, shm_line in pairs:
+            manager_rate = _reads_per_second(manager_line, args.duration, args.readers)
+            shm_rate = _reads_per_second(shm_line, args.duration, args.readers)
+            print(f"{label:<24}{manager_rate:>18,.0f}{shm_rate:>18,.0f}{shm_rate / manager_rate:>9.1f}x")
+    finally:
+        for _, manager_line, shm_line in pairs:
+            for line in (manager_line, shm_line):
+                line.data_log.close()
+                line.data_log.unlink()  # Every trace is a shared memory segment of its own
+        bus.close()
+        bus.unlink()
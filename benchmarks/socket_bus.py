@@ -0,0 +1,158 @@
+"""Latency and throughput of the socket line bus for 1-256 client processes.
+
+Every client process drives its own line on one LineBusServer, alternating
+pull_high and release as fast as the server answers. Reported per client
+count: operations per second over all clients, the round trip of one
+operation (p50/p99) and how long an edge takes from pull_high until the
+server's push reaches a subscriber in the probe process. The same load on a
+Manager-proxied SharedLine per client is the baseline.
+
+Run from the repository root:
+
+    python -m benchmarks.socket_bus [--clients 1 4 16 64 256] [--duration 1.0] [--tcp]
+"""
+import argparse
+import os
+import tempfile
+from multiprocessing import Event, Manager, Process, Queue, set_start_method
+from time import perf_counter, sleep
+
+from shared_lines import SharedLine
+from socket_bus import LineBusServer, SocketLineBus, SocketSharedLine
+
+CLIENTS = [1, 4, 16, 64, 256]
+SAMPLES = 500  # Round trips each client reports for the percentiles
+EDGE_PROBES = 200
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1e6 if values else None
+
+
+def _client(make_line, ready, go, duration, results):
+    line = make_line()
+    ready.put(None)
+    go.wait()
+    ops = 0
+    times = []
+    end = perf_counter() + duration
+    while perf_counter() < end:
+        t0 = perf_counter()
+        line.pull_high("bench")
+        t1 = perf_counter()
+        line.release("bench")
+        ops += 2
+        if len(times) < SAMPLES * 4:
+            times.append(t1 - t0)
+    results.put((ops, times[::max(1, len(times) // SAMPLES)]))
+    line.data_log.unlink()
+
+
+def _edge_latency(bus, probes):
+    """pull_high/release on a line this process subscribed to, seconds until each pushed edge arrives"""
+    line = SocketSharedLine(bus, "probe")
+    arrived = []
+    line.subscribe(lambda line, state, timestamp: arrived.append(perf_counter()))
+    latencies = []
+    for _ in range(probes):
+        for drive in (line.pull_high, line.release):
+            count = len(arrived)
+            sent = perf_counter()
+            drive("probe")
+            while len(arrived) == count:
+                sleep(0)
+            latencies.append(arrived[-1] - sent)
+    line.data_log.unlink()
+    return latencies
+
+
+def _run_clients(make_line, clients, duration, probe=None):
+    ready, results, go = Queue(), Queue(), Event()
+    procs = [Process(target=_client, args=(make_line(i), ready, go, duration, results)) for i in range(clients)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.get()
+    start = perf_counter()
+    go.set()
+    edges = probe() if probe is not None else []
+    outcomes = [results.get() for _ in procs]
+    wall = max(duration, perf_counter() - start)
+    for p in procs:
+        p.join()
+    ops = sum(ops for ops, _ in outcomes)
+    times = [t for _, sample in outcomes for t in sample]
+    return ops / wall, times, edges
+
+
+def bench_socket(address, clients, duration):
+    server = LineBusServer(address)
+    server.start()
+    try:
+        bus = SocketLineBus(address)
+
+        def make_line(i):
+            return lambda: SocketSharedLine(SocketLineBus(address), f"C{i}")
+
+        rate, times, edges = _run_clients(make_line, clients, duration, probe=lambda: _edge_latency(bus, EDGE_PROBES))
+        bus.close()
+    finally:
+        server.stop()
+        server.join()
+    return {
+        'backend': 'socket',
+        'clients': clients,
+        'ops_per_s': rate,
+        'rtt_p50_us': _percentile(times, 0.5),
+        'rtt_p99_us': _percentile(times, 0.99),
+        'edge_p50_us': _percentile(edges, 0.5),
+        'edge_p99_us': _percentile(edges, 0.99),
+    }
+
+
+def bench_manager(manager, clients, duration):
+    lines = [SharedLine(manager, name=f"C{i}") for i in range(clients)]
+
+    def make_line(i):
+        return lambda: lines[i]
+
+    rate, times, _ = _run_clients(make_line, clients, duration)
+    return {
+        'backend': 'manager',
+        'clients': clients,
+        'ops_per_s': rate,
+        'rtt_p50_us': _percentile(times, 0.5),
+        'rtt_p99_us': _percentile(times, 0.99),
+    }
+
+
+def _us(value):
+    return f"{value:.0f}" if value is not None else "-"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=CLIENTS)
+    parser.add_argument("--duration", type=float, default=1.0, help="Seconds every client drives its line")
+    parser.add_argument("--tcp", action="store_true", help="Serve on 127.0.0.1 instead of a Unix socket")
+    parser.add_argument("--no-manager", action="store_true", help="Skip the Manager baseline")
+    args = parser.parse_args()
+
+    set_start_method("fork")
+    manager = Manager()
+    if args.tcp:
+        address = ("127.0.0.1", 7878)
+    else:
+        address = os.path.join(tempfile.mkdtemp(prefix="line-bus-"), "lines.sock")
+
+    print(f"{'backend':<9}{'clients':>8}{'ops/s':>11}{'rtt p50 us':>12}{'rtt p99 us':>12}"
+          f"{'edge p50 us':>13}{'edge p99 us':>13}")
+    for clients in args.clients:
+        backends = [lambda: bench_socket(address, clients, args.duration)]
+        if not args.no_manager:
+            backends.append(lambda: bench_manager(manager, clients, args.duration))
+        for run in backends:
+            r = run()
+            print(f"{r['backend']:<9}{r['clients']:>8}{r['ops_per_s']:>11.0f}{_us(r['rtt_p50_us']):>12}"
+                  f"{_us(r['rtt_p99_us']):>12}{_us(r.get('edge_p50_us')):>13}{_us(r.get('edge_p99_us')):>13}")
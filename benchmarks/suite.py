@@ -0,0 +1,493 @@
+"""Benchmark suite for the lines, the peripheral and full discovery, with JSON output.
+
+Sections:
+  line_ops     state()/pull_high()/release() calls per second for every line class
+  logic_loop   passes per second of the sequential FSM's INIT and MAYBE_RESPONDER wait loops
+  peripheral   edges the _peripheral process handles per second, its CPU per line and
+               the edges dropped because its pipe was full
+  pulse_width  measured minus requested pulse width (ms), see calibration.py
+  discovery    time until both of 2 MCUs report COMPLETED over 1-64 lines,
+               sequential, concurrent and coded (MCU(coded=True)), in
+               virtual time and in real time on the asyncio runtime
+  arbitration  discovery time, collided pulses and blacklisted lines of every
+               slot arbitration strategy (arbitration.py), in virtual time
+  startup      wall time of fresh interpreters importing the core, running
+               cli.py and, for comparison, loading the analytics libraries
+               every process imported before they became lazy
+  data_channel bits per second of the data channel (data_channel.py) over
+               1-16 verified lines in virtual time, against the raw bit rate
+
+Run from the repository root and compare the JSON of two runs:
+
+    python -m benchmarks.suite --output bench.json [--only line_ops discovery] [--quick]
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from multiprocessing import Manager, Process, Queue, cpu_count, set_start_method
+from time import perf_counter, process_time, sleep
+
+from shared_lines import SharedLine, OneWaySharedLine, UnreliableSharedLine
+from line_bus import SharedMemoryLineBus, ShmSharedLine, ShmOneWaySharedLine, ShmUnreliableSharedLine
+from mcu import MCU, DEFAULT_TIMING, TimingProfile
+from simulation import Simulation
+from async_runtime import AsyncRuntime
+from calibration import measure_width_errors, make_line, discard_line
+from arbitration import STRATEGIES
+from pulse_analyzer import analyze_lines
+from data_channel import DataChannel, FRAME_PAYLOAD
+from results import ResultsAggregator
+
+SECTIONS = ('line_ops', 'logic_loop', 'peripheral', 'pulse_width', 'discovery', 'arbitration', 'startup',
+            'data_channel')
+
+DISCOVERY_LINES = [1, 2, 4, 8, 16, 32, 64]
+DISCOVERY_MODES = {  # mode -> (concurrent, coded)
+    'sequential': (False, False),
+    'concurrent': (True, False),
+    'coded': (True, True),
+}
+REALTIME_LINES = [1, 4, 16]
+REALTIME_SCALE = 0.05  # Timing profile of the real-time discovery runs, relative to DEFAULT_TIMING
+PERIPHERAL_LINES = [1, 4, 16, 64]
+LOGIC_LINES = [1, 4, 16]
+ARBITRATION_LINES = [1, 4, 16]
+ARBITRATION_RUNS = 50
+STARTUP_RUNS = 10
+STARTUP_COMMANDS = {  # name -> arguments of a fresh interpreter, run from the repository root
+    'python': ["-c", "pass"],
+    'core_import': ["-c", "import shared_lines, mcu, pinger, simulation"],
+    'cli_help': ["cli.py", "--help"],
+    'cli_discover': ["cli.py", "discover", "--lines", "1"],
+    # What every process paid on top of the core while shared_lines imported these at load
+    'analytics_import': ["-c", "import numpy, pandas, matplotlib.pyplot"],
+}
+DATA_LINES = [1, 2, 4, 8, 16]
+DATA_FRAMES = 4  # Frames per line in the message, so every line stays busy
+
+
+def _rate(call, duration):
+    calls = 0
+    end = perf_counter() + duration
+    start = perf_counter()
+    while perf_counter() < end:
+        for _ in range(50):
+            call()
+        calls += 50
+    return calls / (perf_counter() - start)
+
+
+def _pull_release_rates(line, duration):
+    # Alternate so every call changes the line, time both halves separately
+    pull = release = 0.0
+    pairs = 0
+    end = perf_counter() + duration
+    while perf_counter() < end:
+        t0 = perf_counter()
+        line.pull_high("bench")
+        t1 = perf_counter()
+        line.release("bench")
+        pull += t1 - t0
+        release += perf_counter() - t1
+        pairs += 1
+    return pairs / pull, pairs / release
+
+
+def bench_line_ops(manager, duration):
+    bus = SharedMemoryLineBus(manager, num_lines=8)
+    lines = [
+        ("SharedLine", SharedLine(manager)),
+        ("OneWaySharedLine", OneWaySharedLine(manager, "bench")),
+        ("UnreliableSharedLine", UnreliableSharedLine(manager, failure_rate=0.0)),
+        ("ShmSharedLine", ShmSharedLine(bus)),
+        ("ShmOneWaySharedLine", ShmOneWaySharedLine(bus, "bench")),
+        ("ShmUnreliableSharedLine", ShmUnreliableSharedLine(bus, failure_rate=0.0)),
+    ]
+    results = []
+    try:
+        for name, line in lines:
+            pull, release = _pull_release_rates(line, duration)
+            results.append({
+                'line': name,
+                'state_per_s': _rate(line.state, duration),
+                'pull_high_per_s': pull,
+                'release_per_s': release,
+            })
+    finally:
+        for _, line in lines:
+            line.data_log.unlink()
+        bus.close()
+        bus.unlink()
+    return results
+
+
+def _logic_rate(mcu, duration):
+    # Every next() is one pass of the wait loop the FSM is in, the clock never reaches its deadline
+    routine = mcu._logic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        next(routine)
+        rate = _rate(lambda: next(routine), duration)
+        routine.close()
+    return rate
+
+
+def bench_logic_loop(manager, duration, line_counts):
+    """FSM passes per second on idle shm lines, so the MCU's own state dominates"""
+    timing = TimingProfile(time_slots_ms=[1e9], timeout_responder=1e9)
+    results = []
+    for num_lines in line_counts:
+        for loop in ('INIT', 'MAYBE_RESPONDER'):
+            bus = SharedMemoryLineBus(manager, num_lines=num_lines)
+            lines = [ShmSharedLine(bus, name=f"L{i + 1}") for i in range(num_lines)]
+            mcu = MCU("P", [(line.name, line) for line in lines], timing=timing)
+            if loop == 'MAYBE_RESPONDER':
+                lines[0].pull_high("bench")  # Seen during the slot wait, the FSM then waits for a SYN
+            try:
+                rate = _logic_rate(mcu, duration)
+            finally:
+                for line in lines:
+                    line.data_log.unlink()
+                bus.close()
+                bus.unlink()
+            results.append({'lines': num_lines, 'loop': loop, 'passes_per_s': rate})
+    return results
+
+
+def _peripheral_worker(mcu, results):
+    edges = 0
+    on_edge = mcu._on_edge
+
+    def counted(*event):
+        nonlocal edges
+        edges += 1
+        on_edge(*event)
+
+    mcu._on_edge = counted
+    cpu_start = process_time()
+    mcu._peripheral()
+    results.put((edges, process_time() - cpu_start))
+
+
+def _run_peripheral(mcu, lines, duration, toggle):
+    results = Queue()
+    worker = Process(target=_peripheral_worker, args=(mcu, results))
+    worker.start()
+    sent = 0
+    start = perf_counter()
+    end = start + duration
+    while perf_counter() < end:
+        if toggle:
+            for line in lines:
+                line.pull_high("bench")
+                line.release("bench")
+            sent += 2 * len(lines)
+        else:
+            sleep(0.01)
+    # Let the peripheral drain the pipe, edges still in it at stop would count as lost
+    drain_end = perf_counter() + 5.0
+    while not mcu.edges.empty() and perf_counter() < drain_end:
+        sleep(0.001)
+    mcu.stop_event.set()
+    handled, cpu = results.get()
+    wall = perf_counter() - start
+    worker.join()
+    return sent, handled, mcu.edges.dropped, cpu, wall
+
+
+def bench_peripheral(manager, duration, line_counts):
+    """Edge throughput of one MCU peripheral, idle and while this process toggles every line"""
+    results = []
+    for num_lines in line_counts:
+        for toggle in (False, True):
+            bus = SharedMemoryLineBus(manager, num_lines=num_lines)
+            lines = [ShmSharedLine(bus, name=f"L{i + 1}") for i in range(num_lines)]
+            mcu = MCU("P", [(line.name, line) for line in lines])
+            try:
+                sent, handled, dropped, cpu, wall = _run_peripheral(mcu, lines, duration, toggle)
+            finally:
+                for line in lines:
+                    line.data_log.unlink()
+                bus.close()
+                bus.unlink()
+            results.append({
+                'lines': num_lines,
+                'load': 'toggling' if toggle else 'idle',
+                'edges_sent': sent,
+                'edges_handled': handled,
+                'edges_dropped': dropped,
+                'edges_per_s': handled / wall,
+                'cpu_fraction': cpu / wall,
+                'cpu_fraction_per_line': cpu / wall / num_lines,
+                'cpu_us_per_edge': cpu / handled * 1e6 if handled else None,
+            })
+    return results
+
+
+def _summary(values):
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values),
+        'p50': values[len(values) // 2],
+        'p99': values[int(0.99 * (len(values) - 1))],
+        'max_abs': max(abs(v) for v in values),
+    }
+
+
+def bench_pulse_width(manager, pulses):
+    results = []
+    for backend in ('manager', 'shm'):
+        line = make_line(backend, manager)
+        try:
+            errors = measure_width_errors(line, pulses=pulses)
+        finally:
+            discard_line(line)
+        results.append({'backend': backend, 'error_ms': _summary(errors)})
+    return results
+
+
+def _completed_at(messages):
+    completed = [m['timestamp'] for m in messages if m['status'] == 'COMPLETED']
+    return max(completed) if len(completed) == 2 else None
+
+
+def discover_virtual(num_lines, concurrent, seed, coded=False):
+    random.seed(seed)
+    sim = Simulation()
+    wiring = [(f"L{i + 1}", sim.add_line(SharedLine(sim.manager, name=f"L{i + 1}", clock=sim.clock)))
+              for i in range(num_lines)]
+    for name in ("A", "B"):
+        sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock, concurrent=concurrent,
+                        coded=coded))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(until=10000.0)
+        sim.close()
+    messages = []
+    while not sim.output_queue.empty():
+        messages.append(sim.output_queue.get())
+    return _completed_at(messages)
+
+
+def discover_realtime(num_lines, concurrent, seed, timing, time_limit, coded=False):
+    random.seed(seed)
+    rt = AsyncRuntime()
+    wiring = [(f"L{i + 1}", SharedLine(rt.manager, name=f"L{i + 1}", clock=rt.clock)) for i in range(num_lines)]
+    for name in ("A", "B"):
+        rt.add_mcu(MCU(name, wiring, rt.output_queue, clock=rt.clock, concurrent=concurrent, timing=timing,
+                       coded=coded))
+
+    messages = []
+
+    def both_completed():
+        while not rt.output_queue.empty():
+            messages.append(rt.output_queue.get())
+        return _completed_at(messages) is not None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = rt.run(until=time_limit, stop_when=both_completed)
+    return elapsed if both_completed() else None
+
+
+def arbitrate_virtual(num_lines, strategy, seed):
+    """Discovery time, collided and total pulses and blacklisted lines of one run"""
+    random.seed(seed)
+    sim = Simulation()
+    lines = [sim.add_line(SharedLine(sim.manager, name=f"L{i + 1}", clock=sim.clock)) for i in range(num_lines)]
+    wiring = [(line.name, line) for line in lines]
+    # Fresh names per run, IdSlots would otherwise measure a single pair of names
+    for name in (f"A{seed}", f"B{seed}"):
+        sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock,
+                        arbitration=STRATEGIES[strategy]()))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(until=10000.0)
+        sim.close()
+    messages = []
+    while not sim.output_queue.empty():
+        messages.append(sim.output_queue.get())
+    report = analyze_lines(lines)
+    blacklisted = sum(len(m['black_list']) for m in messages if m['status'] == 'COMPLETED')
+    return (_completed_at(messages), sum(r['collisions'] for r in report.values()),
+            sum(r['pulses'] for r in report.values()), blacklisted)
+
+
+def bench_arbitration(line_counts, runs):
+    results = []
+    for num_lines in line_counts:
+        for strategy in STRATEGIES:
+            outcomes = [arbitrate_virtual(num_lines, strategy, seed) for seed in range(runs)]
+            done = [time for time, _, _, _ in outcomes if time is not None]
+            pulses = sum(outcome[2] for outcome in outcomes)
+            results.append({
+                'lines': num_lines,
+                'strategy': strategy,
+                'runs': runs,
+                'completed': len(done),
+                'time_s': statistics.fmean(done) if done else None,
+                'collision_rate': sum(outcome[1] for outcome in outcomes) / pulses if pulses else 0.0,
+                'blacklist_rate': sum(outcome[3] for outcome in outcomes) / (2 * num_lines * runs),
+            })
+    return results
+
+
+def bench_discovery(line_counts, realtime_counts, runs, realtime_scale):
+    results = []
+    for num_lines in line_counts:
+        for mode, (concurrent, coded) in DISCOVERY_MODES.items():
+            cpu_start = process_time()
+            times = [discover_virtual(num_lines, concurrent, seed, coded) for seed in range(runs)]
+            cpu = (process_time() - cpu_start) / runs
+            done = [t for t in times if t is not None]
+            results.append({
+                'lines': num_lines,
+                'mode': mode,
+                'clock': 'virtual',
+                'runs': runs,
+                'completed': len(done),
+                'time_s': statistics.fmean(done) if done else None,
+                'cpu_s': cpu,
+            })
+
+    timing = DEFAULT_TIMING.scaled(realtime_scale)
+    for num_lines in realtime_counts:
+        for mode, (concurrent, coded) in DISCOVERY_MODES.items():
+            times = [discover_realtime(num_lines, concurrent, seed, timing, time_limit=60.0, coded=coded)
+                     for seed in range(runs)]
+            done = [t for t in times if t is not None]
+            results.append({
+                'lines': num_lines,
+                'mode': mode,
+                'clock': 'realtime',
+                'timing_scale': realtime_scale,
+                'runs': runs,
+                'completed': len(done),
+                'time_s': statistics.fmean(done) if done else None,
+            })
+    return results
+
+
+def bench_startup(runs):
+    """Median wall time of fresh interpreters, the first run of each is a discarded warm-up"""
+    results = []
+    for name, arguments in STARTUP_COMMANDS.items():
+        times = []
+        for _ in range(runs + 1):
+            start = perf_counter()
+            subprocess.run([sys.executable, *arguments], check=True, stdout=subprocess.DEVNULL)
+            times.append(perf_counter() - start)
+        times = sorted(times[1:])
+        results.append({
+            'command': name,
+            'runs': runs,
+            'median_ms': times[len(times) // 2] * 1000,
+            'min_ms': times[0] * 1000,
+        })
+    return results
+
+
+def send_virtual(num_lines, frames_per_line, seed):
+    """Discovery, then A sends B one message of `frames_per_line` frames per line, returns the report"""
+    random.seed(seed)
+    sim = Simulation()
+    wiring = [(f"L{i + 1}", sim.add_line(SharedLine(sim.manager, name=f"L{i + 1}", clock=sim.clock)))
+              for i in range(num_lines)]
+    mcus = {name: sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock, concurrent=True,
+                                  data_channel=DataChannel(seed=seed)))
+            for name in ("A", "B")}
+    results = ResultsAggregator(sim.output_queue, ["A", "B"], clock=sim.clock)
+    message = random.randbytes(num_lines * frames_per_line * FRAME_PAYLOAD)
+
+    def delivered():
+        results.poll()
+        return results.counts['DELIVERED'] > 0
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(until=10000.0, stop_when=results.poll)
+        start = sim.now
+        mcus["A"].send(message)
+        sim.run(until=start + 100000.0, stop_when=delivered)
+        sim.close()
+    elapsed = sim.now - start
+    received = results.mcus["B"]['received'] == [message]
+    return {
+        'lines': num_lines,
+        'bytes': len(message),
+        'seconds': elapsed if received else None,
+        'bits_per_s': 8 * len(message) / elapsed if received else None,
+        'bits_per_s_per_line': 8 * len(message) / elapsed / num_lines if received else None,
+        'raw_bits_per_s_per_line': 1 / DEFAULT_TIMING.bit_time,
+    }
+
+
+def bench_data_channel(line_counts, frames_per_line):
+    """Payload bits per second, the raw rate leaves out framing, acks and the silence between frames"""
+    return [send_virtual(num_lines, frames_per_line, seed=0) for num_lines in line_counts]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--duration", type=float, default=0.5, help="Seconds per rate measurement")
+    parser.add_argument("--runs", type=int, default=3, help="Discovery runs per line count")
+    parser.add_argument("--pulses", type=int, default=50, help="Pulses per width for pulse_width")
+    parser.add_argument("--realtime-scale", type=float, default=REALTIME_SCALE)
+    parser.add_argument("--quick", action="store_true", help="Fewer line counts and shorter measurements")
+    parser.add_argument("--output", default=None, help="JSON file, stdout if omitted")
+    args = parser.parse_args()
+
+    set_start_method("fork")
+    manager = Manager()
+    discovery_lines, realtime_lines, peripheral_lines = DISCOVERY_LINES, REALTIME_LINES, PERIPHERAL_LINES
+    logic_lines = LOGIC_LINES
+    arbitration_lines, arbitration_runs = ARBITRATION_LINES, ARBITRATION_RUNS
+    startup_runs = STARTUP_RUNS
+    data_lines, data_frames = DATA_LINES, DATA_FRAMES
+    if args.quick:
+        args.duration, args.runs, args.pulses = 0.1, 1, 10
+        discovery_lines, realtime_lines, peripheral_lines = [1, 4, 16], [1, 4], [1, 16]
+        logic_lines = [1, 4]
+        arbitration_lines, arbitration_runs = [1, 4], 10
+        startup_runs = 3
+        data_lines, data_frames = [1, 4], 2
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': cpu_count(),
+        },
+    }
+    if 'line_ops' in args.only:
+        report['line_ops'] = bench_line_ops(manager, args.duration)
+    if 'logic_loop' in args.only:
+        report['logic_loop'] = bench_logic_loop(manager, args.duration, logic_lines)
+    if 'peripheral' in args.only:
+        report['peripheral'] = bench_peripheral(manager, args.duration, peripheral_lines)
+    if 'pulse_width' in args.only:
+        report['pulse_width'] = bench_pulse_width(manager, args.pulses)
+    if 'discovery' in args.only:
+        report['discovery'] = bench_discovery(discovery_lines, realtime_lines, args.runs, args.realtime_scale)
+    if 'arbitration' in args.only:
+        report['arbitration'] = bench_arbitration(arbitration_lines, arbitration_runs)
+    if 'startup' in args.only:
+        report['startup'] = bench_startup(startup_runs)
+    if 'data_channel' in args.only:
+        report['data_channel'] = bench_data_channel(data_lines, data_frames)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"{', '.join(s for s in SECTIONS if s in report)} -> {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
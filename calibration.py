@@ -0,0 +1,170 @@
+"""Derive a faster TimingProfile from the pulse-width jitter of a line backend.
+
+A second process pulses a line with known widths. The widths the edge
+subscribers see differ from the requested ones by scheduler wake-up lag and
+the cost of pull_high/release on that backend. The tolerance becomes a
+safety multiple of the worst error and every other duration is scaled with
+it, keeping the ratios of the default protocol (SYN = 5, SYN_ACK = 10 and
+ACK = 15 tolerances).
+
+    python calibration.py --backend shm --verify --output timing.json
+"""
+import argparse
+import json
+import statistics
+from functools import partial
+from multiprocessing import Manager, Process, Queue, set_start_method
+from time import perf_counter, sleep
+
+from timebase import Sleep, run_realtime
+from edges import EdgeChannel
+from mcu import MCU, DEFAULT_TIMING
+
+CALIBRATION_WIDTHS_MS = [1.0, 2.0, 5.0, 10.0]
+PULSES_PER_WIDTH = 50
+PULSE_GAP_MS = 2.0
+
+SAFETY_FACTOR = 4.0  # Tolerance as a multiple of the worst width error
+MIN_TOLERANCE_MS = 2.0  # Never trust the host below this
+
+BACKENDS = ('manager', 'shm')
+
+
+def _forward(channel, line, state, timestamp):
+    channel.put((0, state, timestamp))
+
+
+def _pulse_train(line, widths_ms, pulses, gap_ms):
+    try:
+        for width in widths_ms:
+            for _ in range(pulses):
+                line.pull_high("calibration")
+                yield Sleep(width / 1000.0)
+                line.release("calibration")
+                yield Sleep(gap_ms / 1000.0)
+    finally:
+        line.release("calibration")
+
+
+def measure_width_errors(line, widths_ms=CALIBRATION_WIDTHS_MS, pulses=PULSES_PER_WIDTH, gap_ms=PULSE_GAP_MS):
+    """Pulse `line` from another process, returns the measured minus the requested width (ms) per pulse"""
+    channel = EdgeChannel()
+    line.subscribe(partial(_forward, channel))
+    pulser = Process(target=run_realtime, args=(_pulse_train(line, widths_ms, pulses, gap_ms),))
+    pulser.start()
+
+    errors = []
+    expected = [width for width in widths_ms for _ in range(pulses)]
+    rising = None
+    while len(errors) < len(expected):
+        edge = channel.get(timeout=5.0)
+        if edge is None:
+            break
+        _, state, timestamp = edge
+        if state:
+            rising = timestamp
+        elif rising is not None:
+            errors.append((timestamp - rising) * 1000 - expected[len(errors)])
+            rising = None
+
+    pulser.join()
+    line._subscribers.pop()
+    if channel.dropped:
+        # Widths measured across a lost edge pair the wrong rise and fall
+        raise RuntimeError(f"{channel.dropped} edges dropped, the width errors are not usable")
+    return errors
+
+
+def derive_profile(errors, safety=SAFETY_FACTOR, min_tolerance=MIN_TOLERANCE_MS, base=DEFAULT_TIMING):
+    """Scale `base` so its tolerance covers the measured errors, never beyond the base itself"""
+    worst = max((abs(e) for e in errors), default=base.tolerance)
+    tolerance = max(min_tolerance, safety * worst)
+    return base.scaled(min(1.0, tolerance / base.tolerance))
+
+
+def make_line(backend, manager):
+    if backend == 'shm':
+        from line_bus import SharedMemoryLineBus, ShmSharedLine
+        return ShmSharedLine(SharedMemoryLineBus(manager, num_lines=1), name="calibration")
+    from shared_lines import SharedLine
+    return SharedLine(manager, name="calibration")
+
+
+def discard_line(line):
+    """Free the trace (and line bus) of a line from make_line()"""
+    line.data_log.unlink()
+    bus = getattr(line, '_bus', None)
+    if bus is not None:
+        bus.close()
+        bus.unlink()
+
+
+def calibrate(backend='manager', safety=SAFETY_FACTOR, min_tolerance=MIN_TOLERANCE_MS, **kwargs):
+    """Measure the width errors of `backend` and return (profile, errors)"""
+    manager = Manager()
+    line = make_line(backend, manager)
+    try:
+        errors = measure_width_errors(line, **kwargs)
+    finally:
+        discard_line(line)
+    return derive_profile(errors, safety, min_tolerance), errors
+
+
+def verify(profile, backend='manager', time_limit=30.0):
+    """Run a real-time handshake between two MCUs on one line, returns seconds to both COMPLETED or None"""
+    manager = Manager()
+    output_queue = Queue()
+    line = make_line(backend, manager)
+    mcus = [MCU(name, [("L1", line)], output_queue, timing=profile) for name in ("A", "B")]
+
+    start = perf_counter()
+    for mcu in mcus:
+        mcu.start()
+    completed = {}
+    try:
+        while len(completed) < len(mcus) and perf_counter() - start < time_limit:
+            if output_queue.empty():
+                sleep(0.001)
+                continue
+            data = output_queue.get()
+            if data['status'] == 'COMPLETED':
+                completed[data['mcu_name']] = (perf_counter() - start, [pd['name'] for pd in data['white_list']])
+    finally:
+        for mcu in mcus:
+            mcu.stop()
+        for mcu in mcus:
+            mcu.join()
+        discard_line(line)
+
+    if len(completed) < len(mcus) or not any(white_list for _, white_list in completed.values()):
+        return None
+    return max(elapsed for elapsed, _ in completed.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default='manager')
+    parser.add_argument("--pulses", type=int, default=PULSES_PER_WIDTH)
+    parser.add_argument("--safety", type=float, default=SAFETY_FACTOR)
+    parser.add_argument("--min-tolerance", type=float, default=MIN_TOLERANCE_MS)
+    parser.add_argument("--verify", action="store_true", help="Run a handshake with the default and the derived profile")
+    parser.add_argument("--output", default=None, help="Write the derived profile as JSON")
+    args = parser.parse_args()
+
+    set_start_method("fork")
+    profile, errors = calibrate(args.backend, args.safety, args.min_tolerance, pulses=args.pulses)
+
+    errors.sort()
+    print(f"{args.backend}: {len(errors)} pulses, width error mean {statistics.fmean(errors):.3f} ms, "
+          f"p99 {errors[int(0.99 * (len(errors) - 1))]:.3f} ms, max {max(errors, key=abs):.3f} ms")
+    print(f"Derived: {profile} ({DEFAULT_TIMING.tolerance / profile.tolerance:.1f}x faster)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(profile.to_dict(), f, indent=2)
+        print(f"Profile -> {args.output}")
+
+    if args.verify:
+        for name, timing in (("default", DEFAULT_TIMING), ("derived", profile)):
+            elapsed = verify(timing, args.backend)
+            print(f"{name:>8}: " + ("handshake failed" if elapsed is None else f"COMPLETED after {elapsed:.3f} s"))
@@ -0,0 +1,88 @@
+"""Command line entry point for every tool of the repository.
+
+    python cli.py discover --lines 4 [--concurrent] [--coded] [--seed 1]
+    python cli.py sweep --repetitions 20
+    python cli.py fuzz --examples 2000
+    python cli.py --help
+
+A command imports its module only once it is dispatched, so `--help` and
+the core commands start without NumPy, pandas or Matplotlib (see
+shared_lines.py). The tool commands hand the rest of the command line to
+the module's own argument parser, `python cli.py sweep --help` shows it.
+"""
+import argparse
+import runpy
+import sys
+
+TOOLS = {  # command -> (module run as __main__, help)
+    'run': ('main', "real-time demo of main.py with plots"),
+    'sweep': ('sweep', "parameter sweep in virtual time"),
+    'fuzz': ('fuzz', "property-based fuzzing of the handshake FSM"),
+    'analyze': ('pulse_analyzer', "pulse analysis of a soak run or a synthetic trace"),
+    'calibrate': ('calibration', "derive a TimingProfile from measured pulse widths"),
+    'events': ('event_log', "merge and print the binary event logs of a run"),
+    'bench': ('benchmarks.suite', "benchmark suite with JSON output"),
+    'serve': ('socket_bus', "line bus server for MCUs in other processes or on other hosts"),
+}
+
+
+def discover(args):
+    """Two MCUs over `args.lines` shared lines in virtual time, prints the results table"""
+    import contextlib
+    import io
+    import random
+    from shared_lines import SharedLine
+    from mcu import MCU
+    from event_log import ConsoleEventLog
+    from results import ResultsAggregator
+    from simulation import Simulation
+
+    random.seed(args.seed)
+    sim = Simulation()
+    wiring = [(f"L{i + 1}", sim.add_line(SharedLine(sim.manager, name=f"L{i + 1}", clock=sim.clock)))
+              for i in range(args.lines)]
+    for name in ("A", "B"):
+        sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock, concurrent=args.concurrent,
+                        coded=args.coded, event_log=ConsoleEventLog() if args.verbose else None))
+
+    results = ResultsAggregator(sim.output_queue, ["A", "B"], clock=sim.clock)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        sim.run(until=args.until, stop_when=results.poll)
+        results.poll()
+        sim.close()
+    print(results.format_summary())
+    return 0 if results.done else 1
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Multi-line 3-way handshake tools")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    discovery = commands.add_parser('discover', help="discovery of two MCUs in virtual time")
+    discovery.add_argument("--lines", type=int, default=4)
+    discovery.add_argument("--concurrent", action="store_true", help="Test all lines at once")
+    discovery.add_argument("--coded", action="store_true", help="Map the lines with binary-coded rounds first")
+    discovery.add_argument("--seed", type=int, default=0)
+    discovery.add_argument("--until", type=float, default=1000.0, help="Virtual seconds before giving up")
+    discovery.add_argument("--verbose", action="store_true", help="Show the MCUs' own output")
+    discovery.set_defaults(handler=discover)
+
+    for command, (_, help_) in TOOLS.items():
+        commands.add_parser(command, help=help_, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in TOOLS:
+        module, _ = TOOLS[argv[0]]
+        sys.argv = [sys.argv[0], *argv[1:]]  # run_module puts the module path first
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+        return 0
+    args = _parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,245 @@
+"""Application data over the lines an MCU verified.
+
+Once the handshake on a line succeeded, MCU(..., data_channel=DataChannel())
+uses the line to carry data. A bit is one pulse, data_zero_duration wide for
+0 and data_one_duration wide for 1 (TimingProfile), each followed by
+data_gap_duration low. The MCU's edge peripheral classifies these pulses
+like the handshake pulses, as DATA0 and DATA1.
+
+Messages passed to MCU.send() are cut into frames, and every working line
+takes the next frame as soon as it is free, so the bandwidth of the lines
+adds up:
+
+    data frame   flags, sequence number (16 bit), length, payload, CRC-16
+    ack frame    flags, sequence number, CRC-16
+
+A line carries one frame at a time. The receiver answers every intact frame
+with an ack frame on the same line, a frame whose ack does not come in time
+goes back to the queue and out again on the next free line. The receiver
+puts frames back in sequence order, drops duplicates and hands every
+complete message to the output queue.
+
+Both MCUs may send on a line. A side waits one frame gap of silence before
+an ack and two plus a random number of bit times before a data frame, so an
+ack always gets the line first and two data frames rarely start together.
+"""
+import binascii
+import random
+import struct
+from collections import deque
+
+FRAME_HEADER = struct.Struct('>BHB')  # Flags, sequence number, payload length
+ACK_HEADER = struct.Struct('>BH')  # Flags, sequence number
+CRC = struct.Struct('>H')
+
+FLAG_ACK = 0x80
+FLAG_LAST = 0x40  # Last frame of a message
+
+FRAME_PAYLOAD = 32  # Message bytes per frame
+MAX_RETRIES = 8  # Frames in a row without an ack before a line stops carrying data
+BACKOFF_BITS = 16  # Random extra silence before a data frame, in bit times
+SEQUENCE_SPACE = 1 << 16
+
+ACK_BITS = 8 * (ACK_HEADER.size + CRC.size)
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE"""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def to_bits(data):
+    """Bits of `data`, most significant bit of every byte first"""
+    return [byte >> shift & 1 for byte in data for shift in range(7, -1, -1)]
+
+
+def encode_data(sequence, payload, last):
+    frame = FRAME_HEADER.pack(FLAG_LAST if last else 0, sequence, len(payload)) + payload
+    return to_bits(frame + CRC.pack(crc16(frame)))
+
+
+def encode_ack(sequence):
+    frame = ACK_HEADER.pack(FLAG_ACK, sequence)
+    return to_bits(frame + CRC.pack(crc16(frame)))
+
+
+class FrameDecoder:
+    """Collects the bits of one line into frames.
+
+    A pulse that starts more than `frame_gap` seconds after the previous one
+    ended starts a new frame, the partial frame before it is dropped. The
+    header tells how long a frame is, decode() returns it once complete.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frame = bytearray()
+        self.byte = 0
+        self.count = 0
+        self.last_fall = None
+
+    def _length(self):
+        if not self.frame:
+            return None
+        if self.frame[0] & FLAG_ACK:
+            return ACK_HEADER.size + CRC.size
+        if len(self.frame) < FRAME_HEADER.size:
+            return None
+        return FRAME_HEADER.size + self.frame[3] + CRC.size
+
+    def decode(self, bit, rise, fall, frame_gap):
+        """Add one bit, returns the frame's bytes if this bit completed it"""
+        if self.last_fall is not None and rise - self.last_fall > frame_gap:
+            self.reset()
+        self.last_fall = fall
+        self.byte = self.byte << 1 | bit
+        self.count += 1
+        if self.count < 8:
+            return None
+        self.frame.append(self.byte)
+        self.byte = self.count = 0
+        length = self._length()
+        if length is None or len(self.frame) < length:
+            return None
+        frame = bytes(self.frame)
+        self.reset()
+        return frame
+
+
+class DataChannel:
+    """Framing, acknowledgement and reassembly state of one MCU, kept in its logic process.
+
+    Messages are numbered in the order they were queued, DELIVERED reports
+    carry that number.
+    """
+    def __init__(self, frame_payload=FRAME_PAYLOAD, max_retries=MAX_RETRIES, backoff_bits=BACKOFF_BITS, seed=None):
+        if not 0 < frame_payload < 256:
+            raise ValueError(f"frame_payload must be 1-255 bytes, not {frame_payload}")
+        self.frame_payload = frame_payload
+        self.max_retries = max_retries
+        self.backoff_bits = backoff_bits
+        if seed is None:
+            seed = random.getrandbits(64)  # Follows random.seed(), like the fault schedules
+        self._rng = random.Random(seed)
+
+        # Sending
+        self.frames = {}  # Sequence number -> (message, bits) until acknowledged
+        self.pending = deque()  # Sequence numbers waiting for a free line
+        self.remaining = {}  # Message -> frames not acknowledged yet
+        self.sizes = {}  # Message -> bytes
+        self.next_sequence = 0
+        self.messages = 0
+
+        # Receiving
+        self.decoders = {}  # Line name -> FrameDecoder
+        self.acks = {}  # Line name -> sequence numbers to acknowledge on it
+        self.expected = 0  # Next sequence number to hand out
+        self.reorder = {}  # Sequence number -> (flags, payload) received ahead of `expected`
+        self.assembling = bytearray()
+
+        # Per line
+        self.own = {}  # Line name -> (start, end) of our latest frames, their echo is not data
+        self.heard = {}  # Line name -> when the last pulse of the peer ended
+        self.retries = {}
+        self.down = set()
+
+    def queue(self, data):
+        """Cut a message into frames, returns its number"""
+        message = self.messages
+        self.messages += 1
+        chunks = [data[i:i + self.frame_payload] for i in range(0, len(data), self.frame_payload)] or [b'']
+        self.remaining[message] = len(chunks)
+        self.sizes[message] = len(data)
+        for i, chunk in enumerate(chunks):
+            sequence = self.next_sequence
+            self.next_sequence = (sequence + 1) % SEQUENCE_SPACE
+            self.frames[sequence] = (message, encode_data(sequence, chunk, i == len(chunks) - 1))
+            self.pending.append(sequence)
+        return message
+
+    def next_frame(self):
+        """(sequence number, bits) of the next frame waiting for a line, None if there is none"""
+        while self.pending:
+            sequence = self.pending.popleft()
+            if sequence in self.frames:  # Skips frames whose late ack came after a retry was queued
+                return sequence, self.frames[sequence][1]
+        return None
+
+    def lost(self, line_name, sequence):
+        """No ack came for `sequence` on this line, returns False once the line should stop"""
+        if sequence in self.frames:
+            self.pending.appendleft(sequence)
+        self.retries[line_name] = self.retries.get(line_name, 0) + 1
+        if self.retries[line_name] >= self.max_retries:
+            self.down.add(line_name)
+            return False
+        return True
+
+    def acknowledged(self, sequence):
+        return sequence not in self.frames
+
+    def next_ack(self, line_name):
+        acks = self.acks.get(line_name)
+        return acks.popleft() if acks else None
+
+    def backoff(self, bit_time):
+        return self._rng.randrange(self.backoff_bits + 1) * bit_time
+
+    def sending(self, line_name, start, end=float('inf')):
+        windows = self.own.setdefault(line_name, deque(maxlen=4))
+        if windows and windows[-1][0] == start:
+            windows.pop()
+        windows.append((start, end))
+
+    def quiet_since(self, line_name):
+        """When this line was last driven by either side"""
+        windows = self.own.get(line_name)
+        return max(self.heard.get(line_name, 0.0), windows[-1][1] if windows else 0.0)
+
+    def on_bit(self, line_name, bit, rise, fall, frame_gap):
+        """Decode one pulse of the line, returns ('DATA', message) and ('DELIVERED', number, bytes) reports"""
+        for start, end in self.own.get(line_name, ()):
+            if start <= rise <= end:
+                return []  # Our own pulse
+        self.heard[line_name] = fall
+        decoder = self.decoders.get(line_name)
+        if decoder is None:
+            decoder = self.decoders[line_name] = FrameDecoder()
+        frame = decoder.decode(bit, rise, fall, frame_gap)
+        if frame is None or crc16(frame[:-CRC.size]) != CRC.unpack(frame[-CRC.size:])[0]:
+            return []
+
+        flags, sequence = ACK_HEADER.unpack_from(frame)
+        if flags & FLAG_ACK:
+            return self._on_ack(line_name, sequence)
+        self.acks.setdefault(line_name, deque()).append(sequence)
+        return self._on_data(sequence, flags, frame[FRAME_HEADER.size:-CRC.size])
+
+    def _on_ack(self, line_name, sequence):
+        self.retries[line_name] = 0
+        frame = self.frames.pop(sequence, None)
+        if frame is None:
+            return []  # Duplicate ack
+        message = frame[0]
+        self.remaining[message] -= 1
+        if self.remaining[message]:
+            return []
+        del self.remaining[message]
+        return [('DELIVERED', message, self.sizes.pop(message))]
+
+    def _on_data(self, sequence, flags, payload):
+        ahead = (sequence - self.expected) % SEQUENCE_SPACE
+        if ahead >= SEQUENCE_SPACE // 2 or sequence in self.reorder:
+            return []  # Retransmission of a frame we already have, acknowledged again above
+        self.reorder[sequence] = (flags, payload)
+
+        reports = []
+        while self.expected in self.reorder:
+            flags, payload = self.reorder.pop(self.expected)
+            self.expected = (self.expected + 1) % SEQUENCE_SPACE
+            self.assembling += payload
+            if flags & FLAG_LAST:
+                reports.append(('DATA', bytes(self.assembling)))
+                self.assembling.clear()
+        return reports
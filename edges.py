@@ -0,0 +1,47 @@
+import os
+import struct
+from multiprocessing import Pipe, Value
+
+# line index, new state, source-side timestamp (perf_counter seconds)
+EDGE_RECORD = struct.Struct('<HBd')
+
+
+class EdgeChannel:
+    """Edge events of several lines, delivered to one subscriber process.
+
+    Any process that pulls or releases a line writes a fixed-size record into
+    the pipe. Records are far smaller than PIPE_BUF, so writes from different
+    processes never interleave. The subscriber blocks in get() until an edge
+    arrives instead of polling every line.
+
+    Writes never block: a line must not stall in pull_high/release because
+    the subscriber lags behind. A record that finds the pipe full is dropped
+    and counted in `dropped`.
+    """
+
+    def __init__(self):
+        self._reader, self._writer = Pipe(duplex=False)
+        os.set_blocking(self._writer.fileno(), False)
+        self._dropped = Value('Q', 0)  # Shared by every writing process
+
+    def put(self, event):
+        try:
+            # One write of less than PIPE_BUF, it goes in whole or not at all
+            self._writer.send_bytes(EDGE_RECORD.pack(*event))
+        except BlockingIOError:
+            with self._dropped.get_lock():
+                self._dropped.value += 1
+
+    def get(self, timeout=None):
+        """Next (line index, state, timestamp), or None if nothing arrived within timeout"""
+        if not self._reader.poll(timeout):
+            return None
+        return EDGE_RECORD.unpack(self._reader.recv_bytes())
+
+    def empty(self):
+        return not self._reader.poll()
+
+    @property
+    def dropped(self):
+        """Records lost to a full pipe"""
+        return self._dropped.value
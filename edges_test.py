@@ -0,0 +1,31 @@
+import unittest
+
+from edges import EdgeChannel
+
+
+class EdgeChannelTest(unittest.TestCase):
+    def test_full_pipe_drops_and_counts(self):
+        channel = EdgeChannel()
+        sent = 0
+        while channel.dropped == 0:  # Nobody reads, the pipe fills up
+            channel.put((sent % 2, sent % 2, float(sent)))
+            sent += 1
+        for _ in range(9):
+            channel.put((0, 1, float(sent)))
+            sent += 1
+        self.assertEqual(channel.dropped, 10)
+
+        received = []
+        while not channel.empty():
+            received.append(channel.get())
+        # Every record either arrived whole and in order or was counted
+        self.assertEqual(len(received) + channel.dropped, sent)
+        self.assertEqual(received, [(i % 2, i % 2, float(i)) for i in range(len(received))])
+
+        channel.put((1, 0, 1.5))  # Room again after draining
+        self.assertEqual(channel.get(timeout=1.0), (1, 0, 1.5))
+        self.assertEqual(channel.dropped, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
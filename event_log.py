@@ -0,0 +1,240 @@
+"""Structured MCU event log.
+
+Every event is one fixed-size record (timestamp, mcu, line, event, state,
+value). EventLog packs records into a per-process buffer that a background
+thread writes out in batches, one file per process, so the FSM never waits
+for a write. ConsoleEventLog prints the same records as text instead and
+NullEventLog, the MCU's default, drops them.
+
+Merge and pretty-print the logs of a run:
+
+    python event_log.py events/
+"""
+import argparse
+import atexit
+import heapq
+import os
+import struct
+import threading
+from collections import deque, namedtuple
+
+# timestamp, event, state, mcu name, line name, value
+EVENT_RECORD = struct.Struct('<dBB16s16sd')
+
+FLUSH_INTERVAL = 0.05  # Seconds between batched writes
+FLUSH_SIZE = 4096  # Records that trigger an early write
+
+NO_STATE = 255  # Event does not belong to an FSM state, e.g. interrupts
+
+LOGIC_START = 1
+SLOT = 2
+LINE_ACTIVE = 3
+STATE_CHANGED = 4
+SEND_SYN = 5
+CONFLICT = 6
+SYN_SENT = 7
+SYN_ACCEPTED = 8
+SYN_TIMEOUT = 9
+WAIT_SYN_ACK = 10
+OTHER_LINE_HIGH = 11
+HIGH_WAIT_SYN_ACK = 12
+SYN_ACK_ACCEPTED = 13
+ACK_SENT = 14
+SYN_ACK_TIMEOUT = 15
+SYN_ACK_SENT = 16
+WAIT_ACK = 17
+HIGH_WAIT_ACK = 18
+ACK_ACCEPTED = 19
+ACK_TIMEOUT = 20
+LINE_WORKS = 21
+LINE_FAILED = 22
+RECEIVED_SYN = 23
+RECEIVED_SYN_ACK = 24
+RECEIVED_ACK = 25
+CONCURRENT_START = 26
+VERIFY_START = 27
+RECEIVED_VERIFY = 28
+LINE_VERIFIED = 29
+VERIFY_FAILED = 30
+DATA_RETRANSMIT = 31
+DATA_LINE_DOWN = 32
+CODED_START = 33
+CODE_SENT = 34
+CODE_DECODED = 35
+CODE_TIMEOUT = 36
+LINE_MAPPED = 37
+EDGES_DROPPED = 38
+
+ROLES = ('', 'initiator', 'responder')  # Role of LINE_WORKS/LINE_FAILED/LINE_VERIFIED, stored in value
+
+# Text of every event, formatted with the record's fields
+TEMPLATES = {
+    LOGIC_START: "starting logic with {value:.0f} lines",
+    SLOT: "Time slot: {value:g} ms for line {line}",
+    LINE_ACTIVE: "Line active on {line}, entering MAYBE_RESPONDER state",
+    STATE_CHANGED: "Interrupt processed, state is now {state}",
+    SEND_SYN: "Send SYN on {line}",
+    CONFLICT: "Conflict detected on {line}, switching to MAYBE_RESPONDER",
+    SYN_SENT: "SYN sent on {line}",
+    SYN_ACCEPTED: "SYN received on {line}, switching to RESPONDER",
+    SYN_TIMEOUT: "Timeout waiting for SYN on {line}, returning to INIT",
+    WAIT_SYN_ACK: "Waiting for SYN_ACK on {line}",
+    OTHER_LINE_HIGH: "Other line {line} is high, switching to MAYBE_RESPONDER",
+    HIGH_WAIT_SYN_ACK: "Line {line} is high, waiting for SYN_ACK",
+    SYN_ACK_ACCEPTED: "SYN_ACK received on {line}",
+    ACK_SENT: "ACK sent on {line}",
+    SYN_ACK_TIMEOUT: "Timeout waiting for SYN_ACK on {line}",
+    SYN_ACK_SENT: "Send SYN_ACK on {line}",
+    WAIT_ACK: "Waiting for ACK on {line}",
+    HIGH_WAIT_ACK: "Line {line} is high, waiting for ACK",
+    ACK_ACCEPTED: "ACK received on {line}",
+    ACK_TIMEOUT: "Timeout waiting for ACK on {line}",
+    LINE_WORKS: "✅ {line} works as {role}",
+    LINE_FAILED: "❌ {line} failed as {role}",
+    RECEIVED_SYN: "Received SYN on {line}",
+    RECEIVED_SYN_ACK: "Received SYN_ACK on {line}",
+    RECEIVED_ACK: "Received ACK on {line}",
+    CONCURRENT_START: "starting concurrent logic with {value:.0f} lines",
+    VERIFY_START: "verifying {value:.0f} cached lines",
+    RECEIVED_VERIFY: "Received VERIFY on {line}",
+    LINE_VERIFIED: "✅ {line} verified as {role}",
+    VERIFY_FAILED: "Cached line {line} not confirmed, rediscovering it",
+    DATA_RETRANSMIT: "No ack for data frame {value:.0f} on {line}, sending it again",
+    DATA_LINE_DOWN: "Data channel stops using {line}, too many frames lost",
+    CODED_START: "coded discovery of {value:.0f} lines",
+    CODE_SENT: "Sent the line code on {value:.0f} lines",
+    CODE_DECODED: "Decoded the peer's line code on {value:.0f} lines",
+    CODE_TIMEOUT: "No line code from the peer, attempt {value:.0f}",
+    LINE_MAPPED: "{line} is line {value:.0f} of the peer",
+    EDGES_DROPPED: "⚠️ {value:.0f} line edges dropped so far, the edge pipe was full",
+}
+
+Event = namedtuple('Event', 'timestamp mcu line event state value')
+
+
+def format_event(event, with_time=False):
+    role = ROLES[int(event.value)] if event.event in (LINE_WORKS, LINE_FAILED, LINE_VERIFIED) else ''
+    text = TEMPLATES[event.event].format(line=event.line, state=event.state, value=event.value, role=role)
+    prefix = f"{event.timestamp:12.6f} " if with_time else ""
+    return f"{prefix}[{event.mcu}] {text}"
+
+
+class ConsoleEventLog:
+    """Prints every event right away, the output of the MCU before it had an event log"""
+    def log(self, timestamp, mcu, line, event, state=NO_STATE, value=0.0):
+        print(format_event(Event(timestamp, mcu, line, event, state, value)))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullEventLog:
+    """Drops every event, for runs nobody reads the log of (sweeps, fuzzing)"""
+    def log(self, timestamp, mcu, line, event, state=NO_STATE, value=0.0):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class EventLog:
+    """Binary event log, one file per process in `directory`.
+
+    log() only packs the record and appends it to an in-memory batch. A
+    daemon thread of the logging process writes the batches out. Processes
+    end with os._exit, so whoever logs from a child process must flush()
+    before it returns.
+    """
+
+    def __init__(self, directory, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self._pid = None
+
+    def _open(self):
+        # First record in this process, forked children must not share the parent's batch or thread
+        self._pid = os.getpid()
+        self._pending = deque()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._file = open(os.path.join(self.directory, f"events-{self._pid}.bin"), 'ab')
+        self._thread = threading.Thread(target=self._flusher, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __getstate__(self):
+        return {'directory': self.directory, 'flush_interval': self.flush_interval, '_pid': None}
+
+    def log(self, timestamp, mcu, line, event, state=NO_STATE, value=0.0):
+        if self._pid != os.getpid():
+            self._open()
+        self._pending.append(EVENT_RECORD.pack(
+            timestamp, event, state, mcu.encode('utf-8')[:16], (line or '').encode('utf-8')[:16], value))
+        if len(self._pending) >= FLUSH_SIZE:
+            self._wake.set()
+
+    def _flusher(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        with self._write_lock:
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if batch:
+                self._file.write(b''.join(batch))
+                self._file.flush()
+
+    def close(self):
+        if self._pid != os.getpid() or self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        with self._write_lock:
+            self._file.close()
+
+
+def read_events(path):
+    """Records of one log file, in the order they were logged"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    usable = len(data) - len(data) % EVENT_RECORD.size
+    for fields in EVENT_RECORD.iter_unpack(data[:usable]):
+        timestamp, event, state, mcu, line, value = fields
+        yield Event(timestamp, mcu.rstrip(b'\0').decode('utf-8'), line.rstrip(b'\0').decode('utf-8'),
+                    event, state, value)
+
+
+def merge_events(directory):
+    """Records of all processes that logged to `directory`, ordered by timestamp"""
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.bin'))
+    return heapq.merge(*(read_events(path) for path in paths), key=lambda event: event.timestamp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--mcu", default=None, help="Only show events of this MCU")
+    parser.add_argument("--line", default=None, help="Only show events on this line")
+    args = parser.parse_args()
+
+    for event in merge_events(args.directory):
+        if args.mcu is not None and event.mcu != args.mcu:
+            continue
+        if args.line is not None and event.line != args.line:
+            continue
+        print(format_event(event, with_time=True))
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from multiprocessing import Process
+
+from event_log import (
+    EVENT_RECORD, LINE_WORKS, NO_STATE, SEND_SYN, SLOT, Event, EventLog, merge_events, read_events,
+)
+
+
+def _log_from_child(event_log, timestamps):
+    for timestamp in timestamps:
+        event_log.log(timestamp, "B", "L2", SLOT, NO_STATE, timestamp * 10)
+    event_log.close()  # The child ends with os._exit, atexit does not run
+
+
+class EventLogTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_record_round_trip(self):
+        event_log = EventLog(self.directory)
+        event_log.log(1.5, "A", "L1", SEND_SYN, 0, 0.0)
+        event_log.log(2.5, "MCU-with-a-long-name", None, LINE_WORKS, 3, 1.0)
+        event_log.close()
+
+        (path,) = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        with open(path, 'ab') as f:
+            f.write(b'\0' * (EVENT_RECORD.size - 1))  # A record cut short by a crash is skipped
+        self.assertEqual(list(read_events(path)), [
+            Event(1.5, "A", "L1", SEND_SYN, 0, 0.0),
+            Event(2.5, "MCU-with-a-long-", "", LINE_WORKS, 3, 1.0),  # Names keep their first 16 bytes
+        ])
+
+    def test_merge_orders_the_processes_by_timestamp(self):
+        event_log = EventLog(self.directory)
+        child = Process(target=_log_from_child, args=(event_log, [0.5, 1.5, 2.5, 4.0]))
+        child.start()
+        child.join()
+        for timestamp in (1.0, 2.0, 3.0):
+            event_log.log(timestamp, "A", "L1", SEND_SYN)
+        event_log.close()
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)  # One file per process
+        events = list(merge_events(self.directory))
+        self.assertEqual([event.timestamp for event in events], [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0])
+        self.assertEqual([event.mcu for event in events], ["B", "A", "B", "A", "B", "A", "B"])
+        self.assertEqual(events[-1], Event(4.0, "B", "L2", SLOT, NO_STATE, 40.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Seeded fault models for UnreliableSharedLine.
+
+A model turns a seed into a fault schedule: one effect per time slot
+(DEFAULT_RESOLUTION long) over a horizon, after which the schedule repeats.
+Reading a faulty line is then a single array lookup at the line's clock,
+so what a reader sees depends only on the seed and the time it reads,
+never on how often anybody polls, and a failing run replays exactly.
+
+Faults only change what state() reports, not the edges subscribers get,
+like the wire between a driver and one sampling input going bad.
+"""
+import numpy as np
+
+DEFAULT_RESOLUTION = 0.001  # Seconds per schedule slot
+DEFAULT_HORIZON = 60.0  # Seconds before the schedule repeats
+
+PASS = 0  # Report the actual level
+FORCE_LOW = 1  # Report LOW, a dropped read
+FORCE_HIGH = 2  # Report HIGH, a glitch or a line stuck high
+
+
+class FaultSchedule:
+    """Precomputed effect per time slot, read with apply()"""
+    def __init__(self, effects, resolution=DEFAULT_RESOLUTION):
+        self.effects = bytes(np.asarray(effects, dtype=np.uint8))
+        self.resolution = resolution
+        self._slots = len(self.effects)
+
+    def apply(self, level, t):
+        """Level a reader sees at `t` seconds after the line was created"""
+        effect = self.effects[int(t / self.resolution) % self._slots]
+        if effect == PASS:
+            return level
+        return 0 if effect == FORCE_LOW else 1
+
+    def fault_rate(self):
+        """Share of slots with a fault"""
+        return 1 - self.effects.count(PASS) / self._slots
+
+
+class FaultModel:
+    """Base class, subclasses fill effects() for `slots` slots from a numpy Generator"""
+    def effects(self, rng, slots, resolution):
+        raise NotImplementedError
+
+    def schedule(self, seed, horizon=DEFAULT_HORIZON, resolution=DEFAULT_RESOLUTION):
+        slots = max(1, int(round(horizon / resolution)))
+        return FaultSchedule(self.effects(np.random.default_rng(seed), slots, resolution), resolution)
+
+
+class IidDrop(FaultModel):
+    """Every slot independently reads LOW with probability `rate`"""
+    def __init__(self, rate):
+        self.rate = rate
+
+    def effects(self, rng, slots, resolution):
+        return np.where(rng.random(slots) < self.rate, FORCE_LOW, PASS)
+
+
+class GilbertElliott(FaultModel):
+    """Bursty drops: a good and a bad channel state with exponential sojourn times.
+
+    `mean_good` and `mean_bad` are the mean seconds spent in each state,
+    `drop_good` and `drop_bad` the drop probability of a slot in that state.
+    """
+    def __init__(self, mean_good=1.0, mean_bad=0.05, drop_good=0.0, drop_bad=1.0):
+        self.mean_good = mean_good
+        self.mean_bad = mean_bad
+        self.drop_good = drop_good
+        self.drop_bad = drop_bad
+
+    def effects(self, rng, slots, resolution):
+        p_leave_good = min(1.0, resolution / self.mean_good)
+        p_leave_bad = min(1.0, resolution / self.mean_bad)
+        # Alternating good/bad run lengths, enough of them to cover every slot
+        runs = max(2, int(2 * slots * max(p_leave_good, p_leave_bad)) + 2)
+        while True:
+            lengths = np.empty(runs, dtype=np.int64)
+            lengths[0::2] = rng.geometric(p_leave_good, (runs + 1) // 2)
+            lengths[1::2] = rng.geometric(p_leave_bad, runs // 2)
+            if lengths.sum() >= slots:
+                break
+            runs *= 2
+        bad = np.repeat(np.arange(runs) % 2 == 1, lengths)[:slots]
+        drop = rng.random(slots) < np.where(bad, self.drop_bad, self.drop_good)
+        return np.where(drop, FORCE_LOW, PASS)
+
+
+class StuckAt(FaultModel):
+    """Reads `level` from `start` for `duration` seconds (None: until the horizon)"""
+    def __init__(self, level=0, start=0.0, duration=None):
+        self.level = level
+        self.start = start
+        self.duration = duration
+
+    def effects(self, rng, slots, resolution):
+        effects = np.full(slots, PASS, dtype=np.uint8)
+        first = int(self.start / resolution)
+        last = slots if self.duration is None else first + int(round(self.duration / resolution))
+        effects[first:last] = FORCE_HIGH if self.level else FORCE_LOW
+        return effects
+
+
+class Glitch(FaultModel):
+    """HIGH pulses `width` seconds wide arriving at `rate` per second (Poisson)"""
+    def __init__(self, rate=1.0, width=0.001):
+        self.rate = rate
+        self.width = width
+
+    def effects(self, rng, slots, resolution):
+        effects = np.full(slots, PASS, dtype=np.uint8)
+        horizon = slots * resolution
+        onsets = np.cumsum(rng.exponential(1.0 / self.rate, int(horizon * self.rate * 2) + 10))
+        onsets = (onsets[onsets < horizon] / resolution).astype(np.int64)
+        width = max(1, int(round(self.width / resolution)))
+        for offset in range(width):
+            effects[np.minimum(onsets + offset, slots - 1)] = FORCE_HIGH
+        return effects
+
+
+class Combined(FaultModel):
+    """Several models on one line, later models win where their slots overlap"""
+    def __init__(self, *models):
+        self.models = models
+
+    def effects(self, rng, slots, resolution):
+        effects = np.full(slots, PASS, dtype=np.uint8)
+        for model in self.models:
+            own = np.asarray(model.effects(rng, slots, resolution), dtype=np.uint8)
+            effects = np.where(own != PASS, own, effects)
+        return effects
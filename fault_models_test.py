@@ -0,0 +1,48 @@
+import unittest
+
+from fault_models import (
+    FORCE_HIGH, FORCE_LOW, PASS, Combined, FaultSchedule, GilbertElliott, Glitch, IidDrop, StuckAt,
+)
+
+HORIZON = 10.0
+MODELS = {
+    'iid': lambda: IidDrop(0.2),
+    'bursty': lambda: GilbertElliott(mean_good=0.5, mean_bad=0.05),
+    'glitch': lambda: Glitch(rate=5.0, width=0.005),
+    'combined': lambda: Combined(IidDrop(0.1), Glitch(rate=2.0)),
+}
+
+
+class DeterminismTest(unittest.TestCase):
+    def test_same_seed_same_schedule(self):
+        for name, model in MODELS.items():
+            with self.subTest(name):
+                first = model().schedule(7, horizon=HORIZON)
+                self.assertEqual(first.effects, model().schedule(7, horizon=HORIZON).effects)
+                self.assertNotEqual(first.effects, model().schedule(8, horizon=HORIZON).effects)
+
+
+class FaultRateTest(unittest.TestCase):
+    def test_counts_the_faulty_slots(self):
+        schedule = FaultSchedule([PASS, FORCE_LOW, PASS, FORCE_HIGH])
+        self.assertEqual(schedule.fault_rate(), 0.5)
+        self.assertEqual(FaultSchedule([PASS] * 4).fault_rate(), 0.0)
+
+    def test_iid_drop_rate(self):
+        schedule = IidDrop(0.2).schedule(1, horizon=HORIZON)
+        self.assertAlmostEqual(schedule.fault_rate(), 0.2, delta=0.02)
+
+    def test_bursty_rate_follows_the_sojourn_times(self):
+        # Bad a tenth of the time and every bad slot drops
+        schedule = GilbertElliott(mean_good=0.45, mean_bad=0.05).schedule(1, horizon=100.0)
+        self.assertAlmostEqual(schedule.fault_rate(), 0.1, delta=0.03)
+
+    def test_stuck_at_covers_its_window(self):
+        schedule = StuckAt(level=1, start=2.0, duration=3.0).schedule(0, horizon=HORIZON)
+        self.assertAlmostEqual(schedule.fault_rate(), 0.3)
+        self.assertEqual(schedule.apply(0, 2.5), 1)
+        self.assertEqual(schedule.apply(0, 5.5), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+"""Property-based fuzzing of the handshake FSM in virtual time.
+
+Hypothesis draws a whole scenario: wiring (extra lines, crossed names, a
+bridge), coded discovery or not, the slot every MCU picks on every attempt, read faults and pinger
+schedules. The scenario runs on the Simulation, so one case takes
+milliseconds instead of the seconds of a real-time run. After every case
+the invariants below are checked. A failing scenario is shrunk by
+hypothesis and printed as JSON that --replay runs again.
+
+Invariants (the ones marked * only hold without noise on the lines):
+  - no line is in both the white_list and the black_list of an MCU
+  - a line an MCU reports twice is reported with the same status
+  * both MCUs complete
+  * both sides agree on every working line: the peer reports the same
+    physical line as working and the roles are initiator and responder
+  * no MCU reports a line as working that its peer is not wired to
+  * a line mapped by coded discovery names the peer's index of that line
+
+    python fuzz.py --examples 5000 --workers 4
+    python fuzz.py --replay '{"lines": 2, ...}'
+"""
+import argparse
+import json
+import random
+from multiprocessing import Pool, cpu_count, set_start_method
+from time import perf_counter
+
+from hypothesis import HealthCheck, given, seed, settings, strategies as st
+
+from arbitration import Arbitration
+from event_log import NullEventLog
+from fault_models import GilbertElliott, Glitch
+from mcu import MCU, DEFAULT_TIMING
+from pinger import Pinger, PulseScheduler, Bridge
+from results import ResultsAggregator
+from shared_lines import SharedLine, UnreliableSharedLine
+from simulation import Simulation
+
+TIME_LIMIT = 300.0  # Virtual seconds per case
+MAX_LINES = 6
+MAX_SLOTS = 12  # Slot choices drawn per MCU, replayed cyclically
+
+FAULTS = {
+    'bursty': lambda: GilbertElliott(mean_good=2.0, mean_bad=0.05),
+    'glitch': lambda: Glitch(rate=2.0, width=0.005),
+}
+
+
+class ScriptedSlots(Arbitration):
+    """Replays a drawn list of slot indices, so hypothesis can shrink the slot choices"""
+    def __init__(self, indices):
+        self.indices = indices
+        self.attempt = 0
+
+    def slot(self, mcu_name, line_name, slots_ms):
+        index = self.indices[self.attempt % len(self.indices)]
+        self.attempt += 1
+        return slots_ms[index % len(slots_ms)]
+
+
+@st.composite
+def scenarios(draw):
+    lines = draw(st.integers(1, MAX_LINES))
+    slot_indices = st.lists(st.integers(0, len(DEFAULT_TIMING.time_slots_ms) - 1), min_size=1, max_size=MAX_SLOTS)
+    line_index = st.integers(0, lines - 1)
+    bridge = None
+    if lines >= 2:
+        bridge = draw(st.none() | st.lists(line_index, min_size=2, max_size=2, unique=True))
+    return {
+        'lines': lines,
+        'extra': draw(st.integers(0, 2)),
+        'b_order': draw(st.permutations(range(lines))),
+        'concurrent': draw(st.booleans()),
+        'coded': draw(st.booleans()),
+        'slots_a': draw(slot_indices),
+        'slots_b': draw(slot_indices),
+        'bridge': bridge,
+        'faults': draw(st.lists(st.tuples(line_index, st.sampled_from(sorted(FAULTS)), st.integers(0, 2 ** 32)),
+                                max_size=2, unique_by=lambda fault: fault[0])),
+        'pingers': draw(st.lists(st.tuples(line_index, st.floats(0.2, 3.0), st.floats(0.01, 1.8), st.floats(0.0, 2.0)),
+                                 max_size=2)),
+        'seed': draw(st.integers(0, 2 ** 32)),
+    }
+
+
+def run_case(case):
+    """Simulate one scenario, returns (A's wiring, B's wiring, aggregator, physical lines)"""
+    random.seed(case['seed'])
+    sim = Simulation()
+    faults = {line: (kind, fault_seed) for line, kind, fault_seed in case['faults']}
+
+    def make_line(index, name):
+        if index in faults:
+            kind, fault_seed = faults[index]
+            line = UnreliableSharedLine(sim.manager, failure_rate=0.0, name=name, clock=sim.clock,
+                                        fault_model=FAULTS[kind](), seed=fault_seed)
+        else:
+            line = SharedLine(sim.manager, name=name, clock=sim.clock)
+        return sim.add_line(line)
+
+    shared = [make_line(i, f"L{i + 1}") for i in range(case['lines'])]
+    only_a = [make_line(None, f"X{i + 1}") for i in range(case['extra'])]
+    wiring_a = [(line.name, line) for line in shared + only_a]
+    wiring_b = [(f"P{position + 1}", shared[index]) for position, index in enumerate(case['b_order'])]
+
+    if case['bridge']:
+        sim.add_bridge(Bridge([shared[i] for i in case['bridge']]))
+    scheduler = PulseScheduler(clock=sim.clock)
+    for index, interval, width, phase in case['pingers']:
+        scheduler.add(Pinger(shared[index], interval=interval, pulse_width=min(width, interval / 2),
+                             phase=phase, clock=sim.clock))
+    if scheduler.sources:
+        sim.add_scheduler(scheduler)
+
+    for name, wiring, slots in (("A", wiring_a, case['slots_a']), ("B", wiring_b, case['slots_b'])):
+        sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock, concurrent=case['concurrent'],
+                        event_log=NullEventLog(), arbitration=ScriptedSlots(slots),
+                        coded=case.get('coded', False)))
+
+    results = ResultsAggregator(sim.output_queue, ["A", "B"], clock=sim.clock)
+    sim.run(until=TIME_LIMIT, stop_when=results.poll)
+    results.poll()
+    sim.close()
+    return dict(wiring_a), dict(wiring_b), results
+
+
+def check_case(case):
+    """Run a scenario and assert the invariants"""
+    wiring_a, wiring_b, results = run_case(case)
+    wirings = {"A": wiring_a, "B": wiring_b}
+    noisy = bool(case['faults'] or case['pingers'] or case['bridge'])
+
+    reported = {}  # (mcu, line name) -> status
+    for table in results.mcus.values():
+        for message in table['pins']:
+            key = (message['mcu_name'], message['pin_data']['name'])
+            status = message['status']
+            assert reported.setdefault(key, status) == status, f"{key} reported as {reported[key]} and {status}"
+
+    for name, table in results.mcus.items():
+        if table['status'] != 'COMPLETED':
+            continue
+        white = {pd['name'] for pd in table['white_list']}
+        black = {pd['name'] for pd in table['black_list']}
+        assert not white & black, f"{name}: {sorted(white & black)} whitelisted and blacklisted"
+
+    if noisy:
+        return
+    assert results.done, f"only {sorted(results.completed)} completed within {TIME_LIMIT} s"
+
+    for name, peer in (("A", "B"), ("B", "A")):
+        peer_names = {id(line): line_name for line_name, line in wirings[peer].items()}
+        for (mcu, line_name), line in results.lines.items():
+            if mcu != name or line['status'] != 'WORKING':
+                continue
+            physical = wirings[name][line_name]
+            peer_name = peer_names.get(id(physical))
+            assert peer_name is not None, f"{name} reports {line_name} working, {peer} is not wired to it"
+            peer_line = results.lines.get((peer, peer_name))
+            assert peer_line is not None and peer_line['status'] == 'WORKING', \
+                f"{name} reports {line_name} working, {peer} reports {peer_line and peer_line['status']}"
+            assert {line['role'], peer_line['role']} == {'initiator', 'responder'}, \
+                f"{line_name}: roles {line['role']} and {peer_line['role']}"
+
+        peer_order = list(wirings[peer])
+        for message in results.mcus[name]['pins']:
+            pin = message['pin_data']
+            if pin['peer_index'] is None:
+                continue
+            peer_name = peer_names.get(id(wirings[name][pin['name']]))
+            assert peer_name is not None and pin['peer_index'] == peer_order.index(peer_name), \
+                f"{name} maps {pin['name']} to line {pin['peer_index']} of {peer}, it is {peer_name}"
+
+
+def fuzz(examples, worker_seed):
+    """Run `examples` cases with hypothesis, returns (cases run, shrunk failing case or None, error)"""
+    state = {'runs': 0, 'failing': None, 'error': None}
+
+    def property_(case):
+        state['runs'] += 1
+        try:
+            check_case(case)
+        except Exception as error:
+            # Hypothesis replays the shrunk example last, so this ends as the minimal case
+            state['failing'], state['error'] = case, f"{type(error).__name__}: {error}"
+            raise
+
+    test = given(scenarios())(property_)
+    test = settings(max_examples=examples, deadline=None, database=None, print_blob=False,
+                    suppress_health_check=list(HealthCheck))(test)
+    test = seed(worker_seed)(test)
+    try:
+        test()
+    except Exception:
+        # A failing case is recorded above, anything else (a health check, Unsatisfiable, a broken strategy) is raised
+        if state['failing'] is None:
+            raise
+    return state['runs'], state['failing'], state['error']
+
+
+def _fuzz(job):
+    return fuzz(*job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", type=int, default=1000, help="Cases in total, split over the workers")
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", default=None, help="JSON of a case printed by an earlier run")
+    args = parser.parse_args()
+
+    if args.replay:
+        check_case(json.loads(args.replay))
+        print("case passes")
+        raise SystemExit(0)
+
+    set_start_method("fork")
+    per_worker = -(-args.examples // args.workers)
+    jobs = [(per_worker, args.seed * 1000 + worker) for worker in range(args.workers)]
+    start = perf_counter()
+    with Pool(args.workers) as pool:
+        outcomes = pool.map(_fuzz, jobs)
+    elapsed = perf_counter() - start
+
+    runs = sum(runs for runs, _, _ in outcomes)
+    print(f"{runs} cases in {elapsed:.1f} s on {args.workers} workers, {runs / elapsed * 60:.0f} cases/min")
+    failures = [(case, error) for _, case, error in outcomes if case is not None]
+    for case, error in failures:
+        print(f"\n{error}\n  python fuzz.py --replay '{json.dumps(case)}'")
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,17 @@
+import json
+import unittest
+
+from fuzz import fuzz
+
+EXAMPLES = 50
+
+
+class FuzzTest(unittest.TestCase):
+    def test_invariants_hold(self):
+        runs, failing, error = fuzz(EXAMPLES, worker_seed=0)
+        self.assertIsNone(failing, f"{error}\n  python fuzz.py --replay '{json.dumps(failing)}'")
+        self.assertGreater(runs, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
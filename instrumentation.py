@@ -0,0 +1,111 @@
+import json
+from bisect import bisect_right
+
+# Upper bucket bounds (s) of every histogram: 10 us doubling up to ~84 s, plus an overflow bucket
+BUCKET_BOUNDS = [1e-5 * 2 ** k for k in range(24)]
+
+STATE_NAMES = {0: 'INIT', 1: 'INITIATOR', 2: 'RESPONDER', 3: 'SUCCESS', 4: 'FAILED', 5: 'MAYBE_RESPONDER'}
+
+
+class Histogram:
+    """Log-bucketed histogram of durations in seconds"""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect_right(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS + [self.max], self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'counts': self.counts,
+        }
+
+
+class Instrumentation:
+    """Opt-in timing histograms of one MCU.
+
+    Pass an instance as MCU(..., instrumentation=...). The MCU then records
+    how long its FSM dwells in every state, how long it waits for its time
+    slot, how long an edge takes from the line to the interrupt handler and
+    how many interrupts the own-pulse guard drops. Without it the MCU only
+    pays one `is not None` check per hook.
+
+    When the MCU is done the report goes to its output_queue as a 'METRICS'
+    message, or is appended to `path` as one JSON line if a path is given.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.dwell = {name: Histogram() for name in STATE_NAMES.values()}
+        self.slot_wait = Histogram()
+        self.edge_to_interrupt = Histogram()
+        self.guard_dropped = {}  # line name -> interrupts dropped
+        self._current = {}  # FSM key -> (state, entered at)
+
+    def observe_state(self, key, state, now):
+        """Called with the current state of FSM `key` (None or a line name) on every pass of its loop"""
+        current = self._current.get(key)
+        if current is None:
+            self._current[key] = (state, now)
+        elif current[0] != state:
+            self.dwell[STATE_NAMES[current[0]]].add(now - current[1])
+            self._current[key] = (state, now)
+
+    def interrupt(self, line_name, timestamp, now, dropped):
+        self.edge_to_interrupt.add(now - timestamp)
+        if dropped:
+            self.guard_dropped[line_name] = self.guard_dropped.get(line_name, 0) + 1
+
+    def report(self, now):
+        # Close the states we are still in
+        for key, (state, entered) in self._current.items():
+            self.dwell[STATE_NAMES[state]].add(now - entered)
+            self._current[key] = (state, now)
+        return {
+            'dwell': {name: h.to_dict() for name, h in self.dwell.items()},
+            'slot_wait': self.slot_wait.to_dict(),
+            'edge_to_interrupt': self.edge_to_interrupt.to_dict(),
+            'guard_dropped': dict(self.guard_dropped),
+            'bucket_bounds': BUCKET_BOUNDS,
+        }
+
+    def emit(self, mcu_name, output_queue, now):
+        message = {
+            'mcu_name': mcu_name,
+            'status': 'METRICS',
+            'timestamp': now,
+            'metrics': self.report(now),
+        }
+        if self.path is not None:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(message) + '\n')
+        elif output_queue is not None:
+            output_queue.put(message)
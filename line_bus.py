@@ -0,0 +1,226 @@
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+from time import perf_counter
+
+from shared_lines import SharedLine, OneWaySharedLine, UnreliableSharedLine, make_fault_schedule
+from trace_buffer import new_trace_buffer
+from nets import net_state
+
+MAX_HOLDERS = 64  # One bit per holder in a uint64 mask
+HOLDER_NAME_SIZE = 32  # Bytes reserved per holder name (utf-8, NUL padded)
+
+_MASK_SIZE = 8
+
+
+class SharedMemoryLineBus:
+    """Line states for many lines in one shared memory block.
+
+    Every line owns a uint64 holder mask, every holder name owns one bit.
+    Reading a line is a single 8 byte load from the mapped block, writes are
+    read-modify-write under one lock so concurrent pull_high/release calls
+    from different processes never lose an update.
+    """
+
+    def __init__(self, manager, num_lines=64):
+        self.manager = manager  # Only decides where the line traces live
+        self.num_lines = num_lines
+        self._lock = Lock()
+
+        self._names_offset = num_lines * _MASK_SIZE
+        self._allocated_offset = self._names_offset + MAX_HOLDERS * HOLDER_NAME_SIZE
+        size = self._allocated_offset + _MASK_SIZE
+        self._shm = SharedMemory(create=True, size=size)
+        self._shm.buf[:size] = bytes(size)
+        self._attach()
+
+    def _attach(self):
+        self._masks = self._shm.buf[:self._names_offset].cast('Q')
+        self._allocated = self._shm.buf[self._allocated_offset:self._allocated_offset + _MASK_SIZE].cast('Q')
+        self._bits = {}  # Per process cache: holder name -> bit
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_masks', '_allocated', '_bits'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def allocate(self):
+        with self._lock:
+            index = self._allocated[0]
+            if index >= self.num_lines:
+                raise RuntimeError(f"Line bus is full ({self.num_lines} lines)")
+            self._allocated[0] = index + 1
+        return index
+
+    def _name_slot(self, slot):
+        start = self._names_offset + slot * HOLDER_NAME_SIZE
+        return self._shm.buf[start:start + HOLDER_NAME_SIZE]
+
+    def _bit(self, name):
+        bit = self._bits.get(name)
+        if bit is not None:
+            return bit
+
+        encoded = name.encode('utf-8')[:HOLDER_NAME_SIZE].ljust(HOLDER_NAME_SIZE, b'\0')
+        with self._lock:
+            for slot in range(MAX_HOLDERS):
+                current = bytes(self._name_slot(slot))
+                if current == encoded:
+                    break
+                if current[0] == 0:
+                    self._name_slot(slot)[:] = encoded
+                    break
+            else:
+                raise RuntimeError(f"Line bus holder table is full ({MAX_HOLDERS} holders)")
+
+        bit = 1 << slot
+        self._bits[name] = bit
+        return bit
+
+    def pull_high(self, index, name):
+        """Set the holder bit of `name`, returns the new mask or None if nothing changed"""
+        bit = self._bit(name)
+        with self._lock:
+            mask = self._masks[index]
+            if mask & bit:
+                return None
+            self._masks[index] = mask | bit
+        return mask | bit
+
+    def release(self, index, name):
+        """Clear the holder bit of `name`, returns the new mask or None if nothing changed"""
+        bit = self._bit(name)
+        with self._lock:
+            mask = self._masks[index]
+            if not mask & bit:
+                return None
+            self._masks[index] = mask & ~bit
+        return mask & ~bit
+
+    def mask(self, index):
+        return self._masks[index]
+
+    def holder_names(self, index):
+        mask = self._masks[index]
+        names = []
+        for slot in range(MAX_HOLDERS):
+            if mask & (1 << slot):
+                names.append(bytes(self._name_slot(slot)).rstrip(b'\0').decode('utf-8'))
+        return names
+
+    def close(self):
+        self._masks.release()
+        self._allocated.release()
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class ShmSharedLine(SharedLine):
+    def __init__(self, bus, name="SharedLine", clock=perf_counter):
+        self._bus = bus
+        self._index = bus.allocate()
+        self.data_log = new_trace_buffer(bus.manager)
+        self.name = name
+        self._clock = clock
+        self._subscribers = []
+        self.start_time = clock()
+        self._log_state()
+
+    @property
+    def holders(self):
+        return self._bus.holder_names(self._index)
+
+    def pull_high(self, name):
+        if self._bus.pull_high(self._index, name) is not None:
+            self._publish(1)
+        self._log_state()
+
+    def release(self, name):
+        mask = self._bus.release(self._index, name)
+        if mask is not None:
+            self._publish(1 if mask else 0)
+        self._log_state()
+
+    def _own_state(self):
+        return 1 if self._bus.mask(self._index) else 0
+
+    def _log_state(self):
+        mask = self._bus.mask(self._index)
+        state = net_state(self) if self._net_parent is not None else (1 if mask else 0)
+        self.data_log.append((self._clock() - self.start_time) * 1000,  # milliseconds
+                             state, mask.bit_count())
+
+
+class ShmOneWaySharedLine(OneWaySharedLine):
+    def __init__(self, bus, sender_name, name="OneWaySharedLine", clock=perf_counter):
+        self._bus = bus
+        self._index = bus.allocate()
+        self._sender_name = sender_name
+        self.data_log = new_trace_buffer(bus.manager)
+        self.name = name
+        self._clock = clock
+        self._subscribers = []
+        self.start_time = clock()
+
+        self._log_state()
+
+    def pull_high(self, name):
+        if name == self._sender_name and self._bus.pull_high(self._index, name) is not None:
+            self._publish(1)
+        self._log_state()
+
+    def release(self, name):
+        if name == self._sender_name and self._bus.release(self._index, name) is not None:
+            self._publish(0)
+        self._log_state()
+
+    def _own_state(self):
+        return 1 if self._bus.mask(self._index) else 0
+
+
+class ShmUnreliableSharedLine(UnreliableSharedLine):
+    def __init__(self, bus, failure_rate=0.1, name="UnreliableSharedLine", clock=perf_counter,
+                 fault_model=None, seed=None):
+        self._bus = bus
+        self._index = bus.allocate()
+        self.failure_rate = failure_rate
+        self.data_log = new_trace_buffer(bus.manager)
+        self.name = name
+        self._clock = clock
+        self._subscribers = []
+        self.start_time = clock()
+        self.faults = make_fault_schedule(failure_rate, fault_model, seed)
+
+        self._log_state()
+
+    @property
+    def holders(self):
+        return self._bus.holder_names(self._index)
+
+    def pull_high(self, name):
+        if self._bus.pull_high(self._index, name) is not None:
+            self._publish(1)
+        self._log_state()
+
+    def release(self, name):
+        mask = self._bus.release(self._index, name)
+        if mask is not None:
+            self._publish(1 if mask else 0)
+        self._log_state()
+
+    def _own_state(self):
+        return 1 if self._bus.mask(self._index) else 0
+
+    def _log_state(self):
+        mask = self._bus.mask(self._index)
+        actual_state = net_state(self) if self._net_parent is not None else (1 if mask else 0)
+        now = self._clock() - self.start_time
+        reported_state = self.faults.apply(actual_state, now)
+        self.data_log.append(now * 1000,  # milliseconds
+                             actual_state | reported_state << 1, mask.bit_count())
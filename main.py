@@ -1,13 +1,20 @@
+import argparse
 from multiprocessing import Queue, Manager, set_start_method
-from time import perf_counter
-from shared_lines import SharedLine, OneWaySharedLine, UnreliableSharedLine, MultiLinePlotter
+from shared_lines import SharedLine, MultiLinePlotter
 from mcu import MCU
-from pinger import Pinger, Bridge
+from event_log import ConsoleEventLog
+from pinger import Pinger, PulseScheduler, Bridge  # Pinger and PulseScheduler for the pinger scenario below
+from wiring_cache import WiringCache
+from results import ResultsAggregator
 
 
-from hypothesis import given, strategies as st
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wiring-cache", default=None, metavar="DIR",
+                        help="Keep the wiring map in DIR and only confirm it on the next run")
+    args = parser.parse_args()
+
     set_start_method("fork")
     manager = Manager()
     
@@ -37,67 +44,52 @@ if __name__ == "__main__":
     
     #TODO: Enhance the algorithm to react to periodic pings on one line
     
-    mcu1 = MCU("A", lines_controller1, manager, output_queue)
-    mcu2 = MCU("B", lines_controller2, manager, output_queue)
+    # Wiring found by an earlier run, its lines are only confirmed with short VERIFY pulses
+    wiring_cache = WiringCache(args.wiring_cache) if args.wiring_cache else None
+
+    # The demo prints what the MCUs do, library code defaults to no event log
+    mcu1 = MCU("A", lines_controller1, output_queue, wiring_cache=wiring_cache, event_log=ConsoleEventLog())
+    mcu2 = MCU("B", lines_controller2, output_queue, wiring_cache=wiring_cache, event_log=ConsoleEventLog())
     
     bridge1 = Bridge([shared_lines["L1"], shared_lines["L2"]], name="Bridge1")
     
-     #start the pinger
-   # pinger1 = Pinger(shared_lines["L1"], interval=1.0, pulse_width=0.1)
-   # pinger2 = Pinger(shared_lines["L10"], interval=1.0, pulse_width=0.1)
+     #start the pingers, one scheduler process drives all of them
+   # pingers = PulseScheduler([
+   #     Pinger(shared_lines["L1"], interval=1.0, pulse_width=0.1),
+   #     Pinger(shared_lines["L4"], interval=1.0, pulse_width=0.1, phase=0.5, jitter=0.05),
+   # ])
     
     
 
     mcu1.start()
     mcu2.start()
     
-   # pinger1.start()
-  #  pinger2.start()
+   # pingers.start()
     
     
     
      
     
-    # Collect pin data from MCUs
-    mcu_results = {}
-    completed_mcus = set()
-    
+    # Collect pin data from MCUs, until both report COMPLETED
+    aggregator = ResultsAggregator(output_queue, [mcu1.name, mcu2.name])
+    aggregator.on('COMPLETED', lambda data: print(f"MCU {data['mcu_name']} completed"))
+
     try:
-        start_time = perf_counter()
-        while len(completed_mcus) < 2 and (perf_counter() - start_time) < 25:
-            try:
-                # Check for data from MCUs with timeout
-                data = output_queue.get(timeout=1.0)
-                mcu_name = data['mcu_name']
-                
-                if mcu_name not in mcu_results:
-                    mcu_results[mcu_name] = {'pins': [], 'status': 'RUNNING'}
-                
-                if data['status'] == 'COMPLETED':
-                    completed_mcus.add(mcu_name)
-                    mcu_results[mcu_name]['status'] = 'COMPLETED'
-                    mcu_results[mcu_name]['white_list'] = data['white_list']
-                    mcu_results[mcu_name]['black_list'] = data['black_list']
-                elif 'pin_data' in data:
-                    mcu_results[mcu_name]['pins'].append(data)
-                    
-            except:
-                # Timeout or empty queue, continue
-                continue
+        aggregator.run(timeout=25)
                 
     finally:
         mcu1.stop()
         mcu2.stop()
         mcu1.join()
         mcu2.join()
-      #  pinger1.stop()
-    #    pinger2.stop()
-    #    pinger1.join()
-    #    pinger2.join()
+      #  pingers.stop()
+    #    pingers.join()
     
     # Print final summary
-    
-    for mcu_name, results in mcu_results.items():
+    print()
+    print(aggregator.format_summary())
+
+    for mcu_name, results in aggregator.mcus.items():
         print(f"\nMCU {mcu_name}:")
         print(f"Status: {results['status']}")
         if 'white_list' in results:
@@ -122,3 +114,6 @@ if __name__ == "__main__":
         plotter.add_line(line)
     
     plotter.plot_all()
+
+    for line in shared_lines.values():
+        line.data_log.unlink()
@@ -1,14 +1,36 @@
 import random
-from multiprocessing import Process, Manager, Queue, Event, Value
+from multiprocessing import Process, Manager, Queue, Event, Value, RawValue
 from time import sleep, perf_counter
-from ctypes import c_bool
+from ctypes import Structure, c_double, c_int
+from functools import partial
+
+from timebase import Sleep, WaitUntil, run_realtime, run_realtime_all
+from edges import EdgeChannel
+from nets import mark_forked
+from arbitration import UniformSlots
+from event_log import (
+    NullEventLog, ROLES, LOGIC_START, CONCURRENT_START, SLOT, LINE_ACTIVE, STATE_CHANGED, SEND_SYN, CONFLICT,
+    SYN_SENT, SYN_ACCEPTED, SYN_TIMEOUT, WAIT_SYN_ACK, OTHER_LINE_HIGH, HIGH_WAIT_SYN_ACK, SYN_ACK_ACCEPTED,
+    ACK_SENT, SYN_ACK_TIMEOUT, SYN_ACK_SENT, WAIT_ACK, HIGH_WAIT_ACK, ACK_ACCEPTED, ACK_TIMEOUT, LINE_WORKS,
+    LINE_FAILED, RECEIVED_SYN, RECEIVED_SYN_ACK, RECEIVED_ACK, NO_STATE, VERIFY_START, RECEIVED_VERIFY,
+    LINE_VERIFIED, VERIFY_FAILED, DATA_RETRANSMIT, DATA_LINE_DOWN, CODED_START, CODE_SENT, CODE_DECODED,
+    CODE_TIMEOUT, LINE_MAPPED, EDGES_DROPPED,
+)
+from data_channel import ACK_BITS, encode_ack
 
 # Signal Timings (ms)
 SYN_DURATION = 500
 SYN_ACK_DURATION = 1000
 ACK_DURATION = 1500
+VERIFY_DURATION = 1250  # Confirms a cached or coded line, see _confirm
 TOLERANCE = 100
 
+# Data channel bits (data_channel.py), at least two tolerances from zero and from every other pulse width
+DATA_ZERO_DURATION = 250
+DATA_ONE_DURATION = 750
+DATA_GAP_DURATION = 50  # Low time after every bit
+DATA_FRAME_GAP = 300  # Silence that separates two frames
+
 LINE_SETTLE_DURATION = 50  # Duration to wait for line to settle after pulling high
 
 # Time Slots in ms
@@ -26,6 +48,8 @@ TIMEOUT_RESPONDER = 2.0  # Timeout for responder to wait for SYN
 TIMEOUT_SYN_ACK = 2.0  # Timeout for initiator to wait for SYN_ACK
 TIMEOUT_ACK = 2.5  # Timeout for responder to wait for ACK
 
+OWN_PULSE_GUARD = 0.2  # Edges within this many seconds after our own pulse are our own echo
+
 
 MAXIMUM_NUMBER_OF_FALSE_RESPONSES = 2  # Maximum number of false responses before giving up
 
@@ -33,6 +57,11 @@ ERROR_REASON_BLACKLISTED = 'blacklisted'
 ERROR_REASON_DISTURBED = 'disturbed'
 ERROR_REASON_TIMEOUT = 'timeout'
 
+DATA_BITS = ("DATA0", "DATA1")
+
+CODED_ATTEMPTS = 3  # Coded rounds without an answer before the per-line handshakes take over
+CODED_SLOT = 'coded'  # Line name the arbitration sees for the slot before a line code
+
 
 
 
@@ -50,6 +79,7 @@ class PinData:
         self.blacklisted = False # Flag to indicate if this pin is blacklisted
         self.successful = False  # Flag to indicate if this pin has been successfully tested
         self.error_reason = None  # Reason for failure, if any
+        self.peer_index = None  # Index of this line among the peer's lines, known after coded discovery
         
     def set_ack(self, value):
         self.ack = value
@@ -89,7 +119,8 @@ class PinData:
             'num_false_responses': self.num_false_responses,
             'blacklisted': self.blacklisted,
             'successful': self.successful,
-            'error_reason': self.error_reason
+            'error_reason': self.error_reason,
+            'peer_index': self.peer_index,
         }
     
     def __eq__(self, other):
@@ -104,10 +135,136 @@ class PinData:
                 self.blacklisted == other.blacklisted)
 
 
+class TimingProfile:
+    """Pulse widths, tolerance and timeouts of the handshake.
+
+    Pulse widths, tolerance and slots are in ms and timeouts in s, like the
+    module constants, which make up DEFAULT_TIMING. calibration.py derives
+    faster profiles from the pulse-width jitter measured on a backend.
+    """
+    PULSES = (  # Pulse type and the field of its width, classify() checks them in this order
+        ('SYN', 'syn_duration'),
+        ('SYN_ACK', 'syn_ack_duration'),
+        ('ACK', 'ack_duration'),
+        ('VERIFY', 'verify_duration'),
+        ('DATA0', 'data_zero_duration'),
+        ('DATA1', 'data_one_duration'),
+    )
+    FIELDS = (
+        'syn_duration', 'syn_ack_duration', 'ack_duration', 'tolerance', 'line_settle_duration',
+        'time_slots_ms', 'timeout_responder', 'timeout_syn_ack', 'timeout_ack', 'own_pulse_guard',
+        'verify_duration', 'data_zero_duration', 'data_one_duration', 'data_gap_duration', 'data_frame_gap',
+    )
+
+    def __init__(self, syn_duration=SYN_DURATION, syn_ack_duration=SYN_ACK_DURATION, ack_duration=ACK_DURATION,
+                 tolerance=TOLERANCE, line_settle_duration=LINE_SETTLE_DURATION, time_slots_ms=TIME_SLOTS_MS,
+                 timeout_responder=TIMEOUT_RESPONDER, timeout_syn_ack=TIMEOUT_SYN_ACK, timeout_ack=TIMEOUT_ACK,
+                 own_pulse_guard=OWN_PULSE_GUARD, verify_duration=VERIFY_DURATION,
+                 data_zero_duration=DATA_ZERO_DURATION, data_one_duration=DATA_ONE_DURATION,
+                 data_gap_duration=DATA_GAP_DURATION, data_frame_gap=DATA_FRAME_GAP):
+        self.syn_duration = syn_duration
+        self.syn_ack_duration = syn_ack_duration
+        self.ack_duration = ack_duration
+        self.tolerance = tolerance
+        self.line_settle_duration = line_settle_duration
+        self.time_slots_ms = list(time_slots_ms)
+        self.timeout_responder = timeout_responder
+        self.timeout_syn_ack = timeout_syn_ack
+        self.timeout_ack = timeout_ack
+        self.own_pulse_guard = own_pulse_guard
+        self.verify_duration = verify_duration
+        self.data_zero_duration = data_zero_duration
+        self.data_one_duration = data_one_duration
+        self.data_gap_duration = data_gap_duration
+        self.data_frame_gap = data_frame_gap
+
+    def scaled(self, factor):
+        """Same protocol with every duration multiplied by `factor`"""
+        values = self.to_dict()
+        for field, value in values.items():
+            if field == 'time_slots_ms':
+                values[field] = [slot * factor for slot in value]
+            else:
+                values[field] = value * factor
+        return TimingProfile(**values)
+
+    def pulse_widths(self):
+        """(pulse type, nominal width in ms) of every pulse, in the order classify() checks them"""
+        return [(pulse, getattr(self, field)) for pulse, field in self.PULSES]
+
+    def classify(self, duration):
+        """Pulse type of a pulse `duration` ms wide, None if it is none of ours"""
+        for pulse, field in self.PULSES:
+            if abs(duration - getattr(self, field)) < self.tolerance:
+                return pulse
+        return None
+
+    @property
+    def bit_time(self):
+        """Mean time (s) of one data bit, pulse and gap"""
+        return ((self.data_zero_duration + self.data_one_duration) / 2 + self.data_gap_duration) / 1000.0
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{field: values[field] for field in cls.FIELDS if field in values})
+
+    def __eq__(self, other):
+        return isinstance(other, TimingProfile) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return (f"TimingProfile(syn={self.syn_duration:g}ms, syn_ack={self.syn_ack_duration:g}ms, "
+                f"ack={self.ack_duration:g}ms, tolerance={self.tolerance:g}ms)")
+
+
+DEFAULT_TIMING = TimingProfile()
+
+
+class MCUStatus(Structure):
+    """State of the sequential FSM, in shared memory.
+
+    Only the logic process writes it. Anyone else reads the fields directly,
+    without a lock or a round trip to the Manager.
+    """
+    _fields_ = [
+        ('state', c_int),
+        ('last_sent_time', c_double),  # Clock time (s) our last pulse ended
+    ]
+
+
+class LineHandshake:
+    """Handshake state of one line while an MCU tests its lines concurrently"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = INIT
+        self.role = ''
+        self.received_syn = False
+        self.received_syn_ack = False
+        self.received_ack = False
+        self.received_verify = 0
+        self.last_sent_time = 0.0
+        self.code = []  # Bits of the peer's line code during coded discovery
+        self.code_fall = None  # When the latest of them ended
+
+
 class MCU:
-    def __init__(self, name, line_names, manager, output_queue=None):
+    def __init__(self, name, line_names, output_queue=None, clock=perf_counter, sleep=sleep, concurrent=False, timing=DEFAULT_TIMING, instrumentation=None, event_log=None, arbitration=None, wiring_cache=None, data_channel=None, coded=False):
         self.name = name
-        self.manager = manager
+        self.concurrent = concurrent  # Run one handshake per line at the same time instead of one line after another
+        self._clock = clock  # Injectable so the FSM can run against a virtual clock
+        self._sleep = sleep
+        self.timing = timing  # TimingProfile shared by the FSM and the pulse classifier
+        self.instrumentation = instrumentation  # Optional Instrumentation, None costs nothing
+        self.arbitration = arbitration if arbitration is not None else UniformSlots()  # Picks the INIT slot
+        self.wiring_cache = wiring_cache  # Optional WiringCache, cached lines are only confirmed
+        self.data_channel = data_channel  # Optional DataChannel, verified lines then carry data
+        self.coded = coded  # Map all lines with binary-coded rounds first, see _discover_coded
+        self.data_requests = Queue() if data_channel is not None else None  # Messages of send()
+        self.event_log = event_log if event_log is not None else NullEventLog()
         self.interrupt_queue = Queue()
         self.interrupt_event = Event()
         
@@ -117,28 +274,38 @@ class MCU:
     
         
         self.all_lines = {ln: obj for ln, obj in line_names}
+        self._line_names = list(self.all_lines.keys())
+
+        # Lines push their edges to us, subscribe before start() forks the processes
+        self.edges = EdgeChannel()
+        for index, line in enumerate(self.all_lines.values()):
+            line.subscribe(partial(self._publish_edge, index))
         
         self.pin_data = {name: PinData(name, line) for name, line in self.all_lines.items()}
 
         self.current_line = None
-        self.state = manager.Value('i', INIT)
-        self.role = manager.Value('u', '')
+        self.role = ''
+        # Read by other processes, everything else of the sequential FSM stays in the logic process
+        self.status = RawValue(MCUStatus)
+        self.status.state = INIT
 
-        self.successful_lines = manager.list()
-        self.start_times = manager.dict()
         self.previous_states = {name: 0 for name, _ in line_names}
-        self.last_sent_time = manager.Value('d', 0.0)
+        self.rising_edges = {name: None for name, _ in line_names}
 
-        self.received_syn = manager.Value(c_bool, False)
-        self.received_syn_on = manager.Value('u', '')
-        
-        self.received_syn_ack = manager.Value(c_bool, False)
-        self.received_syn_ack_on = manager.Value('u', '')
-        
-        self.received_ack = manager.Value(c_bool, False)
-        self.received_ack_on = manager.Value('u', '')
-        
-        self.set_curent_line = manager.Value(c_bool, False)
+        self.received_syn = False
+        self.received_syn_on = ''
+        self.received_syn_ack = False
+        self.received_syn_ack_on = ''
+        self.received_ack = False
+        self.received_ack_on = ''
+
+        self.handshakes = {name: LineHandshake() for name in self.all_lines}
+        self._completed_sent = False
+        self._metrics_sent = False
+        self._wiring_stored = False
+        self._verifying = wiring_cache is not None or coded  # _prelude runs before the per-line handshakes
+        self._coding = False  # Bits on the lines are a line code, not data
+        self._code_window = None  # Start and end of our own line code, its echo is not the peer's
 
     def _send_pin_data_to_main(self, pin_data, status):
         """Send pin data to main process via output queue"""
@@ -147,7 +314,7 @@ class MCU:
                 'mcu_name': self.name,
                 'pin_data': pin_data.to_dict(),
                 'status': status,
-                'timestamp': perf_counter()
+                'timestamp': self._clock()
             }
             self.output_queue.put(data)
 
@@ -156,6 +323,7 @@ class MCU:
         return self.all_lines.get(self.current_line)
 
     def start(self):
+        mark_forked(self.all_lines.values())
         self.p1 = Process(target=self._run_logic)
         self.p2 = Process(target=self._peripheral)
         self.p1.start()
@@ -170,8 +338,44 @@ class MCU:
         self.stop_event.set()
         self.interrupt_event.set()
 
+    def send(self, data):
+        """Queue a message for the data channel, it goes out once lines are verified"""
+        if self.data_channel is None:
+            raise ValueError(f"MCU {self.name} has no data channel")
+        self.data_requests.put(bytes(data))
+
     def _run_logic(self):
-        print(f"TEST: {self.name} starting logic with {len(self.all_lines)} lines")
+        try:
+            if self.concurrent:
+                self._log(CONCURRENT_START, value=len(self.all_lines))
+                run_realtime_all(self._logic_routines(), self._clock, self._sleep)
+            elif self.data_channel is not None:
+                run_realtime_all(self._logic_routines(), self._clock, self._sleep)
+            else:
+                run_realtime(self._logic(), self._clock, self._sleep)
+        finally:
+            # The process ends with os._exit, nothing else flushes the log
+            self.event_log.flush()
+
+    def _log(self, event, line=None, state=NO_STATE, value=0.0):
+        self.event_log.log(self._clock(), self.name, line, event, state, value)
+
+    def _logic_routines(self):
+        if self.concurrent:
+            routines = [self._line_logic(name) for name in self.all_lines]
+            if self._verifying:
+                routines.insert(0, self._prelude())
+        else:
+            routines = [self._logic()]
+        if self.data_channel is not None:
+            routines += [self._data_line(name) for name in self.all_lines]
+        return routines
+
+    def _logic(self):
+        self._log(LOGIC_START, value=len(self.all_lines))
+        instruments = self.instrumentation
+        if self._verifying:
+            yield from self._prelude()
 
         
         slot = None
@@ -182,260 +386,836 @@ class MCU:
 
         while not all(self.pin_data[name].is_tested() for name in self.pin_data) and not self.stop_event.is_set():
             self._process_interrupts()
-            state = self.state.value
+            state = self.status.state
+            if instruments is not None:
+                instruments.observe_state(None, state, self._clock())
 
             if state == INIT:
                 available = [ln for ln in self.all_lines.keys() if not self.pin_data[ln].is_tested()]
                 
                 self.current_line = random.choice(available)
-                slot = random.choice(TIME_SLOTS_MS)
-                slot_start = perf_counter()
+                slot = self.arbitration.slot(self.name, self.current_line, self.timing.time_slots_ms)
+                slot_start = self._clock()
+                slot_end = slot_start + slot / 1000.0
                 responding_timeout = None
-                print(f"[{self.name}] Time slot: {slot} ms for line {self.current_line}", flush=True)
+                self._log(SLOT, self.current_line, INIT, slot)
                 
                 
 
-                while (perf_counter() - slot_start) < slot / 1000.0 and self.state.value == INIT:
-                    active_lines = [name for name, line in self.all_lines.items() if line.state() == 1]
+                while self._clock() < slot_end and self.status.state == INIT:
+                    # Lines with a result are never entered again, whatever pulses on them
+                    active_lines = [name for name, line in self.all_lines.items()
+                                    if line.state() == 1 and not self.pin_data[name].is_tested()]
                     
                     if active_lines and not self.pin_data[active_lines[0]].is_blacklisted():
                         #TODO: How to handle multiple active lines?
     
                         self.current_line = active_lines[0]
-                        print(f"[{self.name}] Line active on {self.current_line}, entering MAYBE_RESPONDER state", flush=True)
-                        self.state.value = MAYBE_RESPONDER
+                        self._log(LINE_ACTIVE, self.current_line, INIT)
+                        self.arbitration.observed(self.current_line)
+                        self.status.state = MAYBE_RESPONDER
                         break
-                    sleep(0.0001)
+                    yield WaitUntil(slot_end)
+                if instruments is not None:
+                    instruments.slot_wait.add(self._clock() - slot_start)
 
-                if self.state.value != INIT:
-                    print(f"[{self.name}] Interrupt processed, state is now {self.state.value}", flush=True)
+                if self.status.state != INIT:
+                    self._log(STATE_CHANGED, self.current_line, self.status.state)
                     continue
                 
-                self.set_curent_line.value = True
-                print(f"[{self.name}] Send SYN on {self.current_line}", flush=True)
+                self._log(SEND_SYN, self.current_line, INIT)
                 self.pin_data[self.current_line].set_syn(True)
                  
                 self.pin_data[self.current_line].set_role('initiator')
                 self.current_line_obj.pull_high(self.name)
                 
-                syn_start = perf_counter()
-                syn_end = syn_start + (SYN_DURATION / 1000.0)
+                syn_start = self._clock()
+                syn_end = syn_start + (self.timing.syn_duration / 1000.0)
                 
                 confict_detected = False
                 
-                while perf_counter() < syn_end:
+                while self._clock() < syn_end:
                     other_active_lines = [name for name, line in self.all_lines.items() 
-                                        if name != self.current_line and line.state() == 1]
+                                        if name != self.current_line and line.state() == 1
+                                        and not self.pin_data[name].is_tested()]
                     
                     if other_active_lines and not self.pin_data[other_active_lines[0]].is_blacklisted():
                         self.current_line_obj.release(self.name)
-                        self.set_curent_line.value = False
                         
                         self.current_line = other_active_lines[0]
-                        print(f"[{self.name}] Conflict detected on {self.current_line}, switching to MAYBE_RESPONDER", flush=True)
-                        self.state.value = MAYBE_RESPONDER
+                        self._log(CONFLICT, self.current_line, INIT)
+                        self.arbitration.collided(self.current_line)
+                        self.status.state = MAYBE_RESPONDER
                         confict_detected = True
                         break
+                    yield WaitUntil(syn_end)
                         
                 if not confict_detected:
-                    self.last_sent_time.value = perf_counter()
+                    self.status.last_sent_time = self._clock()
                     self.current_line_obj.release(self.name)
-                    print(f"[{self.name}] SYN sent on {self.current_line}", flush=True)
+                    self._log(SYN_SENT, self.current_line, INIT)
     
-                    self.state.value = INITIATOR
-                    self.role.value = 'initiator'
+                    self.status.state = INITIATOR
+                    self.role = 'initiator'
                     self.pin_data[self.current_line].set_role('initiator')
                 
             elif state == MAYBE_RESPONDER:
-                responding_timeout = perf_counter() + TIMEOUT_RESPONDER
+                responding_timeout = self._clock() + self.timing.timeout_responder
                 has_seen_signal = False
 
-                while perf_counter() < responding_timeout:
+                while self._clock() < responding_timeout:
                     self._process_interrupts()
 
             
-                    if self.received_syn.value and self.received_syn_on.value == self.current_line:
-                        print(f"[{self.name}] SYN received on {self.current_line}, switching to RESPONDER", flush=True)
-                        self.received_syn.value = False
-                        self.state.value = RESPONDER
-                        self.role.value = 'responder'
+                    if self.received_syn and self.received_syn_on == self.current_line:
+                        self._log(SYN_ACCEPTED, self.current_line, MAYBE_RESPONDER)
+                        self.received_syn = False
+                        self.status.state = RESPONDER
+                        self.role = 'responder'
                         self.pin_data[self.current_line].set_role('responder')
                         break
+                    yield WaitUntil(responding_timeout)
                 else:
-                    print(f"[{self.name}] Timeout waiting for SYN on {self.current_line}, returning to INIT", flush=True)
+                    self._log(SYN_TIMEOUT, self.current_line, MAYBE_RESPONDER)
+                    self.arbitration.collided(self.current_line)
                     self.pin_data[self.current_line].increment_false_responses()
                     self._reset_state()
                         
             elif state == INITIATOR:
-                timeout = perf_counter() + TIMEOUT_SYN_ACK
-                print(f"[{self.name}] Waiting for SYN_ACK on {self.current_line}", flush=True)
+                timeout = self._clock() + self.timing.timeout_syn_ack
+                self._log(WAIT_SYN_ACK, self.current_line, INITIATOR)
                 has_seen_signal = False
 
-                while perf_counter() < timeout:
+                while self._clock() < timeout:
                     self._process_interrupts()
                     
                     other_active_lines = [name for name, line in self.all_lines.items() 
-                                        if name != self.current_line and line.state() == 1]
+                                        if name != self.current_line and line.state() == 1
+                                        and not self.pin_data[name].is_tested()]
                     if other_active_lines and not self.pin_data[other_active_lines[0]].is_blacklisted():
                         self.current_line = other_active_lines[0]
-                        print(f"[{self.name}] Other line {self.current_line} is high, switching to MAYBE_RESPONDER", flush=True)
-                        self.state.value = MAYBE_RESPONDER
+                        self._log(OTHER_LINE_HIGH, self.current_line, INITIATOR)
+                        self.status.state = MAYBE_RESPONDER
                         break
                     
                     if self.current_line and self.current_line_obj and self.current_line_obj.state() == 1:
                         if not has_seen_signal:
-                            print(f"[{self.name}] Line {self.current_line} is high, waiting for SYN_ACK", flush=True)
-                            timeout = perf_counter() + (SYN_ACK_DURATION + TOLERANCE) / 1000.0
+                            self._log(HIGH_WAIT_SYN_ACK, self.current_line, INITIATOR)
+                            timeout = self._clock() + (self.timing.syn_ack_duration + self.timing.tolerance) / 1000.0
                             has_seen_signal = True
                     
-                    if self.received_syn_ack.value and self.received_syn_ack_on.value == self.current_line:
-                        print(f"[{self.name}] SYN_ACK received on {self.current_line}", flush=True)
+                    if self.received_syn_ack and self.received_syn_ack_on == self.current_line:
+                        self._log(SYN_ACK_ACCEPTED, self.current_line, INITIATOR)
                         self.pin_data[self.current_line].set_syn_ack(True)
-                        self.received_syn_ack.value = False
-                        self.received_syn_ack_on.value = ''
+                        self.received_syn_ack = False
+                        self.received_syn_ack_on = ''
                         
-                        sleep(LINE_SETTLE_DURATION / 1000.0)
+                        yield Sleep(self.timing.line_settle_duration / 1000.0)
                         
-                        self.set_curent_line.value = True
                         self.current_line_obj.pull_high(self.name)
-                        sleep(ACK_DURATION / 1000.0)
+                        yield Sleep(self.timing.ack_duration / 1000.0)
                         self.pin_data[self.current_line].set_ack(True)
-                        self.last_sent_time.value = perf_counter()
+                        self.status.last_sent_time = self._clock()
                         self.current_line_obj.release(self.name)
-                        self.set_curent_line.value = False
                 
-                        self.state.value = SUCCESS
-                        print(f"[{self.name}] ACK sent on {self.current_line}", flush=True)
+                        self.status.state = SUCCESS
+                        self._log(ACK_SENT, self.current_line, INITIATOR)
                         break
+                    yield WaitUntil(timeout)
                 else:
-                    print(f"[{self.name}] Timeout waiting for SYN_ACK on {self.current_line}", flush=True)
-                    self.state.value = FAILED
-                    self.received_syn_ack.value = False
-                    self.received_syn_ack_on.value = ''
+                    self._log(SYN_ACK_TIMEOUT, self.current_line, INITIATOR)
+                    self.arbitration.collided(self.current_line)
+                    self.status.state = FAILED
+                    self.received_syn_ack = False
+                    self.received_syn_ack_on = ''
 
             elif state == RESPONDER:
-                self.last_sent_time.value = perf_counter()
+                self.status.last_sent_time = self._clock()
                 
-                self.set_curent_line.value = True
                 self.current_line_obj.pull_high(self.name)
-                sleep(SYN_ACK_DURATION / 1000.0)
+                yield Sleep(self.timing.syn_ack_duration / 1000.0)
                 self.pin_data[self.current_line].set_syn_ack(True)
-                self.last_sent_time.value = perf_counter()
+                self.status.last_sent_time = self._clock()
                 self.current_line_obj.release(self.name)
-                self.set_curent_line.value = False
-                print(f"[{self.name}] Send SYN_ACK on {self.current_line}", flush=True)
+                self._log(SYN_ACK_SENT, self.current_line, RESPONDER)
                 
-                sleep(LINE_SETTLE_DURATION / 1000.0)
+                yield Sleep(self.timing.line_settle_duration / 1000.0)
 
-                responding_timeout = perf_counter() + TIMEOUT_ACK
+                responding_timeout = self._clock() + self.timing.timeout_ack
                 
-                print(f"[{self.name}] Waiting for ACK on {self.current_line}", flush=True)
+                self._log(WAIT_ACK, self.current_line, RESPONDER)
                 has_seen_signal = False
 
-                while perf_counter() < responding_timeout:
+                while self._clock() < responding_timeout:
                     self._process_interrupts()
                     
                     if self.current_line and self.current_line_obj and self.current_line_obj.state() == 1:
                         if not has_seen_signal:
-                            print(f"[{self.name}] Line {self.current_line} is high, waiting for ACK", flush=True)
-                            responding_timeout = perf_counter() + (ACK_DURATION + TOLERANCE) / 1000.0
+                            self._log(HIGH_WAIT_ACK, self.current_line, RESPONDER)
+                            responding_timeout = self._clock() + (self.timing.ack_duration + self.timing.tolerance) / 1000.0
                             has_seen_signal = True
                             
-                    if self.received_ack.value and self.received_ack_on.value == self.current_line:
+                    if self.received_ack and self.received_ack_on == self.current_line:
                         self.pin_data[self.current_line].set_ack(True)
-                        self.received_ack.value = False
-                        self.received_ack_on.value = ''
-                        print(f"[{self.name}] ACK received on {self.current_line}", flush=True)
-                        self.state.value = SUCCESS
+                        self.received_ack = False
+                        self.received_ack_on = ''
+                        self._log(ACK_ACCEPTED, self.current_line, RESPONDER)
+                        self.status.state = SUCCESS
                         break
+                    yield WaitUntil(responding_timeout)
                 else:
-                    print(f"[{self.name}] Timeout waiting for ACK on {self.current_line}", flush=True)
-                    self.received_ack.value = False
-                    self.received_ack_on.value = ''
-                    self.state.value = FAILED
+                    self._log(ACK_TIMEOUT, self.current_line, RESPONDER)
+                    self.received_ack = False
+                    self.received_ack_on = ''
+                    self.status.state = FAILED
 
             elif state == SUCCESS:
-                print(f"[{self.name}] ✅ {self.current_line} works as {self.role.value}", flush=True)
-                self.pin_data[self.current_line].set_role(self.role.value)
+                self._log(LINE_WORKS, self.current_line, SUCCESS, ROLES.index(self.role))
+                self.arbitration.succeeded(self.current_line)
+                self.pin_data[self.current_line].set_role(self.role)
                 self.pin_data[self.current_line].set_successful(True)
                 
                 self._send_pin_data_to_main(self.pin_data[self.current_line], 'WORKING')
                 self._reset_state()
 
             elif state == FAILED:
-                print(f"[{self.name}] ❌ {self.current_line} failed as {self.role.value}", flush=True)
-                self.pin_data[self.current_line].set_blacklisted()
+                self._log(LINE_FAILED, self.current_line, FAILED, ROLES.index(self.role))
+                self.pin_data[self.current_line].set_blacklisted(True)
                 
                 self._send_pin_data_to_main(self.pin_data[self.current_line], 'FAILED')
                 
                 self._reset_state()
-        if self.output_queue:
+        self._send_completed()
+        self._store_wiring()
+        self._send_metrics()
+
+    def _send_completed(self):
+        if self.output_queue and not self._completed_sent:
             if all(pd.is_tested() for pd in self.pin_data.values()):
+                self._completed_sent = True
                 self.output_queue.put({
                     'mcu_name': self.name,
                     'status': 'COMPLETED',
-                    'timestamp': perf_counter(),
+                    'timestamp': self._clock(),
                     'white_list': [pd.to_dict() for pd in self.pin_data.values() if pd.role == 'initiator' and pd.successful],
-                    'black_list': [pd.to_dict() for pd in self.pin_data.values() if pd.is_blacklisted()]
+                    'black_list': [pd.to_dict() for pd in self.pin_data.values() if pd.is_blacklisted()],
+                    'edges_dropped': self.edges.dropped,
                 })
 
+    def _store_wiring(self):
+        if self.wiring_cache is None or self._wiring_stored:
+            return
+        if not all(pd.is_tested() for pd in self.pin_data.values()):
+            return
+        self._wiring_stored = True
+        self.wiring_cache.store(
+            self.name, self._line_names,
+            white_list=[name for name, pd in self.pin_data.items() if pd.successful and pd.role == 'initiator'],
+            responder_list=[name for name, pd in self.pin_data.items() if pd.successful and pd.role == 'responder'],
+            black_list=[name for name, pd in self.pin_data.items() if pd.is_blacklisted()],
+        )
+
+    def _prelude(self):
+        """Confirms the cached lines and maps the rest with coded discovery, before any per-line handshake"""
+        try:
+            if self.wiring_cache is not None:
+                yield from self._verify_cached()
+            if self.coded:
+                yield from self._discover_coded()
+        finally:
+            self._verifying = False
+            # Colliding pulses of the prelude can look like handshake pulses, the handshakes start clean
+            self._reset_state()
+            for hs in self.handshakes.values():
+                hs.reset()
+
+    def _verify_cached(self):
+        """Confirm the cached working lines, a line that fails goes through the full discovery afterwards"""
+        wiring = self.wiring_cache.load(self.name, self._line_names)
+        if wiring is None:
+            return
+        initiated = [name for name in wiring['white_list'] if name in self.all_lines]
+        responded = [name for name in wiring['responder_list'] if name in self.all_lines]
+        self._log(VERIFY_START, value=len(initiated) + len(responded))
+
+        yield from self._confirm(initiated, responded)
+        for name in initiated + responded:
+            if not self.pin_data[name].successful:
+                self._log(VERIFY_FAILED, name)
+
+    def _confirm(self, initiated, responded):
+        """Three rounds of VERIFY pulses, all lines at once.
+
+        The initiator of every line sends VERIFY, the responder echoes it and
+        the initiator confirms the echo, like SYN, SYN_ACK and ACK. Each side
+        waits for a round at most as long as for the matching handshake
+        pulse. The lines that make it through all three rounds are working.
+        """
+        for name in initiated + responded:
+            self.handshakes[name].received_verify = 0
+        yield from self._verify_pulse(initiated)
+        requested = yield from self._wait_verify(responded, 1, self.timing.timeout_responder)
+        yield from self._verify_pulse(requested)
+        echoed = yield from self._wait_verify(initiated, 1, self.timing.timeout_syn_ack)
+        yield from self._verify_pulse(echoed)
+        confirmed = yield from self._wait_verify(requested, 2, self.timing.timeout_ack)
+
+        for names, role in ((echoed, 'initiator'), (confirmed, 'responder')):
+            for name in names:
+                pin = self.pin_data[name]
+                pin.set_role(role)
+                pin.set_successful(True)
+                self._log(LINE_VERIFIED, name, SUCCESS, ROLES.index(role))
+                self._send_pin_data_to_main(pin, 'WORKING')
+
+    def _discover_coded(self):
+        """Map all untested lines at once with a binary code, then confirm the map.
+
+        Every line sends its index among our lines, bit k in round k, and a
+        parity bit, as one data bit pulse per round (DATA0/DATA1 widths). The
+        MCU whose slot ends first sends its code on all lines, the peer
+        decodes which of its lines carries which index and answers with its
+        own code on those lines. The answer has odd parity, so a code sent
+        by both MCUs at once is not taken for an answer. Crossed wiring only
+        permutes the indices, a bridge or noise breaks the parity or repeats
+        an index and the line is left out. A code takes ceil(log2 N) + 1
+        rounds, so the mapping grows with the logarithm of the line count.
+        One _confirm pass then checks the mapped lines in both directions,
+        the sender of the first code is their initiator. Lines that are not
+        mapped or not confirmed go through the per-line handshakes afterwards.
+        """
+        names = [name for name in self._line_names if not self.pin_data[name].is_tested()]
+        if not names:
+            return
+        self._log(CODED_START, value=len(names))
+        for attempt in range(1, CODED_ATTEMPTS + 1):
+            if self.stop_event.is_set():
+                return
+            for name in names:
+                self.handshakes[name].code = []
+            self._coding = True
+            slot_end = self._clock() + self.arbitration.slot(self.name, CODED_SLOT, self.timing.time_slots_ms) / 1000.0
+            observed = False
+            while self._clock() < slot_end and not self.stop_event.is_set():
+                self._drain_interrupts()
+                if any(self.all_lines[name].state() == 1 for name in names):
+                    observed = True
+                    break
+                yield WaitUntil(slot_end)
+
+            if observed:
+                self.arbitration.observed(CODED_SLOT)
+                peers = yield from self._receive_code(names, self.timing.timeout_responder, answer=False)
+                if peers:
+                    yield from self._send_code(list(peers), answer=True)
+            else:
+                yield from self._send_code(names, answer=False)
+                peers = yield from self._receive_code(names, self.timing.timeout_syn_ack, answer=True)
+            self._coding = False
+            if not peers:
+                self._log(CODE_TIMEOUT, value=attempt)
+                self.arbitration.collided(CODED_SLOT)
+                continue
+
+            for name, index in peers.items():
+                self.pin_data[name].peer_index = index
+                self._log(LINE_MAPPED, name, value=index)
+            mapped = list(peers)
+            yield from self._confirm([] if observed else mapped, mapped if observed else [])
+            for name in mapped:
+                if self.pin_data[name].successful:
+                    self.arbitration.succeeded(name)
+                else:
+                    self.pin_data[name].peer_index = None
+            return
+
+    def _send_code(self, names, answer):
+        """Send the line code of every line in `names`, each line runs through its bits on its own"""
+        bits = max(1, (len(self._line_names) - 1).bit_length())
+        zero = self.timing.data_zero_duration / 1000.0
+        one = self.timing.data_one_duration / 1000.0
+        gap = self.timing.data_gap_duration / 1000.0
+
+        indices = {name: index for index, name in enumerate(self._line_names)}
+        start = self._clock()
+        edges = []  # (time after start, rising, line name)
+        for name in names:
+            code = [indices[name] >> k & 1 for k in range(bits)]
+            t = 0.0
+            for bit in code + [(sum(code) + answer) & 1]:
+                edges.append((t, True, name))
+                t += one if bit else zero
+                edges.append((t, False, name))
+                t += gap
+        edges.sort()
+
+        self._code_window = (start, float('inf'))
+        for at, rising, name in edges:
+            if start + at > self._clock():
+                yield Sleep(start + at - self._clock())
+            if rising:
+                self.all_lines[name].pull_high(self.name)
+            else:
+                self.all_lines[name].release(self.name)
+        self._code_window = (start, self._clock())
+        self._log(CODE_SENT, value=len(names))
+
+    def _receive_code(self, names, timeout, answer):
+        """Line name -> peer's index for the lines of `names` that carried a valid line code.
+
+        Waits up to `timeout` seconds for the first bit, then until all lines
+        were low for a frame gap.
+        """
+        frame_gap = self.timing.data_frame_gap / 1000.0
+        deadline = self._clock() + timeout
+        high = None  # When a line was last seen high, its fall may still be on the way from the peripheral
+        while not self.stop_event.is_set():
+            self._drain_interrupts()
+            falls = [self.handshakes[name].code_fall for name in names if self.handshakes[name].code]
+            now = self._clock()
+            if any(self.all_lines[name].state() == 1 for name in names):
+                high = now
+                yield WaitUntil(now + frame_gap)  # A one is longer than the frame gap
+            elif falls:
+                quiet = max(falls + [high or 0.0]) + frame_gap
+                if now >= quiet:
+                    break
+                yield WaitUntil(quiet)
+            elif now >= deadline:
+                return {}
+            else:
+                yield WaitUntil(deadline)
+
+        codes = {name: self.handshakes[name].code for name in names if self.handshakes[name].code}
+        if not codes:
+            return {}
+        lengths = [len(code) for code in codes.values()]
+        length = max(set(lengths), key=lengths.count)  # Every line of the peer sends the same number of bits
+        peers = {}
+        for name, code in codes.items():
+            if len(code) == length and length >= 2 and sum(code) % 2 == answer:
+                peers[name] = sum(bit << k for k, bit in enumerate(code[:-1]))
+        indices = list(peers.values())
+        peers = {name: index for name, index in peers.items() if indices.count(index) == 1}
+        self._log(CODE_DECODED, value=len(peers))
+        return peers
+
+    def _on_code_bit(self, line_name, edge_type, duration, timestamp):
+        rise = timestamp - duration / 1000.0
+        window = self._code_window
+        if window is not None and window[0] - self.timing.tolerance / 1000.0 <= rise <= window[1]:
+            return  # Our own code, the rise is measured back from the fall and may come out a bit early
+        hs = self.handshakes[line_name]
+        if hs.code_fall is not None and rise - hs.code_fall > self.timing.data_frame_gap / 1000.0:
+            hs.code = []  # Left over from an earlier code
+        hs.code.append(int(edge_type == "DATA1"))
+        hs.code_fall = timestamp
+
+    def _drain_interrupts(self):
+        if self.concurrent:
+            self._route_interrupts()
+        else:
+            self._process_interrupts()
+
+    def _verify_pulse(self, names):
+        if not names:
+            return
+        for name in names:
+            self.all_lines[name].pull_high(self.name)
+        yield Sleep(self.timing.verify_duration / 1000.0)
+        for name in names:
+            self.handshakes[name].last_sent_time = self._clock()
+            self.all_lines[name].release(self.name)
+
+    def _wait_verify(self, names, count, timeout):
+        """Lines of `names` that received `count` VERIFY pulses within `timeout` seconds"""
+        deadline = self._clock() + timeout
+        while True:
+            self._drain_interrupts()
+            received = [name for name in names if self.handshakes[name].received_verify >= count]
+            if len(received) == len(names) or self._clock() >= deadline or self.stop_event.is_set():
+                return received
+            yield WaitUntil(deadline)
+
+    def _on_verify(self, line_name, timestamp):
+        hs = self.handshakes[line_name]
+        # Our own pulse ends when we release the line, the peer's at least one pulse width later
+        if abs(timestamp - hs.last_sent_time) * 1000 < self.timing.verify_duration / 2:
+            return
+        self._log(RECEIVED_VERIFY, line_name)
+        hs.received_verify += 1
+
+    def _send_metrics(self):
+        if self.instrumentation is not None and not self._metrics_sent:
+            self._metrics_sent = True
+            self.instrumentation.emit(self.name, self.output_queue, self._clock())
+
+    def _line_logic(self, name):
+        """Handshake FSM for a single line, one of these runs per line in concurrent mode"""
+        line = self.all_lines[name]
+        pin = self.pin_data[name]
+        hs = self.handshakes[name]
+        instruments = self.instrumentation
+
+        # The cached lines are confirmed and coded discovery maps the lines first, in the _prelude routine
+        while self._verifying and not self.stop_event.is_set():
+            yield WaitUntil(self._clock() + self.timing.line_settle_duration / 1000.0)
+
+        while not pin.is_tested() and not self.stop_event.is_set():
+            self._route_interrupts()
+            if instruments is not None:
+                instruments.observe_state(name, hs.state, self._clock())
+
+            if hs.state == INIT:
+                slot = self.arbitration.slot(self.name, name, self.timing.time_slots_ms)
+                slot_start = self._clock()
+                slot_end = slot_start + slot / 1000.0
+
+                while self._clock() < slot_end:
+                    if line.state() == 1 and not pin.is_blacklisted():
+                        self._log(LINE_ACTIVE, name, INIT)
+                        self.arbitration.observed(name)
+                        hs.state = MAYBE_RESPONDER
+                        break
+                    yield WaitUntil(slot_end)
+                if instruments is not None:
+                    instruments.slot_wait.add(self._clock() - slot_start)
+                if hs.state != INIT:
+                    continue
+
+                self._log(SEND_SYN, name, INIT)
+                pin.set_syn(True)
+                pin.set_role('initiator')
+                line.pull_high(self.name)
+                yield Sleep(self.timing.syn_duration / 1000.0)
+                hs.last_sent_time = self._clock()
+                line.release(self.name)
+                hs.state = INITIATOR
+                hs.role = 'initiator'
+
+            elif hs.state == MAYBE_RESPONDER:
+                timeout = self._clock() + self.timing.timeout_responder
+
+                while self._clock() < timeout:
+                    self._route_interrupts()
+                    if hs.received_syn:
+                        self._log(SYN_ACCEPTED, name, MAYBE_RESPONDER)
+                        hs.received_syn = False
+                        hs.state = RESPONDER
+                        hs.role = 'responder'
+                        pin.set_role('responder')
+                        break
+                    yield WaitUntil(timeout)
+                else:
+                    self._log(SYN_TIMEOUT, name, MAYBE_RESPONDER)
+                    self.arbitration.collided(name)
+                    pin.increment_false_responses()
+                    hs.reset()
+
+            elif hs.state == INITIATOR:
+                timeout = self._clock() + self.timing.timeout_syn_ack
+                has_seen_signal = False
+
+                while self._clock() < timeout:
+                    self._route_interrupts()
+                    if line.state() == 1 and not has_seen_signal:
+                        timeout = self._clock() + (self.timing.syn_ack_duration + self.timing.tolerance) / 1000.0
+                        has_seen_signal = True
+
+                    if hs.received_syn_ack:
+                        self._log(SYN_ACK_ACCEPTED, name, INITIATOR)
+                        pin.set_syn_ack(True)
+                        hs.received_syn_ack = False
+
+                        yield Sleep(self.timing.line_settle_duration / 1000.0)
+                        line.pull_high(self.name)
+                        yield Sleep(self.timing.ack_duration / 1000.0)
+                        pin.set_ack(True)
+                        hs.last_sent_time = self._clock()
+                        line.release(self.name)
+                        hs.state = SUCCESS
+                        break
+                    yield WaitUntil(timeout)
+                else:
+                    self._log(SYN_ACK_TIMEOUT, name, INITIATOR)
+                    self.arbitration.collided(name)
+                    hs.state = FAILED
+
+            elif hs.state == RESPONDER:
+                hs.last_sent_time = self._clock()
+                line.pull_high(self.name)
+                yield Sleep(self.timing.syn_ack_duration / 1000.0)
+                pin.set_syn_ack(True)
+                hs.last_sent_time = self._clock()
+                line.release(self.name)
+                self._log(SYN_ACK_SENT, name, RESPONDER)
+
+                yield Sleep(self.timing.line_settle_duration / 1000.0)
+
+                timeout = self._clock() + self.timing.timeout_ack
+                has_seen_signal = False
+
+                while self._clock() < timeout:
+                    self._route_interrupts()
+                    if line.state() == 1 and not has_seen_signal:
+                        timeout = self._clock() + (self.timing.ack_duration + self.timing.tolerance) / 1000.0
+                        has_seen_signal = True
+
+                    if hs.received_ack:
+                        self._log(ACK_ACCEPTED, name, RESPONDER)
+                        pin.set_ack(True)
+                        hs.received_ack = False
+                        hs.state = SUCCESS
+                        break
+                    yield WaitUntil(timeout)
+                else:
+                    self._log(ACK_TIMEOUT, name, RESPONDER)
+                    hs.state = FAILED
+
+            elif hs.state == SUCCESS:
+                self._log(LINE_WORKS, name, SUCCESS, ROLES.index(hs.role))
+                self.arbitration.succeeded(name)
+                pin.set_role(hs.role)
+                pin.set_successful(True)
+                self._send_pin_data_to_main(pin, 'WORKING')
+                hs.reset()
+
+            elif hs.state == FAILED:
+                self._log(LINE_FAILED, name, FAILED, ROLES.index(hs.role))
+                pin.set_blacklisted(True)
+                self._send_pin_data_to_main(pin, 'FAILED')
+                hs.reset()
+
+        self._send_completed()
+        self._store_wiring()
+        if all(pd.is_tested() for pd in self.pin_data.values()) or self.stop_event.is_set():
+            self._send_metrics()
+
+    def _data_line(self, name):
+        """Carries data channel frames on one line once its handshake succeeded, see data_channel.py"""
+        channel = self.data_channel
+        pin = self.pin_data[name]
+        line = self.all_lines[name]
+        timing = self.timing
+        frame_gap = timing.data_frame_gap / 1000.0
+        ack_timeout = 2 * frame_gap + ACK_BITS * (timing.data_one_duration + timing.data_gap_duration) / 1000.0
+
+        while not pin.successful:
+            if pin.is_blacklisted() or self.stop_event.is_set():
+                return
+            yield WaitUntil(self._clock() + timing.line_settle_duration / 1000.0)
+
+        waiting = None  # (sequence number, deadline) of our frame on this line that still needs its ack
+        backoff = channel.backoff(timing.bit_time)
+        while not self.stop_event.is_set():
+            self._drain_interrupts()
+            self._take_data_requests()
+
+            now = self._clock()
+            quiet_since = channel.quiet_since(name)
+            if line.state() == 1:
+                yield WaitUntil(now + frame_gap)
+                continue
+
+            ack = channel.next_ack(name)
+            if ack is not None:
+                if now < quiet_since + frame_gap:
+                    channel.acks[name].appendleft(ack)
+                    yield WaitUntil(quiet_since + frame_gap)
+                    continue
+                if not (yield from self._send_bits(name, encode_ack(ack))):
+                    channel.acks[name].appendleft(ack)
+                continue
+
+            if waiting is not None:
+                sequence, deadline = waiting
+                if channel.acknowledged(sequence):
+                    waiting = None
+                elif now >= deadline:
+                    waiting = None
+                    self._log(DATA_RETRANSMIT, name, value=sequence)
+                    if not channel.lost(name, sequence):
+                        self._log(DATA_LINE_DOWN, name)
+                        return
+                    backoff = channel.backoff(timing.bit_time)
+                else:
+                    yield WaitUntil(deadline)
+                    continue
+
+            if now < quiet_since + 2 * frame_gap + backoff:
+                yield WaitUntil(quiet_since + 2 * frame_gap + backoff)
+                continue
+            frame = channel.next_frame()
+            if frame is None:
+                yield WaitUntil(now + frame_gap)
+                continue
+            sequence, bits = frame
+            yield from self._send_bits(name, bits)
+            # A frame cut short by a collision is not acknowledged either, it times out like a lost one
+            waiting = (sequence, self._clock() + ack_timeout)
+            backoff = channel.backoff(timing.bit_time)
+
+    def _send_bits(self, name, bits):
+        """One pulse per bit, returns False if the peer drove the line as well and the frame was cut short"""
+        line = self.all_lines[name]
+        zero = self.timing.data_zero_duration / 1000.0
+        one = self.timing.data_one_duration / 1000.0
+        gap = self.timing.data_gap_duration / 1000.0
+        start = self._clock()
+        self.data_channel.sending(name, start)
+        try:
+            for bit in bits:
+                line.pull_high(self.name)
+                yield Sleep(one if bit else zero)
+                line.release(self.name)
+                if line.state() == 1:
+                    return False
+                yield Sleep(gap)
+            return True
+        finally:
+            self.data_channel.sending(name, start, self._clock())
+
+    def _take_data_requests(self):
+        while not self.data_requests.empty():
+            self.data_channel.queue(self.data_requests.get())
+
+    def _on_data_bit(self, line_name, edge_type, duration, timestamp):
+        frame_gap = (self.timing.data_gap_duration + self.timing.data_frame_gap) / 2000.0
+        reports = self.data_channel.on_bit(line_name, int(edge_type == "DATA1"), timestamp - duration / 1000.0,
+                                           timestamp, frame_gap)
+        if not self.output_queue:
+            return
+        for report in reports:
+            message = {'mcu_name': self.name, 'status': report[0], 'timestamp': self._clock()}
+            if report[0] == 'DATA':
+                message['data'] = report[1]
+            else:
+                message['message'], message['bytes'] = report[1], report[2]
+            self.output_queue.put(message)
+
+    def _route_interrupts(self):
+        # Concurrent mode: hand every received pulse to the handshake of its line
+        while not self.interrupt_queue.empty():
+            line_name, edge_type, duration, timestamp = self.interrupt_queue.get()
+            if edge_type == "VERIFY":
+                self._on_verify(line_name, timestamp)
+                continue
+            if edge_type in DATA_BITS:
+                if self._coding:
+                    self._on_code_bit(line_name, edge_type, duration, timestamp)
+                elif self.data_channel is not None:
+                    self._on_data_bit(line_name, edge_type, duration, timestamp)
+                continue
+            hs = self.handshakes[line_name]
+            now = self._clock()
+            dropped = abs(now - hs.last_sent_time) < self.timing.own_pulse_guard
+            if self.instrumentation is not None:
+                self.instrumentation.interrupt(line_name, timestamp, now, dropped)
+            if dropped:
+                continue
+
+            if edge_type == "SYN":
+                self._log(RECEIVED_SYN, line_name)
+                hs.received_syn = True
+            elif edge_type == "SYN_ACK":
+                self._log(RECEIVED_SYN_ACK, line_name)
+                hs.received_syn_ack = True
+            elif edge_type == "ACK":
+                self._log(RECEIVED_ACK, line_name)
+                hs.received_ack = True
+
     def _reset_state(self):
-        self.state.value = INIT
+        self.status.state = INIT
         self.current_line = None
-        self.received_syn_on.value = ''
-        self.received_syn_ack.value = False
-        self.received_ack.value = False
-        self.received_ack_on.value = ''
-        self.received_syn.value = False
-        self.received_syn_ack_on.value = ''
-        self.received_ack_on.value = ''
-        self.last_sent_time.value = 0.0
-        self.role.value = ''
+        self.received_syn_on = ''
+        self.received_syn_ack = False
+        self.received_ack = False
+        self.received_ack_on = ''
+        self.received_syn = False
+        self.received_syn_ack_on = ''
+        self.received_ack_on = ''
+        self.status.last_sent_time = 0.0
+        self.role = ''
 
     def _process_interrupts(self):
         while not self.interrupt_queue.empty():
-            line_name, edge_type, duration = self.interrupt_queue.get()
-            if abs(perf_counter() - self.last_sent_time.value) < 0.2:
+            line_name, edge_type, duration, timestamp = self.interrupt_queue.get()
+            if edge_type == "VERIFY":
+                self._on_verify(line_name, timestamp)
+                continue
+            if edge_type in DATA_BITS:
+                if self._coding:
+                    self._on_code_bit(line_name, edge_type, duration, timestamp)
+                elif self.data_channel is not None:
+                    self._on_data_bit(line_name, edge_type, duration, timestamp)
+                continue
+            now = self._clock()
+            dropped = abs(now - self.status.last_sent_time) < self.timing.own_pulse_guard
+            if self.instrumentation is not None:
+                self.instrumentation.interrupt(line_name, timestamp, now, dropped)
+            if dropped:
                 continue
                 
             if edge_type == "SYN":
-                print(f"[{self.name}] Received SYN on {line_name}", flush=True)
-                self.received_syn.value = True
-                self.received_syn_on.value = line_name
-                self.current_line = line_name
+                self._log(RECEIVED_SYN, line_name)
+                self.received_syn = True
+                self.received_syn_on = line_name
+                if self.status.state in (INIT, MAYBE_RESPONDER) and not self.pin_data[line_name].is_tested():
+                    # Follow the SYN, but an initiator keeps waiting on the line it sent on and a
+                    # line with a result keeps it
+                    self.current_line = line_name
 
             elif edge_type == "SYN_ACK":
-                print(f"[{self.name}] Received SYN_ACK on {line_name}", flush=True)
-                self.received_syn_ack.value = True
-                self.received_syn_ack_on.value = line_name
+                self._log(RECEIVED_SYN_ACK, line_name)
+                self.received_syn_ack = True
+                self.received_syn_ack_on = line_name
 
             elif edge_type == "ACK":
-                print(f"[{self.name}] Received ACK on {line_name} (Initiator)", flush=True)
-                self.received_ack.value = True
-                self.received_ack_on.value = line_name
+                self._log(RECEIVED_ACK, line_name)
+                self.received_ack = True
+                self.received_ack_on = line_name
+
+    def _publish_edge(self, index, line, state, timestamp):
+        # Runs in whichever process pulled or released the line
+        self.edges.put((index, state, timestamp))
 
     def _peripheral(self):
-        durations = {name: None for name in self.all_lines.keys()}
+        reported = 0  # Dropped edges already logged
+        while not self.stop_event.is_set():
+            event = self.edges.get(timeout=0.1)
+            if event is not None:
+                self._on_edge(*event)
+            dropped = self.edges.dropped
+            if dropped != reported:
+                # A lost edge merges or splits pulses, the widths measured around it are wrong
+                reported = dropped
+                self._log(EDGES_DROPPED, value=dropped)
 
+    def _watch_edges(self):
         while not self.stop_event.is_set():
-            for name, line in self.all_lines.items():
-                state = line.state()
-                prev = self.previous_states[name]
-
-                if prev == 0 and state == 1:
-                    durations[name] = perf_counter()
-                elif prev == 1 and state == 0 and durations[name] is not None:
-                    duration = (perf_counter() - durations[name]) * 1000
-                    if abs(duration - SYN_DURATION) < TOLERANCE:
-                        etype = "SYN"
-                    elif abs(duration - SYN_ACK_DURATION) < TOLERANCE:
-                        etype = "SYN_ACK"
-                    elif abs(duration - ACK_DURATION) < TOLERANCE:
-                        etype = "ACK"
-                    else:
-                        etype = None
-                    if etype:
-                        self.interrupt_queue.put((name, etype, duration))
-                    durations[name] = None
-
-                self.previous_states[name] = state
+            while not self.edges.empty():
+                self._on_edge(*self.edges.get())
+            yield WaitUntil()
+
+    def _on_edge(self, index, state, timestamp):
+        name = self._line_names[index]
+        prev = self.previous_states[name]
+        if state == prev:
+            return
+
+        if state == 1:
+            self.rising_edges[name] = timestamp
+        elif self.rising_edges[name] is not None:
+            duration = (timestamp - self.rising_edges[name]) * 1000
+            etype = self._classify_pulse(duration)
+            if etype:
+                self.interrupt_queue.put((name, etype, duration, timestamp))
+            self.rising_edges[name] = None
+
+        self.previous_states[name] = state
+
+    def _classify_pulse(self, duration):
+        etype = self.timing.classify(duration)
+        if etype in DATA_BITS and self.data_channel is None and not self.coded:
+            return None  # Nobody listens for data or line codes
+        return etype
@@ -0,0 +1,105 @@
+"""Wired-OR nets of bridged or shorted lines.
+
+Connected lines form one electrical net, kept as a union-find forest on
+the line objects themselves. A net is HIGH while any member is driven
+high. state() on any member reads the level of the whole net and an edge
+of the net reaches the subscribers of every member, at once and without a
+process mirroring anything.
+
+Connect lines before the processes that use them start, the forest is
+copied into each process like the rest of the line object. A process that
+forked already keeps the nets it was started with, so connect() and
+disconnect() raise RuntimeError for lines that went to a process (see
+mark_forked). The Simulation and the asyncio runtime never fork, their
+nets can change at any time.
+"""
+
+
+def find(line):
+    """Root line of the net `line` belongs to"""
+    parent = line._net_parent
+    if parent is None:
+        return line
+    while parent is not line:
+        grandparent = parent._net_parent
+        line._net_parent = grandparent  # Path halving
+        line, parent = grandparent, grandparent._net_parent
+    return line
+
+
+def mark_forked(lines):
+    """Called before a process that uses `lines` starts, their nets are fixed from then on"""
+    for line in lines:
+        line._net_forked = True
+
+
+def _check_unforked(*lines):
+    for line in lines:
+        for member in members(line):
+            if member._net_forked:
+                raise RuntimeError(f"Line {member.name} is in use by a started process, "
+                                   f"its net can no longer change")
+
+
+def members(line):
+    root = find(line)
+    return root._net_members if root._net_members is not None else [line]
+
+
+def connect(a, b):
+    """Short two lines, merging their nets"""
+    _check_unforked(a, b)
+    root_a, root_b = find(a), find(b)
+    for root in (root_a, root_b):
+        if root._net_parent is None:
+            root._net_parent = root
+            root._net_members = [root]
+            root._net_links = []
+
+    if root_a is root_b:
+        root_a._net_links.append((a, b))
+        return
+    if len(root_a._net_members) < len(root_b._net_members):
+        root_a, root_b = root_b, root_a  # Union by size
+    root_b._net_parent = root_a
+    root_a._net_members.extend(root_b._net_members)
+    root_a._net_links.extend(root_b._net_links)
+    root_a._net_links.append((a, b))
+    root_b._net_members = root_b._net_links = None
+
+
+def disconnect(a, b):
+    """Remove one short between a and b, the net splits if nothing else connects them"""
+    _check_unforked(a)
+    root = find(a)
+    links = list(root._net_links or [])
+    if (a, b) in links:
+        links.remove((a, b))
+    elif (b, a) in links:
+        links.remove((b, a))
+    else:
+        return
+    for line in root._net_members:
+        line._net_parent = line._net_members = line._net_links = None
+    for x, y in links:
+        connect(x, y)
+
+
+def net_state(line):
+    """1 if any line of the net is driven high"""
+    for member in members(line):
+        if member._own_state():
+            return 1
+    return 0
+
+
+def publish(line, state):
+    """Edge of `line`'s own drive, forwarded to the whole net if it changes the net's level"""
+    net = members(line)
+    for member in net:
+        if member is not line and member._own_state():
+            return  # Someone else keeps the net high
+    for member in net:
+        member._notify(state)
+        if member is not line:
+            member._log_state()
@@ -0,0 +1,82 @@
+import unittest
+
+from nets import connect, disconnect, find, mark_forked, members, net_state
+from shared_lines import SharedLine
+from simulation import SimulationManager
+
+
+class NetsTest(unittest.TestCase):
+    def setUp(self):
+        manager = SimulationManager()
+        self.a, self.b, self.c, self.d = (SharedLine(manager, name=name) for name in ("A", "B", "C", "D"))
+
+    def assertNets(self, *nets):
+        for net in nets:
+            self.assertEqual({id(line) for line in members(net[0])}, {id(line) for line in net})
+            self.assertTrue(all(find(line) is find(net[0]) for line in net))
+        roots = [find(net[0]) for net in nets]
+        self.assertEqual(len({id(root) for root in roots}), len(nets))
+
+    def test_unconnected_line_is_its_own_net(self):
+        self.assertIs(find(self.a), self.a)
+        self.assertEqual(members(self.a), [self.a])
+        self.b.pull_high("X")
+        self.assertEqual(net_state(self.a), 0)
+
+    def test_connect_merges_nets(self):
+        connect(self.a, self.b)
+        connect(self.c, self.d)
+        self.assertNets([self.a, self.b], [self.c, self.d])
+        connect(self.b, self.c)
+        self.assertNets([self.a, self.b, self.c, self.d])
+
+    def test_net_state_is_wired_or(self):
+        connect(self.a, self.b)
+        connect(self.b, self.c)
+        self.assertEqual(self.a.state(), 0)
+        self.c.pull_high("X")
+        self.assertEqual((net_state(self.a), self.a.state(), self.d.state()), (1, 1, 0))
+        self.c.release("X")
+        self.assertEqual(self.a.state(), 0)
+
+    def test_edges_reach_every_member(self):
+        edges = []
+        self.a.subscribe(lambda line, state, timestamp: edges.append((line.name, state)))
+        connect(self.a, self.b)
+        self.b.pull_high("X")
+        self.a.pull_high("Z")  # The net is high already, no edge
+        self.b.release("X")  # A keeps the net high
+        self.a.release("Z")
+        self.assertEqual(edges, [("A", 1), ("A", 0)])
+
+    def test_disconnect_rebuilds_the_remaining_nets(self):
+        connect(self.a, self.b)
+        connect(self.b, self.c)
+        connect(self.c, self.d)
+        disconnect(self.b, self.c)
+        self.assertNets([self.a, self.b], [self.c, self.d])
+        self.d.pull_high("X")
+        self.assertEqual((self.a.state(), self.b.state(), self.c.state()), (0, 0, 1))
+
+    def test_disconnect_keeps_a_net_joined_by_another_link(self):
+        connect(self.a, self.b)
+        connect(self.b, self.c)
+        connect(self.c, self.a)
+        disconnect(self.b, self.a)  # Links match in either order
+        self.assertNets([self.a, self.b, self.c])
+        disconnect(self.a, self.d)  # Not linked, nothing changes
+        self.assertNets([self.a, self.b, self.c], [self.d])
+
+    def test_nets_of_forked_lines_are_fixed(self):
+        connect(self.a, self.b)
+        mark_forked([self.b])
+        with self.assertRaises(RuntimeError):
+            connect(self.c, self.a)
+        with self.assertRaises(RuntimeError):
+            disconnect(self.a, self.b)
+        connect(self.c, self.d)
+        self.assertNets([self.a, self.b], [self.c, self.d])
+
+
+if __name__ == "__main__":
+    unittest.main()
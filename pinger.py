@@ -1,29 +1,116 @@
+import heapq
+import random
 from multiprocessing import Process, Manager, Event
 from shared_lines import SharedLine
-from time import sleep
+from time import sleep, perf_counter
+from timebase import Sleep, run_realtime
+from nets import connect, disconnect, mark_forked
 
 class Pinger:
-    def __init__(self, shared_line: SharedLine, name="Pinger", interval=1.0, pulse_width=0.1):
+    """Periodic pulse source: a `pulse_width` wide pulse every `interval` seconds.
+
+    A Pinger only describes its pulses, a PulseScheduler drives them. The
+    k-th pulse starts at `phase + k * interval` (plus up to +-`jitter`
+    seconds of seeded noise) after the scheduler started, so the period
+    never drifts. start() still runs a Pinger on its own, in a scheduler
+    process of its own.
+    """
+    def __init__(self, shared_line: SharedLine, name="Pinger", interval=1.0, pulse_width=0.1, clock=perf_counter,
+                 sleep=sleep, phase=0.0, jitter=0.0, seed=None):
         self.shared_line = shared_line
         self.name = name
         self.interval = interval
         self.pulse_width = pulse_width
+        self.phase = phase
+        self.jitter = jitter
+        self._clock = clock
+        self._sleep = sleep
+        # Seeded at construction, so the jitter follows random.seed() like the rest of a run. Without
+        # jitter nothing is drawn, seeded runs stay the same as before Pingers had jitter
+        self._rng = random.Random(random.getrandbits(64) if seed is None else seed) if jitter else None
+        self._scheduler = None
+
+    def onset(self, k):
+        """Offset (s) of the k-th pulse from the scheduler's start"""
+        offset = self.phase + k * self.interval
+        if self.jitter:
+            offset += self._rng.uniform(-self.jitter, self.jitter)
+        return offset
+
+    def _pulses(self):
+        return PulseScheduler([self], clock=self._clock)._routine()
+
+    def start(self):
+        self._scheduler = PulseScheduler([self], clock=self._clock, sleep=self._sleep, name=self.name)
+        self._scheduler.start()
+
+    def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.stop()
+
+    def join(self):
+        if self._scheduler is not None:
+            self._scheduler.join()
+
+
+class PulseScheduler:
+    """Drives any number of pulse sources (Pinger) from one process or routine.
+
+    Every pending edge sits in one heap keyed by its absolute deadline. The
+    scheduler sleeps until the earliest one, applies all edges that are due
+    and schedules the source's next edge from its start time, not from when
+    the sleep returned, so a late wake-up delays one edge and is not carried
+    into the next period.
+    """
+    def __init__(self, sources=(), clock=perf_counter, sleep=sleep, name="PulseScheduler"):
+        self.sources = list(sources)
+        self.name = name
+        self._clock = clock
+        self._sleep = sleep
 
         self.stop_event = Event()
         self.p1 = None
 
-    def _run_logic(self):
+    def add(self, source):
+        self.sources.append(source)
+        return source
+
+    def _routine(self):
+        clock = self._clock
+        sources = list(self.sources)
+        start = clock()
+        pulses = [0] * len(sources)
+        # (deadline, level, source index), falls sort before rises due at the same time
+        edges = [(start + max(0.0, source.onset(0)), 1, index) for index, source in enumerate(sources)]
+        heapq.heapify(edges)
         try:
-            while not self.stop_event.is_set():
-                self.shared_line.pull_high(self.name)
-                sleep(self.pulse_width)
-                self.shared_line.release(self.name)
-                sleep(self.interval - self.pulse_width)
+            while edges and not self.stop_event.is_set():
+                now = clock()
+                if edges[0][0] > now:
+                    yield Sleep(edges[0][0] - now)
+                    continue
+
+                deadline, level, index = heapq.heappop(edges)
+                source = sources[index]
+                if level:
+                    source.shared_line.pull_high(source.name)
+                    heapq.heappush(edges, (deadline + source.pulse_width, 0, index))
+                else:
+                    source.shared_line.release(source.name)
+                    pulses[index] += 1
+                    onset = start + source.onset(pulses[index])
+                    heapq.heappush(edges, (max(onset, deadline), 1, index))
         finally:
-            self.shared_line.release(self.name)
-            self.shared_line.log_end()
+            for source in sources:
+                source.shared_line.release(source.name)
+            for line in {id(source.shared_line): source.shared_line for source in sources}.values():
+                line.log_end()
+
+    def _run_logic(self):
+        run_realtime(self._routine(), self._clock, self._sleep)
 
     def start(self):
+        mark_forked(source.shared_line for source in self.sources)
         self.p1 = Process(target=self._run_logic)
         self.p1.start()
 
@@ -33,41 +120,33 @@ class Pinger:
     def join(self):
         if self.p1 is not None:
             self.p1.join()
-            
+
+
 class Bridge:
+    """Shorts its lines into one wired-OR net (see nets.py).
+
+    The short exists from start() until stop(). There is no process, join()
+    only keeps the interface of the other components. Processes keep the nets
+    they were forked with, so start and stop a Bridge before the MCUs and
+    pingers on its lines start; afterwards both raise RuntimeError. The
+    Simulation and the asyncio runtime do not fork and have no such limit.
+    """
     def __init__(self, shared_lines: list[SharedLine], name="Bridge"):
         self.shared_lines = shared_lines
         self.name = name
-        self.stop_event = Event()
-        self.p1 = None
-
-    def _run_logic(self):
-        try:
-            while not self.stop_event.is_set():
-                high_lines = [line for line in self.shared_lines if line.is_high()]
-                
-                if len(high_lines) >= 1:
-                    # if at least one line is high, pull high on all lines
-                    for line in self.shared_lines:
-                        if line not in high_lines:
-                            line.pull_high(self.name)
-                else:
-                    # Either no lines or multiple lines are high, release all
-                    for line in self.shared_lines:
-                        line.release(self.name)
-                
-                sleep(0.0001)  # Small delay to prevent excessive CPU usage
-        finally:
-            for line in self.shared_lines:
-                line.release(self.name)
+        self._links = []
 
     def start(self):
-        self.p1 = Process(target=self._run_logic)
-        self.p1.start()
+        if self._links:
+            return
+        self._links = [(self.shared_lines[0], line) for line in self.shared_lines[1:]]
+        for a, b in self._links:
+            connect(a, b)
 
     def stop(self):
-        self.stop_event.set()
+        for a, b in self._links:
+            disconnect(a, b)
+        self._links = []
 
     def join(self):
-        if self.p1 is not None:
-            self.p1.join()
\ No newline at end of file
+        pass
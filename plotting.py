@@ -0,0 +1,188 @@
+"""Step plots of line traces, loaded on first use of shared_lines.MultiLinePlotter.
+
+NumPy and Matplotlib are only imported here, so processes that just drive
+lines never load them.
+"""
+from time import perf_counter
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+from shared_lines import UnreliableSharedLine
+
+DEFAULT_MAX_POINTS = 4000  # Points per trace after decimation
+LIVE_RECORDS = 20000  # Newest trace records a live frame reads per line
+
+
+def decimate_steps(timestamp, state, max_points=None):
+    """Indices of the records a step plot of `state` needs, at most ~max_points of them.
+
+    Only records that change the state matter for a step plot, plus the first
+    and the last one. If there are still too many, the time axis is split
+    into bins and every bin keeps its first transition, the one after it
+    (the opposite level) and its last transition, so a bin full of pulses
+    still shows both levels.
+    """
+    n = len(state)
+    if n == 0:
+        return np.arange(0)
+    changes = np.flatnonzero(np.diff(state)) + 1
+    keep = np.concatenate(([0], changes, [n - 1]))
+    if max_points is None or len(keep) <= max_points or not len(changes):
+        return np.unique(keep)
+
+    bins = max(1, max_points // 3)
+    t = timestamp[changes]
+    span = t[-1] - t[0]
+    bin_of = np.minimum(((t - t[0]) / span * bins).astype(np.int64), bins - 1) if span > 0 else np.zeros(len(t), np.int64)
+    first = np.flatnonzero(np.diff(bin_of, prepend=-1))
+    last = np.flatnonzero(np.diff(bin_of, append=bins))
+    second = first + 1
+    second = second[(second < len(changes)) & (bin_of[np.minimum(second, len(changes) - 1)] == bin_of[first])]
+    picked = changes[np.concatenate((first, second, last))]
+    return np.unique(np.concatenate(([0], picked, [n - 1])))
+
+
+class MultiLinePlotter:
+    """Step plots of line traces.
+
+    plot_all() shows the whole run once it ended, save() writes it to a PNG
+    or SVG file without a display and plot_live() redraws the newest records
+    at a fixed frame rate while the run goes on. Every trace is decimated to
+    about max_points points first (see decimate_steps), so long runs stay
+    fast to plot.
+    """
+    def __init__(self, lines=None, max_points=DEFAULT_MAX_POINTS):
+        self.lines = lines or []
+        self.max_points = max_points
+    
+    def add_line(self, line):
+        self.lines.append(line)
+    
+    def add_lines(self, lines):
+        self.lines.extend(lines)
+
+    def _trace(self, line, latest=None):
+        # Decimated (timestamp ms, state byte) of a line, only the newest records if `latest` is given
+        if latest is None:
+            timestamp, state, _ = line.data_log.arrays()
+        else:
+            timestamp, state, _ = line.data_log.latest(latest)
+        index = decimate_steps(timestamp, state, self.max_points)
+        return timestamp[index], state[index]
+
+    def _layout(self, fig):
+        num_lines = len(self.lines)
+        rows = (num_lines + 1) // 2  # Zwei Spalten
+        fig.suptitle('Shared Lines', fontsize=16)
+        axes = fig.subplots(rows, 2, squeeze=False)
+
+        # Leeres Subplot ausblenden bei ungerader Zahl
+        if num_lines % 2 == 1:
+            axes[rows - 1][1].set_visible(False)
+        return [axes[i // 2][i % 2] for i in range(num_lines)]
+
+    @staticmethod
+    def _style(ax, line):
+        ax.set_title(f'{line.name}')
+        ax.set_xlabel('Time (ms)')
+        ax.set_ylabel('State')
+        ax.set_yticks([0, 1])
+        ax.set_yticklabels(['LOW', 'HIGH'])
+        ax.set_ylim(-0.2, 1.2)
+        ax.grid(True, which='both', linestyle='--', alpha=0.3)
+
+    def _draw(self, fig):
+        for ax, line in zip(self._layout(fig), self.lines):
+            if not line.data_log:
+                ax.text(0.5, 0.5, 'No data', ha='center', va='center', transform=ax.transAxes)
+                ax.set_title(f'{line.name} - No Data')
+                ax.axis('off')
+                continue
+
+            timestamp, state = self._trace(line)
+
+            if isinstance(line, UnreliableSharedLine):
+                # Step-Plots für 'actual' und 'reported' Zustand, Bit 0 und Bit 1 des Zustands
+                actual, reported = state & 1, state >> 1
+                ax.step(timestamp, actual, where='post', label='Actual', alpha=0.7)
+                ax.step(timestamp, reported, where='post', label='Reported', alpha=0.7)
+
+                # Fehlerpunkte als Scatter
+                failed = actual != reported
+                if failed.any():
+                    ax.scatter(timestamp[failed], reported[failed], color='red', s=20, label='Failures', zorder=5)
+                ax.legend()
+            else:
+                ax.step(timestamp, state & 1, where='post', alpha=0.9)
+
+            self._style(ax, line)
+        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+
+    def plot_all(self, figsize=(15, 10)):
+        if not self.lines:
+            print("No lines to plot")
+            return
+
+        fig = plt.figure(figsize=figsize)
+        self._draw(fig)
+        plt.show()
+
+    def save(self, path, figsize=(15, 10), dpi=100):
+        """Render to `path` without a display, the format follows the suffix (.png, .svg, ...)"""
+        fig = Figure(figsize=figsize)  # Not registered with pyplot, works on any backend
+        if self.lines:
+            self._draw(fig)
+        fig.savefig(path, dpi=dpi)
+        return path
+
+    def plot_live(self, fps=10, window_ms=10000, records=LIVE_RECORDS, figsize=(15, 10), until=None, stop_when=None):
+        """Redraw the last `window_ms` of every line `fps` times per second until the window is closed.
+
+        Every frame reads only the newest `records` trace records of a line.
+        Stops after `until` seconds or once stop_when() is true as well.
+        """
+        if not self.lines:
+            print("No lines to plot")
+            return
+
+        fig = plt.figure(figsize=figsize)
+        artists = []
+        for ax, line in zip(self._layout(fig), self.lines):
+            actual, = ax.plot([], [], drawstyle='steps-post', alpha=0.9, label='Actual')
+            reported = None
+            if isinstance(line, UnreliableSharedLine):
+                reported, = ax.plot([], [], drawstyle='steps-post', alpha=0.7, label='Reported')
+                ax.legend(loc='upper right')
+            self._style(ax, line)
+            artists.append((ax, actual, reported))
+        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+        plt.show(block=False)
+
+        interval = 1.0 / fps
+        start = next_frame = perf_counter()
+        while plt.fignum_exists(fig.number):
+            if until is not None and perf_counter() - start >= until:
+                break
+            if stop_when is not None and stop_when():
+                break
+
+            for line, (ax, actual, reported) in zip(self.lines, artists):
+                now = (line._clock() - line.start_time) * 1000
+                timestamp, state = self._trace(line, latest=records)
+                first = np.searchsorted(timestamp, now - window_ms)
+                # Keep the level at the left edge and hold the last level up to now
+                first = max(0, first - 1)
+                timestamp = np.append(timestamp[first:], now)
+                state = np.append(state[first:], state[-1] if len(state) else 0)
+                actual.set_data(timestamp, state & 1)
+                if reported is not None:
+                    reported.set_data(timestamp, state >> 1)
+                ax.set_xlim(now - window_ms, now)
+
+            fig.canvas.draw_idle()
+            next_frame += interval
+            plt.pause(max(0.001, next_frame - perf_counter()))
+            if next_frame < perf_counter():
+                next_frame = perf_counter()  # Drop frames we are too late for instead of catching up
@@ -0,0 +1,203 @@
+"""Offline pulse analysis of recorded line traces.
+
+Finds every pulse in a line's data_log, classifies it with the MCU's rules
+(the pulse widths of TimingProfile, VERIFY and data bits included) and
+checks the handshake order: a SYN must be
+answered by a SYN_ACK and that by an ACK, each within the timeout the
+waiting side allows. All steps work on whole NumPy arrays, so traces with
+millions of transitions take well under a second.
+
+    python pulse_analyzer.py --lines 4 --duration 600 [--pinger] [--bridge]
+    python pulse_analyzer.py --synthetic 5000000
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from mcu import DEFAULT_TIMING, TimingProfile
+
+NONE = 0
+# Pulse code -> name, one code per pulse type of TimingProfile in the order it classifies them
+PULSE_NAMES = {NONE: 'unknown', **{code: pulse for code, (pulse, _) in enumerate(TimingProfile.PULSES, 1)}}
+PULSE_CODES = {pulse: code for code, pulse in PULSE_NAMES.items()}
+SYN, SYN_ACK, ACK = PULSE_CODES['SYN'], PULSE_CODES['SYN_ACK'], PULSE_CODES['ACK']
+
+
+def find_pulses(timestamp, state):
+    """(rise, fall) times of every complete high pulse, in the trace's time unit"""
+    level = (np.asarray(state) & 1).astype(np.int8)  # Bit 0 is the actual level on every line class
+    change = np.flatnonzero(np.diff(level, prepend=0))
+    rising = change[level[change] == 1]
+    falling = change[level[change] == 0]
+    if len(falling) and len(rising) and falling[0] < rising[0]:
+        falling = falling[1:]
+    rising = rising[:len(falling)]
+    return rising, falling
+
+
+def classify_widths(widths, timing=DEFAULT_TIMING):
+    """Pulse code per width (ms), the bands and their order are those of TimingProfile.classify"""
+    bands = timing.pulse_widths()
+    return np.select(
+        [np.abs(widths - nominal) < timing.tolerance for _, nominal in bands],
+        [PULSE_CODES[pulse] for pulse, _ in bands], default=NONE).astype(np.int8)
+
+
+def analyze_trace(timestamp, state, holders_count, timing=DEFAULT_TIMING, glitch_width=None):
+    """Pulse statistics and protocol violations of one trace, timestamps in ms"""
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    holders_count = np.asarray(holders_count)
+    if glitch_width is None:
+        glitch_width = timing.tolerance  # Narrower than any pulse the protocol could mean
+
+    rise_idx, fall_idx = find_pulses(timestamp, state)
+    rise, fall = timestamp[rise_idx], timestamp[fall_idx]
+    widths = fall - rise
+    codes = classify_widths(widths, timing)
+
+    # A pulse collided if more than one holder drove it at some point
+    if len(rise_idx):
+        max_holders = np.maximum.reduceat(holders_count, rise_idx)
+        # reduceat runs up to the next rise, the low part after the fall holds no holder anyway
+        collided = max_holders > 1
+    else:
+        collided = np.zeros(0, dtype=bool)
+
+    # The handshake order only concerns the handshake pulses, VERIFY and data bits follow their own rules
+    mask = (codes == SYN) | (codes == SYN_ACK) | (codes == ACK)
+    c, r, f = codes[mask], rise[mask], fall[mask]
+    prev_code = np.concatenate(([NONE], c[:-1]))
+    next_code = np.concatenate((c[1:], [NONE]))
+    next_gap = np.concatenate((r[1:] - f[:-1], [np.inf]))
+
+    syn_answered = (next_code == SYN_ACK) & (next_gap <= timing.timeout_syn_ack * 1000)
+    ack_followed = (next_code == ACK) & (next_gap <= timing.timeout_ack * 1000)
+    is_syn, is_syn_ack, is_ack = c == SYN, c == SYN_ACK, c == ACK
+
+    violations = {
+        'syn_without_syn_ack': int(np.count_nonzero(is_syn & ~syn_answered)),
+        'syn_ack_without_syn': int(np.count_nonzero(is_syn_ack & (prev_code != SYN))),
+        'syn_ack_without_ack': int(np.count_nonzero(is_syn_ack & ~ack_followed)),
+        'ack_without_syn_ack': int(np.count_nonzero(is_ack & (prev_code != SYN_ACK))),
+    }
+    handshakes = np.count_nonzero(is_syn & syn_answered & np.concatenate((ack_followed[1:], [False])))
+
+    width_error = {}
+    for pulse, nominal in timing.pulse_widths():
+        selected = widths[codes == PULSE_CODES[pulse]]
+        width_error[pulse] = float(np.abs(selected - nominal).mean()) if len(selected) else None
+
+    return {
+        'transitions': int(len(rise_idx) + len(fall_idx)),
+        'pulses': int(len(widths)),
+        'counts': {PULSE_NAMES[code]: int(np.count_nonzero(codes == code)) for code in PULSE_NAMES},
+        'glitches': int(np.count_nonzero((codes == NONE) & (widths < glitch_width))),
+        'collisions': int(np.count_nonzero(collided)),
+        'handshakes': int(handshakes),
+        'violations': violations,
+        'mean_width_error_ms': width_error,
+    }
+
+
+def analyze_line(line, timing=DEFAULT_TIMING, **kwargs):
+    timestamp, state, holders_count = line.data_log.arrays()
+    return analyze_trace(timestamp, state, holders_count, timing, **kwargs)
+
+
+def analyze_lines(lines, timing=DEFAULT_TIMING, **kwargs):
+    """Report per line name"""
+    return {line.name: analyze_line(line, timing, **kwargs) for line in lines}
+
+
+def format_report(report):
+    pulses = [pulse for _, pulse in sorted(PULSE_NAMES.items()) if pulse != 'unknown'] + ['unknown']
+    header = (f"{'line':<10}{'pulses':>10}" + "".join(f"{pulse:>9}" for pulse in pulses)
+              + f"{'glitches':>10}{'collided':>10}{'handshakes':>12}{'violations':>12}")
+    rows = [header]
+    for name, r in report.items():
+        counts = r['counts']
+        rows.append(f"{name:<10}{r['pulses']:>10}" + "".join(f"{counts[pulse]:>9}" for pulse in pulses)
+                    + f"{r['glitches']:>10}{r['collisions']:>10}{r['handshakes']:>12}"
+                    f"{sum(r['violations'].values()):>12}")
+    return "\n".join(rows)
+
+
+def synthetic_trace(transitions, timing=DEFAULT_TIMING, seed=0):
+    """Random handshakes, glitches and collisions, `transitions` records long"""
+    rng = np.random.default_rng(seed)
+    pulses = transitions // 2
+    nominal = np.array([timing.syn_duration, timing.syn_ack_duration, timing.ack_duration, 1.0])
+    kind = np.where(rng.random(pulses) < 0.05, 3, np.arange(pulses) % 3)
+    widths = nominal[kind] + rng.normal(0, timing.tolerance / 4, pulses)
+    widths[kind == 3] = rng.random(np.count_nonzero(kind == 3)) * 2
+    gaps = rng.uniform(timing.line_settle_duration, 500, pulses)
+    rise = np.cumsum(gaps + np.concatenate(([0.0], widths[:-1])))
+    timestamp = np.empty(2 * pulses)
+    timestamp[0::2], timestamp[1::2] = rise, rise + np.abs(widths)
+    state = np.tile(np.array([1, 0], dtype=np.uint8), pulses)
+    holders = state.astype(np.uint16) * np.where(rng.random(2 * pulses) < 0.01, 2, 1).astype(np.uint16)
+    return timestamp, state, holders
+
+
+def _soak(num_lines, duration, pinger, bridge):
+    import contextlib
+    import io
+    from shared_lines import SharedLine
+    from mcu import MCU
+    from pinger import Pinger, Bridge
+    from simulation import Simulation
+
+    sim = Simulation()
+    lines = [sim.add_line(SharedLine(sim.manager, name=f"L{i + 1}", clock=sim.clock)) for i in range(num_lines)]
+    wiring = [(line.name, line) for line in lines]
+    if pinger:
+        sim.add_pinger(Pinger(lines[-1], clock=sim.clock))
+    if bridge and num_lines > 1:
+        sim.add_bridge(Bridge(lines[:2]))
+
+    # Start a new pair of MCUs whenever the last pair completed, so the traces keep growing
+    with contextlib.redirect_stdout(io.StringIO()):
+        while sim.now < duration:
+            mcus = [sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock)) for name in "AB"]
+            completed = []
+
+            def both_completed():
+                while not sim.output_queue.empty():
+                    completed.append(sim.output_queue.get()['status'] == 'COMPLETED')
+                return sum(completed) == len(mcus)
+
+            sim.run(until=duration, stop_when=both_completed)
+            for mcu in mcus:
+                mcu.stop_event.set()
+        sim.stop()
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=600.0, help="Virtual seconds of the soak run")
+    parser.add_argument("--pinger", action="store_true", help="Add a Pinger on the last line")
+    parser.add_argument("--bridge", action="store_true", help="Short the first two lines with a Bridge")
+    parser.add_argument("--synthetic", type=int, default=None, help="Analyze a random trace with this many transitions")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trace = synthetic_trace(args.synthetic)
+        start = perf_counter()
+        report = {'synthetic': analyze_trace(*trace)}
+        elapsed = perf_counter() - start
+    else:
+        lines = _soak(args.lines, args.duration, args.pinger, args.bridge)
+        start = perf_counter()
+        report = analyze_lines(lines)
+        elapsed = perf_counter() - start
+
+    print(format_report(report))
+    for name, r in report.items():
+        found = {kind: count for kind, count in r['violations'].items() if count}
+        if found:
+            print(f"{name}: {found}")
+    transitions = sum(r['transitions'] for r in report.values())
+    print(f"\n{transitions} transitions analyzed in {elapsed * 1000:.1f} ms")
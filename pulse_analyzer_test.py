@@ -0,0 +1,77 @@
+import contextlib
+import io
+import random
+import unittest
+
+import numpy as np
+
+from data_channel import ACK_BITS, CRC, FRAME_HEADER, DataChannel
+from mcu import MCU, DEFAULT_TIMING
+from pulse_analyzer import PULSE_NAMES, analyze_line, analyze_trace, classify_widths
+from results import ResultsAggregator
+from shared_lines import SharedLine
+from simulation import Simulation
+
+
+class ClassifyWidthsTest(unittest.TestCase):
+    def test_matches_timing_profile(self):
+        for timing in (DEFAULT_TIMING, DEFAULT_TIMING.scaled(0.1)):
+            widths = np.arange(0.0, 2000.0, 0.5) * timing.tolerance / DEFAULT_TIMING.tolerance
+            codes = classify_widths(widths, timing)
+            for width, code in zip(widths, codes):
+                expected = timing.classify(width)
+                self.assertEqual(PULSE_NAMES[code], expected if expected is not None else 'unknown', width)
+
+
+class GlitchTest(unittest.TestCase):
+    def test_sub_tolerance_pulses_are_glitches(self):
+        timing = DEFAULT_TIMING
+        # Alternate glitches below the tolerance with 0 data bits, 1 s apart
+        widths = np.array([1.0, timing.data_zero_duration, timing.tolerance / 2, timing.data_zero_duration,
+                           timing.tolerance - 1.0, timing.data_zero_duration])
+        rise = np.arange(len(widths)) * 1000.0
+        timestamp = np.column_stack((rise, rise + widths)).ravel()
+        state = np.tile(np.array([1, 0], dtype=np.uint8), len(widths))
+
+        report = analyze_trace(timestamp, state, state.astype(np.uint16), timing)
+        self.assertEqual(report['glitches'], 3)
+        self.assertEqual(report['counts']['unknown'], 3)
+        self.assertEqual(report['counts']['DATA0'], 3)
+
+
+class DataChannelTraceTest(unittest.TestCase):
+    def test_data_bits_are_classified(self):
+        random.seed(0)
+        sim = Simulation()
+        line = sim.add_line(SharedLine(sim.manager, name="L1", clock=sim.clock))
+        mcus = {name: sim.add_mcu(MCU(name, [("L1", line)], sim.output_queue, clock=sim.clock,
+                                      data_channel=DataChannel(seed=i)))
+                for i, name in enumerate("AB")}
+        results = ResultsAggregator(sim.output_queue, ["A", "B"], clock=sim.clock)
+        message = bytes(range(10))
+
+        def delivered():
+            results.poll()
+            return results.counts['DELIVERED'] > 0
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim.run(until=100.0, stop_when=results.poll)
+            mcus["A"].send(message)
+            sim.run(until=sim.now + 1000.0, stop_when=delivered)
+            sim.stop()
+        try:
+            self.assertEqual(results.mcus["B"]['received'], [message])
+            report = analyze_line(line)
+        finally:
+            sim.close()
+
+        # One data frame and its ack, nothing of it is taken for an unknown pulse or a glitch
+        frame_bits = 8 * (FRAME_HEADER.size + len(message) + CRC.size)
+        self.assertEqual(report['counts']['DATA0'] + report['counts']['DATA1'], frame_bits + ACK_BITS)
+        self.assertEqual(report['counts']['unknown'], 0)
+        self.assertEqual(report['handshakes'], 1)
+        self.assertEqual(sum(report['violations'].values()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
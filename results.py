@@ -0,0 +1,166 @@
+"""Streaming collection of the messages MCUs put on their output queue.
+
+    results = ResultsAggregator(output_queue, ["A", "B"])
+    results.on('WORKING', lambda message: print(message['pin_data']['name']))
+    results.run(timeout=25.0)  # Returns once every MCU reported COMPLETED
+    print(results.format_summary())
+
+Messages are taken off the queue in batches and folded into per-MCU and
+per-line tables as they arrive, so the tables are current at any moment.
+In virtual time, pass results.poll as stop_when of Simulation.run() or
+AsyncRuntime.run() instead of calling run().
+"""
+import queue
+from time import perf_counter
+
+STATUSES = ('WORKING', 'FAILED', 'COMPLETED', 'METRICS', 'DATA', 'DELIVERED')
+
+BATCH_SIZE = 1024  # Messages handled per drain before callers get control back
+WAIT_TIMEOUT = 1.0  # Longest blocking get() in run(), a message ends the wait right away
+
+
+class ResultsAggregator:
+    """Dispatches MCU messages to callbacks and keeps summary tables.
+
+    `mcus` are the names of the MCUs to wait for, or their number when the
+    names are not known up front. done is true once every named MCU, or
+    that many different MCUs, reported COMPLETED.
+    """
+
+    def __init__(self, output_queue, mcus, clock=perf_counter):
+        self.output_queue = output_queue
+        self._clock = clock
+        if isinstance(mcus, int):
+            self.expected = mcus
+            names = []
+        else:
+            names = list(mcus)
+            self.expected = len(names)
+        self._waiting_for = set(names)  # Empty when only the number of MCUs is known
+
+        self._callbacks = {status: [] for status in STATUSES}
+        self.mcus = {}  # MCU name -> status, pin messages, white_list, black_list, completed_at, received data
+        self.lines = {}  # (MCU name, line name) -> status, role, timestamp of the latest pin message
+        self.counts = {status: 0 for status in STATUSES}
+        self.metrics = {}  # MCU name -> report of its Instrumentation
+        self.completed = set()
+        for name in names:
+            self._mcu(name)
+
+    def on(self, status, callback):
+        """Call callback(message) for every message with this status"""
+        self._callbacks[status].append(callback)
+        return callback
+
+    @property
+    def done(self):
+        if self._waiting_for:
+            return self._waiting_for <= self.completed
+        return len(self.completed) >= self.expected
+
+    def _mcu(self, name):
+        table = self.mcus.get(name)
+        if table is None:
+            table = self.mcus[name] = {'status': 'RUNNING', 'pins': [], 'completed_at': None, 'received': []}
+        return table
+
+    def handle(self, message):
+        status = message['status']
+        name = message['mcu_name']
+        table = self._mcu(name)
+        self.counts[status] = self.counts.get(status, 0) + 1
+
+        if status == 'COMPLETED':
+            self.completed.add(name)
+            table['status'] = 'COMPLETED'
+            table['completed_at'] = message['timestamp']
+            table['white_list'] = message['white_list']
+            table['black_list'] = message['black_list']
+            table['edges_dropped'] = message['edges_dropped']
+        elif status == 'METRICS':
+            self.metrics[name] = message['metrics']
+        elif status == 'DATA':
+            table['received'].append(message['data'])
+        elif 'pin_data' in message:
+            pin = message['pin_data']
+            table['pins'].append(message)
+            self.lines[(name, pin['name'])] = {
+                'status': status,
+                'role': pin['role'],
+                'timestamp': message['timestamp'],
+            }
+
+        for callback in self._callbacks.get(status, ()):
+            callback(message)
+
+    def drain(self, max_messages=BATCH_SIZE):
+        """Handle the messages already queued, at most max_messages, returns how many"""
+        handled = 0
+        get = self.output_queue.get_nowait
+        while handled < max_messages and not self.output_queue.empty():
+            try:
+                message = get()
+            except queue.Empty:
+                break
+            self.handle(message)
+            handled += 1
+        return handled
+
+    def poll(self):
+        """Drain everything queued and tell whether all MCUs completed, fits Simulation.run(stop_when=...)"""
+        while self.drain():
+            pass
+        return self.done
+
+    def wait(self, timeout):
+        """Block until a message arrives or `timeout` seconds passed, then drain a batch"""
+        try:
+            message = self.output_queue.get(timeout=timeout)
+        except queue.Empty:
+            return 0
+        self.handle(message)
+        return 1 + self.drain()
+
+    def run(self, timeout=None):
+        """Collect until every MCU completed or `timeout` seconds passed, returns done"""
+        deadline = None if timeout is None else self._clock() + timeout
+        while not self.done:
+            wait = WAIT_TIMEOUT
+            if deadline is not None:
+                wait = min(wait, deadline - self._clock())
+                if wait <= 0:
+                    break
+            self.wait(wait)
+        return self.done
+
+    def summary(self):
+        """One row per MCU, in the order they first reported"""
+        rows = []
+        for name, table in self.mcus.items():
+            statuses = {line_name: line['status'] for (mcu, line_name), line in self.lines.items() if mcu == name}
+            black_list = [pd['name'] for pd in table.get('black_list', [])]
+            # A line blacklisted for false responses never sends FAILED, the black list has it
+            failed = {line_name for line_name, status in statuses.items() if status == 'FAILED'} | set(black_list)
+            rows.append({
+                'mcu': name,
+                'status': table['status'],
+                'working': list(statuses.values()).count('WORKING'),
+                'failed': len(failed),
+                'white_list': [pd['name'] for pd in table.get('white_list', [])],
+                'black_list': black_list,
+                'completed_at': table['completed_at'],
+                'edges_dropped': table.get('edges_dropped', 0),
+            })
+        return rows
+
+    def format_summary(self):
+        rows = [f"{'mcu':<10}{'status':<11}{'working':>8}{'failed':>8}{'completed at':>14}  white list / black list"]
+        for row in self.summary():
+            completed_at = f"{row['completed_at']:.3f}" if row['completed_at'] is not None else '-'
+            rows.append(f"{row['mcu']:<10}{row['status']:<11}{row['working']:>8}{row['failed']:>8}{completed_at:>14}  "
+                        f"{', '.join(row['white_list']) or '-'} / {', '.join(row['black_list']) or '-'}")
+        for row in self.summary():
+            if row['edges_dropped']:
+                rows.append(f"warning: {row['mcu']} dropped {row['edges_dropped']} line edges, "
+                            f"the pulse widths it measured may be wrong")
+        return "\n".join(rows)
@@ -1,192 +1,206 @@
+"""Shared lines, the wire every MCU and pinger drives.
+
+This module is part of the dependency-free core: it imports nothing beyond
+the standard library and the other core modules at load time. pandas is
+imported by get_dataframe(), NumPy by the fault models and the trace
+arrays, and MultiLinePlotter / decimate_steps (plotting.py, Matplotlib)
+on first access, so a process that only drives lines starts fast.
+"""
 import random
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime
-from time import sleep, perf_counter
+from importlib import import_module
+from time import perf_counter
+from trace_buffer import new_trace_buffer
+from nets import net_state, publish
+
+_LAZY = {  # Analytics names loaded on first access, name -> module
+    'MultiLinePlotter': 'plotting',
+    'decimate_steps': 'plotting',
+    'DEFAULT_MAX_POINTS': 'plotting',
+    'LIVE_RECORDS': 'plotting',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def make_fault_schedule(failure_rate, fault_model=None, seed=None):
+    if fault_model is None:
+        from fault_models import IidDrop
+        fault_model = IidDrop(failure_rate)
+    if seed is None:
+        seed = random.getrandbits(64)  # Follows random.seed(), like the MCUs' slot choices
+    return fault_model.schedule(seed)
+
 
 class SharedLine:
-    def __init__(self, manager, name="SharedLine"):
+    # Union-find links of nets.py, None while the line is not connected to another one
+    _net_parent = None
+    _net_members = None
+    _net_links = None
+    _net_forked = False  # Set by nets.mark_forked once a process got a copy of the line
+
+    def __init__(self, manager, name="SharedLine", clock=perf_counter, data_log=None):
         self.holders = manager.list()
-        self.data_log = manager.list()
+        self.data_log = data_log if data_log is not None else new_trace_buffer(manager)
         self.name = name
-        self.start_time = perf_counter()
+        self._clock = clock
+        self._subscribers = []
+        self.start_time = clock()
         self._log_state()
 
+    def subscribe(self, callback):
+        """Call callback(line, state, timestamp) whenever a holder pulls or releases the line"""
+        self._subscribers.append(callback)
+
+    def _publish(self, state):
+        if self._net_parent is not None:
+            publish(self, state)
+        elif self._subscribers:
+            self._notify(state)
+
+    def _notify(self, state):
+        if self._subscribers:
+            timestamp = self._clock()
+            for callback in self._subscribers:
+                callback(self, state, timestamp)
+
     def pull_high(self, name):
         if name not in self.holders:
             self.holders.append(name)
+            self._publish(1)
         self._log_state()
 
     def release(self, name):
         if name in self.holders:
             self.holders.remove(name)
+            self._publish(1 if len(self.holders) > 0 else 0)
         self._log_state()
 
     def state(self):
+        if self._net_parent is not None:
+            return net_state(self)
+        return self._own_state()
+
+    def _own_state(self):
+        # Whether this line itself is driven, regardless of its net
         return 1 if len(self.holders) > 0 else 0
+
     def log_end(self):
         self._log_state()
 
     def _log_state(self):
-        self.data_log.append({
-            'timestamp': (perf_counter() - self.start_time) * 1000,  # milliseconds
-            'state': self.state(),
-            'holders_count': len(self.holders)
-        })
+        holders_count = len(self.holders)
+        state = 1 if holders_count > 0 else 0
+        if self._net_parent is not None:
+            state = net_state(self)  # Level of the whole net, the holders stay our own
+        self.data_log.append((self._clock() - self.start_time) * 1000,  # milliseconds
+                             state, holders_count)
     
 
     def get_dataframe(self):
-        return pd.DataFrame(list(self.data_log))
+        # Columns are views into the trace buffer, no copy
+        import pandas as pd
+        timestamp, state, holders_count = self.data_log.arrays()
+        return pd.DataFrame({'timestamp': timestamp, 'state': state, 'holders_count': holders_count}, copy=False)
 
 
 
 
-class OneWaySharedLine:
-    def __init__(self, manager, sender_name, name="OneWaySharedLine"):
+class OneWaySharedLine(SharedLine):
+    def __init__(self, manager, sender_name, name="OneWaySharedLine", clock=perf_counter, data_log=None):
         self._value = manager.Value('i', 0)
         self._sender_name = sender_name
-        self.data_log = manager.list()
+        self.data_log = data_log if data_log is not None else new_trace_buffer(manager)
         self.name = name
-        self.start_time = perf_counter()
+        self._clock = clock
+        self._subscribers = []
+        self.start_time = clock()
         
         self._log_state()
 
     def pull_high(self, name):
-        if name == self._sender_name:
+        if name == self._sender_name and self._value.value != 1:
             self._value.value = 1
+            self._publish(1)
         self._log_state()
 
     def release(self, name):
-        if name == self._sender_name:
+        if name == self._sender_name and self._value.value != 0:
             self._value.value = 0
+            self._publish(0)
         self._log_state()
 
-    def state(self):
+    def _own_state(self):
         return self._value.value
     
     def log_end(self):
         self._log_state()
 
     def _log_state(self):
-        self.data_log.append({
-            'timestamp': (perf_counter() - self.start_time) * 1000,  # milliseconds
-            'state': self.state(),
-            'sender': self._sender_name
-        })
+        state = self.state()
+        self.data_log.append((self._clock() - self.start_time) * 1000, state, state)  # milliseconds
 
     def get_dataframe(self):
-        return pd.DataFrame(list(self.data_log))
-
-
-class UnreliableSharedLine:
-    def __init__(self, manager, failure_rate=0.1, name="UnreliableSharedLine"):
+        import pandas as pd
+        timestamp, state, _ = self.data_log.arrays()
+        df = pd.DataFrame({'timestamp': timestamp, 'state': state}, copy=False)
+        df['sender'] = self._sender_name
+        return df
+
+
+class UnreliableSharedLine(SharedLine):
+    """SharedLine whose state() reads are disturbed by a seeded fault model.
+
+    Without a fault_model every read drops to LOW with probability
+    failure_rate (fault_models.IidDrop). The schedule is drawn once from
+    `seed`, or from the global random module if no seed is given, so a
+    seeded run sees the same faults at the same times on every replay.
+    """
+    def __init__(self, manager, failure_rate=0.1, name="UnreliableSharedLine", clock=perf_counter, data_log=None,
+                 fault_model=None, seed=None):
         self.holders = manager.list()
         self.failure_rate = failure_rate
-        self.data_log = manager.list()
+        self.data_log = data_log if data_log is not None else new_trace_buffer(manager)
         self.name = name
-        self.start_time = perf_counter()
+        self._clock = clock
+        self._subscribers = []
+        self.start_time = clock()
+        self.faults = make_fault_schedule(failure_rate, fault_model, seed)
         
         self._log_state()
 
-    def pull_high(self, name):
-        if name not in self.holders:
-            self.holders.append(name)
-        self._log_state()
-
-    def release(self, name):
-        if name in self.holders:
-            self.holders.remove(name)
-        self._log_state()
-
     def state(self):
-        if random.random() < self.failure_rate:
-            return 0
-        return 1 if len(self.holders) > 0 else 0
+        return self.faults.apply(SharedLine.state(self), self._clock() - self.start_time)
     
     def log_end(self):
         self._log_state()
 
     def _log_state(self):
-        actual_state = 1 if len(self.holders) > 0 else 0
-        reported_state = 0 if random.random() < self.failure_rate else actual_state
-        self.data_log.append({
-            'timestamp': (perf_counter() - self.start_time) * 1000,  # milliseconds
+        holders_count = len(self.holders)
+        actual_state = 1 if holders_count > 0 else 0
+        if self._net_parent is not None:
+            actual_state = net_state(self)
+        now = self._clock() - self.start_time
+        reported_state = self.faults.apply(actual_state, now)  # What a reader sees right now
+        # Bit 0 holds the actual state, bit 1 the reported one
+        self.data_log.append(now * 1000,  # milliseconds
+                             actual_state | reported_state << 1, holders_count)
+
+    def get_dataframe(self):
+        import pandas as pd
+        timestamp, state, holders_count = self.data_log.arrays()
+        actual_state = state & 1
+        reported_state = state >> 1
+        return pd.DataFrame({
+            'timestamp': timestamp,
             'actual_state': actual_state,
             'reported_state': reported_state,
             'failed': actual_state != reported_state,
-            'holders_count': len(self.holders)
-        })
-
-    def get_dataframe(self):
-        return pd.DataFrame(list(self.data_log))
-    
-class MultiLinePlotter:
-    def __init__(self, lines=None):
-        self.lines = lines or []
-    
-    def add_line(self, line):
-        self.lines.append(line)
-    
-    def add_lines(self, lines):
-        self.lines.extend(lines)
-    
-
-    def plot_all(self, figsize=(15, 10)):
-        if not self.lines:
-            print("No lines to plot")
-            return
-
-        num_lines = len(self.lines)
-        rows = (num_lines + 1) // 2  # Zwei Spalten
-
-        fig, axes = plt.subplots(rows, 2, figsize=figsize)
-        fig.suptitle('Shared Lines', fontsize=16)
-
-        # Stelle sicher, dass axes immer 2D ist
-        if rows == 1 and num_lines == 1:
-            axes = [[axes]]
-        elif rows == 1:
-            axes = axes.reshape(1, -1)
-
-        for i, line in enumerate(self.lines):
-            row = i // 2
-            col = i % 2
-            ax = axes[row][col]
-
-            if not line.data_log:
-                ax.text(0.5, 0.5, 'No data', ha='center', va='center', transform=ax.transAxes)
-                ax.set_title(f'{line.name} - No Data')
-                ax.axis('off')
-                continue
-
-            df = line.get_dataframe()
-
-            if isinstance(line, UnreliableSharedLine):
-                # Step-Plots für 'actual' und 'reported' Zustand
-                ax.step(df['timestamp'], df['actual_state'], where='post', label='Actual', alpha=0.7)
-                ax.step(df['timestamp'], df['reported_state'], where='post', label='Reported', alpha=0.7)
-
-                # Fehlerpunkte als Scatter
-                failures = df[df['failed'] == True]
-                if not failures.empty:
-                    ax.scatter(failures['timestamp'], failures['reported_state'], 
-                            color='red', s=20, label='Failures', zorder=5)
-                ax.legend()
-            else:
-                state_col = 'state' if 'state' in df.columns else 'reported_state'
-                ax.step(df['timestamp'], df[state_col], where='post', alpha=0.9)
-
-            ax.set_title(f'{line.name}')
-            ax.set_xlabel('Time (ms)')
-            ax.set_ylabel('State')
-            ax.set_yticks([0, 1])
-            ax.set_yticklabels(['LOW', 'HIGH'])
-            ax.set_ylim(-0.2, 1.2)
-            ax.grid(True, which='both', linestyle='--', alpha=0.3)
-
-        # Leeres Subplot ausblenden bei ungerader Zahl
-        if num_lines % 2 == 1 and num_lines > 1:
-            axes[rows-1][1].set_visible(False)
-
-        plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-        plt.show()
\ No newline at end of file
+            'holders_count': holders_count
+        }, copy=False)
@@ -0,0 +1,218 @@
+import heapq
+import itertools
+from collections import deque
+from time import process_time
+
+from timebase import Sleep
+from trace_buffer import TraceBuffer
+from mcu import MCU
+from pinger import Pinger, PulseScheduler, Bridge
+
+MAX_DELTA_CYCLES = 10000  # Wake-ups at one instant before we call it a livelock
+
+
+class SimulationValue:
+    def __init__(self, value):
+        self.value = value
+
+
+class SimulationQueue:
+    """In-process stand-in for multiprocessing.Queue that wakes up waiting routines on put()"""
+    dropped = 0  # Never drops an item, like an EdgeChannel that kept up
+
+    def __init__(self, waker):
+        self._waker = waker  # Anything with notify(), usually the Simulation
+        self._items = deque()
+
+    def put(self, item):
+        self._items.append(item)
+        self._waker.notify()
+
+    def get(self, block=True, timeout=None):
+        return self._items.popleft()
+
+    def get_nowait(self):
+        return self._items.popleft()
+
+    def empty(self):
+        return not self._items
+
+    def qsize(self):
+        return len(self._items)
+
+
+class SimulationManager:
+    """Drop-in for multiprocessing.Manager() whose containers are plain in-process objects"""
+    def list(self, *args):
+        return list(*args)
+
+    def dict(self, *args, **kwargs):
+        return dict(*args, **kwargs)
+
+    def Value(self, typecode, value):
+        return SimulationValue(value)
+
+    def TraceBuffer(self, **kwargs):
+        return TraceBuffer(shared=False, **kwargs)
+
+
+class Simulation:
+    """Discrete-event engine that runs MCUs, lines, pingers and bridges in virtual time.
+
+    Every component exposes its behaviour as a routine, a generator yielding
+    Sleep or WaitUntil requests (see timebase.py). Instead of sleeping, the
+    engine jumps the virtual clock to the next deadline. A routine blocked in
+    WaitUntil is also resumed, at the same instant, whenever a line changes or
+    something is put on a simulation queue.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.manager = SimulationManager()
+        self.output_queue = SimulationQueue(self)
+        self.lines = []  # Lines added, their trace buffers are freed by close()
+
+        self._routines = []
+        self._timers = []  # heap of (time, token, routine)
+        self._tokens = {}  # routine -> token of its current suspension
+        self._waiting = {}  # routine -> token, routines blocked in WaitUntil
+        self._seq = itertools.count()
+        self._activity = False
+
+    def clock(self):
+        return self.now
+
+    def notify(self, *args):
+        self._activity = True
+
+    def queue(self):
+        return SimulationQueue(self)
+
+    def add_line(self, line):
+        line.subscribe(self.notify)
+        self.lines.append(line)
+        return line
+
+    def add_mcu(self, mcu: MCU):
+        mcu.interrupt_queue = self.queue()
+        mcu.edges = self.queue()
+        if mcu.data_channel is not None:
+            mcu.data_requests = self.queue()
+        for routine in mcu._logic_routines():
+            self.add_routine(routine)
+        self.add_routine(mcu._watch_edges())
+        return mcu
+
+    def add_pinger(self, pinger: Pinger):
+        self.add_routine(pinger._pulses())
+        return pinger
+
+    def add_scheduler(self, scheduler: PulseScheduler):
+        self.add_routine(scheduler._routine())
+        return scheduler
+
+    def add_bridge(self, bridge: Bridge):
+        # Bridged lines form a net that needs no routine, their edges already wake us up
+        bridge.start()
+        return bridge
+
+    def add_routine(self, routine):
+        self._routines.append(routine)
+        self._schedule(routine, self.now)
+
+    def _schedule(self, routine, time):
+        token = next(self._seq)
+        self._tokens[routine] = token
+        heapq.heappush(self._timers, (max(time, self.now), token, routine))
+        return token
+
+    def _step(self, routine):
+        self._waiting.pop(routine, None)
+        try:
+            request = next(routine)
+        except StopIteration:
+            self._routines.remove(routine)
+            del self._tokens[routine]
+            return
+
+        if isinstance(request, Sleep):
+            self._schedule(routine, self.now + request.duration)
+        elif request.deadline is not None:
+            self._waiting[routine] = self._schedule(routine, request.deadline)
+        else:
+            token = next(self._seq)
+            self._tokens[routine] = token
+            self._waiting[routine] = token
+
+    def _settle(self):
+        cycles = 0
+        while self._activity:
+            self._activity = False
+            cycles += 1
+            if cycles > MAX_DELTA_CYCLES:
+                raise RuntimeError(f"Simulation does not settle at t={self.now:.6f}s")
+            for routine in list(self._waiting):
+                if routine in self._waiting:
+                    self._step(routine)
+
+    def run(self, until=None, stop_when=None):
+        """Run until no routine is left to wake, `until` seconds are reached or stop_when() is true"""
+        self._settle()
+        while self._timers:
+            time, token, routine = self._timers[0]
+            if until is not None and time > until:
+                self.now = until
+                break
+            heapq.heappop(self._timers)
+            if self._tokens.get(routine) != token:
+                continue
+
+            self.now = time
+            self._step(routine)
+            self._settle()
+            if stop_when is not None and stop_when():
+                break
+        return self.now
+
+    def stop(self):
+        """Close all routines, this runs their cleanup (e.g. releasing held lines)"""
+        for routine in list(self._routines):
+            routine.close()
+        self._routines.clear()
+        self._timers.clear()
+        self._tokens.clear()
+        self._waiting.clear()
+
+    def close(self):
+        """stop() and free the trace buffers of the added lines, call it once nobody reads the traces anymore"""
+        self.stop()
+        for line in self.lines:
+            line.data_log.close()
+            line.data_log.unlink()
+        self.lines.clear()
+
+
+if __name__ == "__main__":
+    from shared_lines import SharedLine
+
+    # Scenario 4 from main.py in virtual time
+    sim = Simulation()
+    shared_lines = {name: sim.add_line(SharedLine(sim.manager, name=name, clock=sim.clock))
+                    for name in ("L1", "L2", "L3", "L4")}
+    wiring = [(name, shared_lines[name]) for name in ("L1", "L2", "L3")]
+
+    mcu1 = sim.add_mcu(MCU("A", wiring, sim.output_queue, clock=sim.clock))
+    mcu2 = sim.add_mcu(MCU("B", wiring, sim.output_queue, clock=sim.clock))
+
+    cpu_start = process_time()
+    sim.run(until=60.0)
+    cpu_time = process_time() - cpu_start
+    sim.close()
+
+    while not sim.output_queue.empty():
+        data = sim.output_queue.get()
+        if data['status'] == 'COMPLETED':
+            print(f"\nMCU {data['mcu_name']} completed at {data['timestamp']:.3f} s (virtual)")
+            print(f"Working pins: {[pd['name'] for pd in data['white_list']]}")
+            print(f"Failed pins: {[pd['name'] for pd in data['black_list']]}")
+    print(f"\nVirtual time: {sim.now:.3f} s, CPU time: {cpu_time * 1000:.1f} ms")
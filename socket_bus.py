@@ -0,0 +1,566 @@
+"""Line bus served over a Unix domain socket or TCP.
+
+Lines of a Manager or of the shared memory bus only reach the processes
+forked from the one that created them. A LineBusServer owns the holder
+masks of its lines instead and clients connect to it, so independently
+started MCU processes, or MCUs on other hosts, share lines by name:
+
+    python socket_bus.py --tcp 127.0.0.1:7878          # or --unix /tmp/lines.sock
+
+    bus = SocketLineBus(("127.0.0.1", 7878))           # or "/tmp/lines.sock"
+    wiring = [(name, SocketSharedLine(bus, name)) for name in ("L1", "L2")]
+    mcu = MCU("A", wiring, output_queue)
+
+Protocol: every frame is a 5 byte header (type, payload length) and a
+struct packed payload. pull_high/release is one request and one reply.
+state() never waits for the server: a connection that reads states asks
+once for a snapshot of all masks and from then on the server pushes every
+mask change to it, so reads come from a local mirror. Edges the server
+collects during one pass of its loop go out as one batched frame per
+connection. The subscribers of a line are called from a listener thread
+in the process that subscribed, with the server's edge timestamps moved
+to the local clock.
+"""
+import argparse
+import os
+import selectors
+import socket
+import struct
+import threading
+from multiprocessing import Event, Process
+from time import perf_counter
+
+from shared_lines import SharedLine
+from trace_buffer import new_trace_buffer
+from nets import net_state, publish
+from line_bus import MAX_HOLDERS
+
+HEADER = struct.Struct('<BI')  # Frame type, payload length
+INDEX = struct.Struct('<H')
+LINE_INFO = struct.Struct('<HQ')  # Line index, current mask
+SLOT = struct.Struct('<B')
+DRIVE = struct.Struct('<HB')  # Line index, holder slot
+ACK = struct.Struct('<QB')  # Mask after the request, whether it changed
+EDGE = struct.Struct('<HQd')  # Line index, new mask, server timestamp (seconds)
+PING = struct.Struct('<d')
+PONG = struct.Struct('<dd')  # Client timestamp echoed, server timestamp
+
+# Frame types, requests and their replies share the type
+LINE, HOLDER, PULL, RELEASE, WATCH, SNAPSHOT, NAMES, TIME = b'LHPRWSNT'
+EDGES = ord('E')  # Pushed by the server, never a reply
+
+MAX_LINES = 1 << 16
+MAX_BACKLOG = 8 << 20  # Bytes queued for one client before it counts as stuck and gets dropped
+RECV_SIZE = 1 << 16
+SYNC_PINGS = 8  # Round trips of the clock offset estimate, the shortest one wins
+
+
+def parse_address(text):
+    """'host:port' becomes a TCP address, anything else a Unix socket path"""
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit():
+        return host or '127.0.0.1', int(port)
+    return text
+
+
+def _socket(address):
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def _frame(kind, payload=b''):
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def _pop_frame(buffer):
+    """First complete (type, payload) frame of `buffer`, removed from it, or None"""
+    if len(buffer) < HEADER.size:
+        return None
+    kind, length = HEADER.unpack_from(buffer)
+    end = HEADER.size + length
+    if end > len(buffer):
+        return None
+    payload = bytes(buffer[HEADER.size:end])
+    del buffer[:end]
+    return kind, payload
+
+
+def _split_frames(buffer):
+    """Complete (type, payload) frames at the start of `buffer`, removed from it"""
+    frames = []
+    start = 0
+    while len(buffer) - start >= HEADER.size:
+        kind, length = HEADER.unpack_from(buffer, start)
+        end = start + HEADER.size + length
+        if end > len(buffer):
+            break
+        frames.append((kind, bytes(buffer[start + HEADER.size:end])))
+        start = end
+    del buffer[:start]
+    return frames
+
+
+class _Client:
+    """Server side state of one connection"""
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.watching = False
+        self.driven = set()  # (line index, holder bit) this connection pulled high and still owns
+
+
+class LineBusServer:
+    """Holder masks of named lines, one bit per holder name like SharedMemoryLineBus.
+
+    Runs single threaded on a selector. A client that disconnects releases
+    every line it still holds, so a crashed MCU does not keep its lines high.
+    A holder bit belongs to the connection that pulled it last: a holder
+    that reconnected and pulled again keeps its lines when the old
+    connection closes.
+    """
+    def __init__(self, address, clock=perf_counter):
+        self.address = address
+        self._clock = clock
+        self.masks = []
+        self.lines = {}  # Line name -> index
+        self.holders = []  # Holder slot -> name
+        self._slots = {}
+        self._owners = {}  # (line index, holder bit) -> client whose PULL set it
+        self._edges = []
+        self.stop_event = Event()
+
+    def _listen(self):
+        sock = _socket(self.address)
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.address)
+        sock.listen(1024)
+        sock.setblocking(False)
+        return sock
+
+    def serve(self, ready=None):
+        """Serve until stop() is called, sets `ready` once clients can connect"""
+        listener = self._listen()
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        clients = []
+        if ready is not None:
+            ready.set()
+        try:
+            while not self.stop_event.is_set():
+                for key, events in selector.select(timeout=0.1):
+                    if key.data is None:
+                        self._accept(listener, selector, clients)
+                        continue
+                    client = key.data
+                    if client not in clients:
+                        continue  # Dropped earlier in this pass
+                    if events & selectors.EVENT_READ:
+                        self._receive(client, selector, clients)
+                    if events & selectors.EVENT_WRITE and client in clients:
+                        self._send(client, selector, clients)
+                self._flush(selector, clients)
+        finally:
+            for client in clients:
+                client.sock.close()
+            selector.close()
+            listener.close()
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def _accept(self, listener, selector, clients):
+        try:
+            sock, _ = listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        if sock.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = _Client(sock)
+        clients.append(client)
+        selector.register(sock, selectors.EVENT_READ, client)
+
+    def _drop(self, client, selector, clients):
+        selector.unregister(client.sock)
+        client.sock.close()
+        clients.remove(client)
+        for index, bit in client.driven:
+            del self._owners[index, bit]
+            if self.masks[index] & bit:
+                self._drive(index, self.masks[index] & ~bit)
+        client.driven.clear()
+
+    def _receive(self, client, selector, clients):
+        try:
+            data = client.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(client, selector, clients)
+            return
+        client.inbox += data
+        try:
+            for kind, payload in _split_frames(client.inbox):
+                client.outbox += self._handle(client, kind, payload)
+        except (ValueError, RuntimeError, IndexError, struct.error) as error:
+            print(f"Line bus: dropping a client: {error}")
+            self._drop(client, selector, clients)
+
+    def _handle(self, client, kind, payload):
+        if kind == PULL or kind == RELEASE:
+            index, slot = DRIVE.unpack(payload)
+            bit = 1 << slot
+            mask = self.masks[index]
+            new = mask | bit if kind == PULL else mask & ~bit
+            owner = self._owners.pop((index, bit), None)
+            if owner is not None:
+                owner.driven.discard((index, bit))
+            if kind == PULL:
+                self._owners[index, bit] = client
+                client.driven.add((index, bit))
+            if new != mask:
+                self._drive(index, new)
+            return _frame(kind, ACK.pack(new, new != mask))
+        if kind == LINE:
+            index = self._line(payload.decode('utf-8'))
+            return _frame(kind, LINE_INFO.pack(index, self.masks[index]))
+        if kind == HOLDER:
+            return _frame(kind, SLOT.pack(self._slot(payload.decode('utf-8'))))
+        if kind == WATCH or kind == SNAPSHOT:
+            client.watching = client.watching or kind == WATCH
+            return _frame(kind, struct.pack(f'<{len(self.masks)}Q', *self.masks))
+        if kind == NAMES:
+            mask = self.masks[INDEX.unpack(payload)[0]]
+            names = [name for slot, name in enumerate(self.holders) if mask >> slot & 1]
+            return _frame(kind, '\0'.join(names).encode('utf-8'))
+        if kind == TIME:
+            return _frame(kind, PONG.pack(PING.unpack(payload)[0], self._clock()))
+        raise ValueError(f"Unknown frame type {kind}")
+
+    def _line(self, name):
+        index = self.lines.get(name)
+        if index is None:
+            if len(self.masks) >= MAX_LINES:
+                raise RuntimeError(f"Line bus is full ({MAX_LINES} lines)")
+            index = self.lines[name] = len(self.masks)
+            self.masks.append(0)
+        return index
+
+    def _slot(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            if len(self.holders) >= MAX_HOLDERS:
+                raise RuntimeError(f"Line bus holder table is full ({MAX_HOLDERS} holders)")
+            slot = self._slots[name] = len(self.holders)
+            self.holders.append(name)
+        return slot
+
+    def _drive(self, index, mask):
+        self.masks[index] = mask
+        self._edges.append(EDGE.pack(index, mask, self._clock()))
+
+    def _flush(self, selector, clients):
+        # One batched frame with this pass's edges for every watching client, then send what is queued
+        if self._edges:
+            edges = _frame(EDGES, b''.join(self._edges))
+            self._edges.clear()
+            for client in clients:
+                if client.watching:
+                    client.outbox += edges
+        for client in list(clients):
+            if client.outbox:
+                self._send(client, selector, clients)
+
+    def _send(self, client, selector, clients):
+        try:
+            sent = client.sock.send(client.outbox)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._drop(client, selector, clients)
+            return
+        del client.outbox[:sent]
+        if len(client.outbox) > MAX_BACKLOG:
+            self._drop(client, selector, clients)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbox else 0)
+        selector.modify(client.sock, events, client)
+
+    def start(self):
+        """Serve from a new process, returns once it accepts connections"""
+        ready = Event()
+        self.process = Process(target=self.serve, args=(ready,))
+        self.process.start()
+        ready.wait()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self):
+        self.process.join()
+
+
+class _Connection:
+    """One process's blocking connection, keeps the mirror of all masks once it watches"""
+    def __init__(self, address):
+        self.sock = _socket(address)
+        self.sock.connect(address)
+        self.inbox = bytearray()
+        self.masks = None  # Mirror, filled by watch()
+        self.on_edges = None  # Called with every pushed batch instead of updating the mirror
+        self.lock = threading.Lock()  # A listener thread may read states while edges are dispatched
+
+    def _read(self, flags=0):
+        data = self.sock.recv(RECV_SIZE, flags)
+        if not data:
+            raise ConnectionError("Line bus server closed the connection")
+        self.inbox += data
+
+    def _edges(self, payload):
+        if self.on_edges is not None:
+            self.on_edges(payload)
+            return
+        for index, mask, _ in EDGE.iter_unpack(payload):
+            self.apply(index, mask)
+
+    def apply(self, index, mask):
+        masks = self.masks
+        if index >= len(masks):
+            masks.extend([0] * (index + 1 - len(masks)))
+        masks[index] = mask
+
+    def request(self, kind, payload=b''):
+        """Send a request and wait for its reply, pushed edges in between update the mirror"""
+        with self.lock:
+            self.sock.sendall(_frame(kind, payload))
+            while True:
+                frame = _pop_frame(self.inbox)
+                if frame is None:
+                    self._read()
+                elif frame[0] == EDGES:
+                    self._edges(frame[1])
+                else:
+                    return frame[1]  # One request is in flight, so this is its reply
+
+    def poll(self):
+        """Apply the edges that already arrived, without blocking"""
+        with self.lock:
+            try:
+                self._read(socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return
+            for _, frame in _split_frames(self.inbox):
+                self._edges(frame)  # Nothing else arrives while no request is in flight
+
+    def watch(self):
+        payload = self.request(WATCH)
+        self.masks = list(struct.unpack(f'<{len(payload) // 8}Q', payload))
+
+    def close(self):
+        self.sock.close()
+
+
+class SocketLineBus:
+    """Client of a LineBusServer, usable from any process.
+
+    Every process opens its own connection on first use, so a bus created
+    before the processes fork keeps working in all of them. Pickling keeps
+    only the address.
+    """
+    def __init__(self, address, clock=perf_counter, manager=None):
+        self.address = address
+        self._clock = clock
+        self.manager = manager  # Only decides where the line traces live
+        self._attach()
+
+    def _attach(self):
+        self._pid = os.getpid()
+        self._connection = None
+        self._slots = {}  # Per process cache: holder name -> slot
+        self._listener = None
+        self._listening = {}  # Line index -> lines whose subscribers this process calls
+        self._offset = 0.0  # Server clock minus our clock
+
+    def __getstate__(self):
+        return {'address': self.address, '_clock': self._clock, 'manager': self.manager}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def _conn(self):
+        if self._pid != os.getpid():
+            # Forked: the parent's connection and listener stay the parent's
+            inherited = (self._connection, self._listener)
+            self._attach()
+            for connection in inherited:
+                if connection is not None:
+                    connection.close()
+        if self._connection is None:
+            self._connection = _Connection(self.address)
+        return self._connection
+
+    def line(self, name):
+        """(index, mask) of the line called `name`, created on first use by any client"""
+        return LINE_INFO.unpack(self._conn().request(LINE, name.encode('utf-8')))
+
+    def _slot(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = self._slots[name] = SLOT.unpack(self._conn().request(HOLDER, name.encode('utf-8')))[0]
+        return slot
+
+    def drive(self, kind, index, name):
+        """PULL or RELEASE for holder `name`, returns (mask afterwards, whether it changed)"""
+        connection = self._conn()
+        mask, changed = ACK.unpack(connection.request(kind, DRIVE.pack(index, self._slot(name))))
+        if changed and connection.masks is not None:
+            connection.apply(index, mask)  # Our own write is visible before its pushed edge arrives
+        return mask, changed
+
+    def pull_high(self, index, name):
+        """Set the holder bit of `name`, returns the new mask or None if nothing changed"""
+        mask, changed = self.drive(PULL, index, name)
+        return mask if changed else None
+
+    def release(self, index, name):
+        """Clear the holder bit of `name`, returns the new mask or None if nothing changed"""
+        mask, changed = self.drive(RELEASE, index, name)
+        return mask if changed else None
+
+    def mask(self, index):
+        """Mask from the local mirror, as of the last edge the server pushed"""
+        connection = self._conn()
+        if connection.masks is None:
+            connection.watch()
+        else:
+            connection.poll()
+        masks = connection.masks
+        return masks[index] if index < len(masks) else 0
+
+    def snapshot(self):
+        """Masks of all lines in one round trip"""
+        payload = self._conn().request(SNAPSHOT)
+        return list(struct.unpack(f'<{len(payload) // 8}Q', payload))
+
+    def holder_names(self, index):
+        payload = self._conn().request(NAMES, INDEX.pack(index))
+        return payload.decode('utf-8').split('\0') if payload else []
+
+    def listen(self, line):
+        """Call line's subscribers on every pushed edge of it, from a thread of this process"""
+        self._conn()
+        self._listening.setdefault(line._index, []).append(line)
+        if self._listener is None:
+            connection = _Connection(self.address)
+            self._offset = self._sync_clock(connection)
+            connection.on_edges = self._dispatch
+            connection.watch()
+            self._listener = connection
+            threading.Thread(target=self._listen, args=(connection,), daemon=True).start()
+
+    def _sync_clock(self, connection):
+        best = None
+        for _ in range(SYNC_PINGS):
+            sent = self._clock()
+            _, server = PONG.unpack(connection.request(TIME, PING.pack(sent)))
+            received = self._clock()
+            if best is None or received - sent < best[0]:
+                best = (received - sent, server - (sent + received) / 2)
+        return best[1]
+
+    def _listen(self, connection):
+        try:
+            while True:
+                connection._read()
+                for _, frame in _split_frames(connection.inbox):
+                    self._dispatch(frame)
+        except (ConnectionError, OSError):
+            pass  # Server stopped or the bus was closed
+
+    def _dispatch(self, payload):
+        for index, mask, timestamp in EDGE.iter_unpack(payload):
+            for line in self._listening.get(index, ()):
+                line._pushed_edge(mask, timestamp - self._offset)
+
+    def close(self):
+        for connection in (self._connection, self._listener):
+            if connection is not None:
+                connection.close()
+        self._connection = self._listener = None
+
+
+class SocketSharedLine(SharedLine):
+    """SharedLine on a LineBusServer, lines with the same name are the same line on every client.
+
+    Edges reach the subscribers through the server, including the edges of
+    this process's own pull_high/release calls.
+    """
+    def __init__(self, bus, name="SharedLine", clock=perf_counter):
+        self._bus = bus
+        self._index, mask = bus.line(name)
+        self.data_log = new_trace_buffer(bus.manager)
+        self.name = name
+        self._clock = clock
+        self._subscribers = []
+        self.start_time = clock()
+        self._log(mask)
+
+    def subscribe(self, callback):
+        if not self._subscribers:
+            self._bus.listen(self)
+        self._subscribers.append(callback)
+
+    @property
+    def holders(self):
+        return self._bus.holder_names(self._index)
+
+    # The trace takes the mask from the server's reply, a process that only drives never needs the mirror
+    def pull_high(self, name):
+        self._log(self._bus.drive(PULL, self._index, name)[0])
+
+    def release(self, name):
+        self._log(self._bus.drive(RELEASE, self._index, name)[0])
+
+    def _pushed_edge(self, mask, timestamp):
+        state = 1 if mask else 0
+        if self._net_parent is not None:
+            publish(self, state)
+        else:
+            for callback in self._subscribers:
+                callback(self, state, timestamp)
+
+    def _own_state(self):
+        return 1 if self._bus.mask(self._index) else 0
+
+    def _log_state(self):
+        self._log(self._bus.mask(self._index))
+
+    def _log(self, mask):
+        state = net_state(self) if self._net_parent is not None else (1 if mask else 0)
+        self.data_log.append((self._clock() - self.start_time) * 1000,  # milliseconds
+                             state, mask.bit_count())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--unix", default=None, help="Socket path")
+    where.add_argument("--tcp", default=None, help="host:port")
+    args = parser.parse_args()
+
+    server = LineBusServer(args.unix or parse_address(args.tcp))
+    print(f"Line bus serving on {server.address}")
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import unittest
+from time import perf_counter, sleep
+
+from socket_bus import LineBusServer, SocketLineBus
+
+TIMEOUT = 5.0
+
+
+class LineBusServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = LineBusServer(os.path.join(self.directory.name, "lines.sock"))
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self.server.serve, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait()
+        self.buses = []
+
+    def tearDown(self):
+        for bus in self.buses:
+            bus.close()
+        self.server.stop()
+        self.thread.join()
+        self.directory.cleanup()
+
+    def connect(self):
+        bus = SocketLineBus(self.server.address)
+        self.buses.append(bus)
+        return bus
+
+    def wait_for_mask(self, bus, index, expected):
+        # Every request's reply comes after the edges the server pushed before it
+        deadline = perf_counter() + TIMEOUT
+        while bus.snapshot()[index] != expected or bus.mask(index) != expected:
+            self.assertLess(perf_counter(), deadline, f"line {index} never reached mask {expected}")
+            sleep(0.01)
+
+    def test_pull_and_release(self):
+        bus = self.connect()
+        index, mask = bus.line("L1")
+        self.assertEqual(mask, 0)
+        self.assertEqual(bus.pull_high(index, "A"), 0b01)
+        self.assertIsNone(bus.pull_high(index, "A"))  # Already held
+        self.assertEqual(bus.pull_high(index, "B"), 0b11)
+        self.assertEqual(sorted(bus.holder_names(index)), ["A", "B"])
+        self.assertEqual(bus.release(index, "A"), 0b10)
+        self.assertEqual(bus.release(index, "B"), 0)
+        self.assertIsNone(bus.release(index, "B"))
+
+    def test_watch_mirrors_other_clients(self):
+        driver, watcher = self.connect(), self.connect()
+        index, _ = driver.line("L1")
+        self.assertEqual(watcher.mask(index), 0)  # Starts watching
+        driver.pull_high(index, "A")
+        self.wait_for_mask(watcher, index, 1)
+        driver.release(index, "A")
+        self.wait_for_mask(watcher, index, 0)
+
+    def test_disconnect_releases_held_lines(self):
+        crashed, other = self.connect(), self.connect()
+        index, _ = crashed.line("L1")
+        crashed.pull_high(index, "A")
+        other.pull_high(index, "B")
+        crashed.close()
+        self.wait_for_mask(other, index, 0b10)
+
+    def test_disconnect_keeps_lines_pulled_again_elsewhere(self):
+        old, new, watcher = self.connect(), self.connect(), self.connect()
+        index, _ = old.line("L1")
+        released, _ = old.line("L2")
+        marker, _ = old.line("L3")
+        old.pull_high(index, "A")
+        new.pull_high(index, "A")  # Reconnected holder, its bit is set already
+        old.pull_high(released, "A")
+        old.release(released, "A")
+        new.pull_high(released, "A")
+        old.pull_high(marker, "A")  # Only the old connection holds it, its release shows the drop happened
+        old.close()
+
+        self.wait_for_mask(watcher, marker, 0)
+        self.assertEqual(watcher.snapshot()[index], 1)
+        self.assertEqual(watcher.snapshot()[released], 1)
+        new.release(index, "A")
+        new.release(released, "A")
+        self.wait_for_mask(watcher, index, 0)
+        self.wait_for_mask(watcher, released, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+"""Run many discovery scenarios in virtual time and aggregate the results.
+
+Every scenario is a combination of line count, asymmetric/crossed wiring,
+UnreliableSharedLine failure rate, Pinger interference and Bridge shorts.
+Each repetition is seeded from (seed, scenario, repetition), so a run gives
+the same result no matter which worker picks it up.
+
+    python sweep.py --repetitions 20 --output sweep_results.csv
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import random
+import statistics
+from multiprocessing import Pool, set_start_method
+
+from shared_lines import SharedLine, UnreliableSharedLine
+from mcu import MCU
+from pinger import Pinger, PulseScheduler, Bridge
+from simulation import Simulation
+
+LINE_COUNTS = [1, 2, 3, 4, 8]
+EXTRA_LINES = [0, 1]  # Lines only wired to MCU A
+CROSSED = [False, True]  # MCU B names the shared lines in reverse order
+FAILURE_RATES = [0.0, 0.01, 0.05]
+PINGERS = [0, 1]
+BRIDGES = [0, 1]
+
+TIME_LIMIT = 300.0  # Virtual seconds per run
+
+COLUMNS = [
+    'scenario', 'lines', 'extra_lines', 'crossed', 'failure_rate', 'pingers', 'bridges',
+    'runs', 'completed_rate', 'success_rate', 'false_blacklist_rate', 'false_whitelist_rate',
+    'discovery_time_mean', 'discovery_time_median', 'discovery_time_p95',
+    'working_messages', 'failed_messages',
+]
+
+
+def scenarios():
+    grid = itertools.product(LINE_COUNTS, EXTRA_LINES, CROSSED, FAILURE_RATES, PINGERS, BRIDGES)
+    for index, (lines, extra, crossed, failure_rate, pingers, bridges) in enumerate(grid):
+        if bridges and lines < 2:
+            continue
+        yield {
+            'scenario': index,
+            'lines': lines,
+            'extra_lines': extra,
+            'crossed': crossed,
+            'failure_rate': failure_rate,
+            'pingers': pingers,
+            'bridges': bridges,
+        }
+
+
+def run_seed(base_seed, scenario, repetition):
+    return (base_seed * 1000003 + scenario['scenario']) * 1000003 + repetition
+
+
+def run_scenario(scenario, seed, time_limit=TIME_LIMIT):
+    """Simulate one scenario and return the metrics of this run"""
+    random.seed(seed)
+    sim = Simulation()
+
+    def make_line(name, failure_rate=0.0):
+        if failure_rate > 0:
+            line = UnreliableSharedLine(sim.manager, failure_rate=failure_rate, name=name, clock=sim.clock)
+        else:
+            line = SharedLine(sim.manager, name=name, clock=sim.clock)
+        return sim.add_line(line)
+
+    shared = [make_line(f"L{i + 1}", scenario['failure_rate']) for i in range(scenario['lines'])]
+    only_a = [make_line(f"X{i + 1}") for i in range(scenario['extra_lines'])]
+
+    wiring_a = [(line.name, line) for line in shared + only_a]
+    names_b = [line.name for line in shared]
+    if scenario['crossed']:
+        names_b.reverse()
+    wiring_b = list(zip(names_b, shared))
+
+    # Pingers sit on the last shared lines, bridges short the first ones in pairs
+    scheduler = PulseScheduler(clock=sim.clock)
+    for i in range(scenario['pingers']):
+        line = shared[-1 - i % len(shared)]
+        scheduler.add(Pinger(line, name=f"Pinger{i + 1}", clock=sim.clock))
+    if scheduler.sources:
+        sim.add_scheduler(scheduler)
+    bridged = set()
+    for i in range(scenario['bridges']):
+        pair = shared[2 * i:2 * i + 2]
+        if len(pair) == 2:
+            sim.add_bridge(Bridge(pair, name=f"Bridge{i + 1}"))
+            bridged.update(id(line) for line in pair)
+
+    # A line is connected if both MCUs are wired to it and no bridge shorts it
+    connected = {
+        'A': {name for name, line in wiring_a if line in shared and id(line) not in bridged},
+        'B': {name for name, line in wiring_b if id(line) not in bridged},
+    }
+
+    mcus = [
+        sim.add_mcu(MCU("A", wiring_a, sim.output_queue, clock=sim.clock)),
+        sim.add_mcu(MCU("B", wiring_b, sim.output_queue, clock=sim.clock)),
+    ]
+
+    messages = []
+
+    def collect():
+        while not sim.output_queue.empty():
+            messages.append(sim.output_queue.get())
+        return sum(1 for m in messages if m['status'] == 'COMPLETED') == len(mcus)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.run(until=time_limit, stop_when=collect)
+        collect()
+        sim.close()
+
+    working = {mcu.name: set() for mcu in mcus}
+    blacklisted = {mcu.name: set() for mcu in mcus}
+    completed_at = {}
+    for message in messages:
+        if message['status'] == 'WORKING':
+            working[message['mcu_name']].add(message['pin_data']['name'])
+        elif message['status'] == 'COMPLETED':
+            completed_at[message['mcu_name']] = message['timestamp']
+            blacklisted[message['mcu_name']].update(pd['name'] for pd in message['black_list'])
+
+    num_connected = sum(len(names) for names in connected.values())
+    num_unconnected = sum(len(mcu.all_lines) - len(connected[mcu.name]) for mcu in mcus)
+    false_blacklists = sum(len(blacklisted[name] & connected[name]) for name in connected)
+    false_whitelists = sum(len(working[name] - connected[name]) for name in connected)
+    completed = len(completed_at) == len(mcus)
+
+    return {
+        'scenario': scenario['scenario'],
+        'seed': seed,
+        'completed': completed,
+        'success': completed and all(working[name] == connected[name] for name in connected),
+        'discovery_time': max(completed_at.values()) if completed else None,
+        'false_blacklists': false_blacklists,
+        'connected_lines': num_connected,
+        'false_whitelists': false_whitelists,
+        'unconnected_lines': num_unconnected,
+        'working_messages': sum(1 for m in messages if m['status'] == 'WORKING'),
+        'failed_messages': sum(1 for m in messages if m['status'] == 'FAILED'),
+    }
+
+
+def _run(job):
+    scenario, seed, time_limit = job
+    return run_scenario(scenario, seed, time_limit)
+
+
+def aggregate(scenario, runs):
+    times = sorted(r['discovery_time'] for r in runs if r['discovery_time'] is not None)
+    connected = sum(r['connected_lines'] for r in runs)
+    unconnected = sum(r['unconnected_lines'] for r in runs)
+    row = dict(scenario)
+    row.update({
+        'runs': len(runs),
+        'completed_rate': sum(r['completed'] for r in runs) / len(runs),
+        'success_rate': sum(r['success'] for r in runs) / len(runs),
+        'false_blacklist_rate': sum(r['false_blacklists'] for r in runs) / connected if connected else 0.0,
+        'false_whitelist_rate': sum(r['false_whitelists'] for r in runs) / unconnected if unconnected else 0.0,
+        'discovery_time_mean': statistics.fmean(times) if times else None,
+        'discovery_time_median': statistics.median(times) if times else None,
+        'discovery_time_p95': times[min(len(times) - 1, int(0.95 * len(times)))] if times else None,
+        'working_messages': sum(r['working_messages'] for r in runs),
+        'failed_messages': sum(r['failed_messages'] for r in runs),
+    })
+    return row
+
+
+def sweep(repetitions=10, workers=None, seed=0, time_limit=TIME_LIMIT):
+    """Run every scenario `repetitions` times over a process pool, returns one row per scenario"""
+    by_id = {s['scenario']: s for s in scenarios()}
+    jobs = [(s, run_seed(seed, s, rep), time_limit) for s in by_id.values() for rep in range(repetitions)]
+
+    results = {scenario_id: [] for scenario_id in by_id}
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(_run, jobs, chunksize=8):
+            results[result['scenario']].append(result)
+
+    return [aggregate(by_id[scenario_id], runs) for scenario_id, runs in results.items()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT)
+    parser.add_argument("--output", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    set_start_method("fork")
+    rows = sweep(args.repetitions, args.workers, args.seed, args.time_limit)
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    runs = sum(row['runs'] for row in rows)
+    print(f"{len(rows)} scenarios, {runs} runs -> {args.output}")
+    print(f"{'lines':>5}{'completed':>11}{'success':>9}{'false bl':>10}{'mean time':>11}")
+    for lines in LINE_COUNTS:
+        group = [row for row in rows if row['lines'] == lines]
+        times = [row['discovery_time_mean'] for row in group if row['discovery_time_mean'] is not None]
+        print(f"{lines:>5}"
+              f"{statistics.fmean(row['completed_rate'] for row in group):>11.2f}"
+              f"{statistics.fmean(row['success_rate'] for row in group):>9.2f}"
+              f"{statistics.fmean(row['false_blacklist_rate'] for row in group):>10.2f}"
+              f"{(statistics.fmean(times) if times else float('nan')):>10.1f}s")
@@ -0,0 +1,59 @@
+from time import perf_counter, sleep
+
+POLL_INTERVAL = 0.0001  # Polling period (s) of a WaitUntil in real time
+
+
+class Sleep:
+    """Hold for `duration` seconds, e.g. while a pulse is on the line."""
+    __slots__ = ('duration',)
+
+    def __init__(self, duration):
+        self.duration = duration
+
+
+class WaitUntil:
+    """Wait until `deadline` (clock seconds, None for no deadline) or until a line changed.
+
+    Routines re-check their condition after every WaitUntil, so a driver may
+    always resume them early.
+    """
+    __slots__ = ('deadline',)
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+
+
+def run_realtime(routine, clock=perf_counter, sleep=sleep):
+    """Drive a routine (a generator yielding Sleep/WaitUntil) against a real clock."""
+    for request in routine:
+        if isinstance(request, Sleep):
+            sleep(request.duration)
+        elif request.deadline is None:
+            sleep(POLL_INTERVAL)
+        else:
+            sleep(min(POLL_INTERVAL, max(0.0, request.deadline - clock())))
+
+
+def run_realtime_all(routines, clock=perf_counter, sleep=sleep):
+    """Drive several routines in one process, each one resumed when its request is due."""
+    wake_at = {routine: clock() for routine in routines}
+    while wake_at:
+        for routine, at in list(wake_at.items()):
+            if at > clock():
+                continue
+            try:
+                request = next(routine)
+            except StopIteration:
+                del wake_at[routine]
+                continue
+
+            now = clock()
+            if isinstance(request, Sleep):
+                wake_at[routine] = now + request.duration
+            elif request.deadline is None:
+                wake_at[routine] = now + POLL_INTERVAL
+            else:
+                wake_at[routine] = min(request.deadline, now + POLL_INTERVAL)
+
+        if wake_at:
+            sleep(max(0.0, min(wake_at.values()) - clock()))
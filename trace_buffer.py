@@ -0,0 +1,176 @@
+import os
+import tempfile
+from contextlib import nullcontext
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+
+DEFAULT_CAPACITY = 65536  # Records per line, ~720 KB
+
+OVERFLOW_WRAP = 'wrap'  # Overwrite the oldest records
+OVERFLOW_SPILL = 'spill'  # Append the full buffer to a file and start over
+
+_HEADER_SIZE = 16  # uint64 record count, uint64 spilled chunks
+_RECORD_SIZE = 8 + 2 + 1  # float64 timestamp, uint16 holders count, uint8 state
+
+
+class TraceBuffer:
+    """Preallocated ring buffer of (timestamp, state, holders_count) records.
+
+    The records are stored column by column (all timestamps, then all holder
+    counts, then all states) so get_dataframe() can hand the columns to pandas
+    as views without copying. With shared=True the buffer lives in shared
+    memory and every process that inherited it appends to the same trace.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, overflow=OVERFLOW_WRAP, spill_path=None, shared=True):
+        if overflow not in (OVERFLOW_WRAP, OVERFLOW_SPILL):
+            raise ValueError(f"Unknown overflow mode: {overflow}")
+        self.capacity = capacity
+        self.overflow = overflow
+        self.shared = shared
+
+        if overflow == OVERFLOW_SPILL and spill_path is None:
+            fd, spill_path = tempfile.mkstemp(prefix="line-", suffix=".trace")
+            os.close(fd)
+        self.spill_path = spill_path
+
+        size = _HEADER_SIZE + capacity * _RECORD_SIZE
+        if shared:
+            self._shm = SharedMemory(create=True, size=size)
+            self._lock = Lock()
+        else:
+            self._shm = None
+            self._local = bytearray(size)
+            self._lock = nullcontext()
+        self._attach()
+
+    def _buffer(self):
+        return self._shm.buf if self._shm is not None else memoryview(self._local)
+
+    def _attach(self):
+        buf = self._buffer()
+        cap = self.capacity
+        self._header = buf[:_HEADER_SIZE].cast('Q')
+        self._timestamps = buf[_HEADER_SIZE:_HEADER_SIZE + 8 * cap].cast('d')
+        self._holders = buf[_HEADER_SIZE + 8 * cap:_HEADER_SIZE + 10 * cap].cast('H')
+        self._states = buf[_HEADER_SIZE + 10 * cap:_HEADER_SIZE + 11 * cap]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_header', '_timestamps', '_holders', '_states'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def append(self, timestamp, state, holders_count):
+        with self._lock:
+            count = self._header[0]
+            if count >= self.capacity and self.overflow == OVERFLOW_SPILL:
+                self._spill()
+                count = 0
+            i = count % self.capacity
+            self._timestamps[i] = timestamp
+            self._holders[i] = holders_count
+            self._states[i] = state
+            self._header[0] = count + 1
+
+    def _spill(self):
+        # One chunk is the full buffer in its column layout
+        cap = self.capacity
+        with open(self.spill_path, 'ab') as f:
+            f.write(self._buffer()[_HEADER_SIZE:_HEADER_SIZE + cap * _RECORD_SIZE])
+        self._header[1] += 1
+
+    @property
+    def dropped(self):
+        """Records overwritten in wrap mode"""
+        return max(0, self._header[0] - self.capacity)
+
+    def __len__(self):
+        return self._header[1] * self.capacity + min(self._header[0], self.capacity)
+
+    def _columns(self, np):
+        # Whole-capacity views of the three columns
+        buf = self._buffer()
+        cap = self.capacity
+        return (
+            np.frombuffer(buf, dtype='<f8', count=cap, offset=_HEADER_SIZE),
+            np.frombuffer(buf, dtype='u1', count=cap, offset=_HEADER_SIZE + 10 * cap),
+            np.frombuffer(buf, dtype='<u2', count=cap, offset=_HEADER_SIZE + 8 * cap),
+        )
+
+    def arrays(self):
+        """(timestamp, state, holders_count) numpy arrays in chronological order.
+
+        Views into the buffer unless the buffer wrapped or spilled, in which
+        case the parts are concatenated.
+        """
+        import numpy as np
+
+        cap = self.capacity
+        count = self._header[0]
+        n = min(count, cap)
+        columns = self._columns(np)
+
+        if count > cap:
+            start = count % cap
+            columns = tuple(np.concatenate((c[start:], c[:start])) for c in columns)
+        else:
+            columns = tuple(c[:n] for c in columns)
+
+        chunks = self._header[1]
+        if chunks:
+            spilled = np.fromfile(self.spill_path, dtype='u1', count=chunks * cap * _RECORD_SIZE)
+            spilled = spilled.reshape(chunks, cap * _RECORD_SIZE)
+            spilled_columns = (
+                spilled[:, :8 * cap].copy().view('<f8').reshape(-1),
+                spilled[:, 10 * cap:].reshape(-1),
+                spilled[:, 8 * cap:10 * cap].copy().view('<u2').reshape(-1),
+            )
+            columns = tuple(np.concatenate((s, c)) for s, c in zip(spilled_columns, columns))
+        return columns
+
+    def latest(self, n):
+        """The newest `n` (timestamp, state, holders_count) records still in the buffer, oldest first"""
+        import numpy as np
+
+        timestamp, state, holders_count = self._columns(np)
+        count = self._header[0]
+        n = min(n, count, self.capacity)
+        end = count % self.capacity if count > self.capacity else count
+        if n <= end:
+            return tuple(c[end - n:end] for c in (timestamp, state, holders_count))
+        # The newest records wrap around the end of the buffer
+        return tuple(np.concatenate((c[self.capacity - (n - end):], c[:end])) for c in (timestamp, state, holders_count))
+
+    def close(self):
+        """Detach this process from the buffer, numpy views from arrays() must be gone by now"""
+        for view in (self._header, self._timestamps, self._holders, self._states):
+            view.release()
+        if self._shm is not None:
+            self._shm.close()
+
+    def __del__(self):
+        # Release our views first, SharedMemory refuses to close while they exist
+        for key in ('_header', '_timestamps', '_holders', '_states'):
+            view = self.__dict__.get(key)
+            if view is not None:
+                view.release()
+
+    def unlink(self):
+        """Free the shared memory (and spill file) once no process needs the trace anymore"""
+        if self._shm is not None:
+            self._shm.unlink()
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+
+def new_trace_buffer(manager, **kwargs):
+    """Trace buffer for a line created with `manager`, in process if the manager provides one"""
+    factory = getattr(manager, 'TraceBuffer', None)
+    if factory is not None:
+        return factory(**kwargs)
+    return TraceBuffer(**kwargs)
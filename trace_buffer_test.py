@@ -0,0 +1,69 @@
+import os
+import unittest
+from multiprocessing.shared_memory import SharedMemory
+
+from trace_buffer import OVERFLOW_SPILL, TraceBuffer
+
+CAPACITY = 8
+
+
+def fill(buffer, count):
+    for i in range(count):
+        buffer.append(float(i), i % 2, i % 5)
+
+
+class TraceBufferTest(unittest.TestCase):
+    def new_buffer(self, **kwargs):
+        buffer = TraceBuffer(capacity=CAPACITY, **kwargs)
+        self.addCleanup(buffer.unlink)
+        self.addCleanup(buffer.close)
+        return buffer
+
+    def assertRecords(self, columns, indices):
+        timestamp, state, holders_count = columns
+        self.assertEqual(list(timestamp), [float(i) for i in indices])
+        self.assertEqual(list(state), [i % 2 for i in indices])
+        self.assertEqual(list(holders_count), [i % 5 for i in indices])
+
+    def test_below_capacity(self):
+        buffer = self.new_buffer()
+        fill(buffer, 5)
+        self.assertEqual((len(buffer), buffer.dropped), (5, 0))
+        self.assertRecords(buffer.arrays(), range(5))
+        self.assertRecords(buffer.latest(3), range(2, 5))
+        self.assertRecords(buffer.latest(100), range(5))
+
+    def test_wrap_keeps_the_newest_records(self):
+        buffer = self.new_buffer()
+        fill(buffer, CAPACITY + 3)
+        self.assertEqual((len(buffer), buffer.dropped), (CAPACITY, 3))
+        self.assertRecords(buffer.arrays(), range(3, CAPACITY + 3))
+        self.assertRecords(buffer.latest(5), range(CAPACITY - 2, CAPACITY + 3))  # Across the end of the ring
+        self.assertRecords(buffer.latest(2), range(CAPACITY + 1, CAPACITY + 3))
+
+    def test_spill_keeps_every_record(self):
+        buffer = self.new_buffer(overflow=OVERFLOW_SPILL)
+        count = 2 * CAPACITY + 3
+        fill(buffer, count)
+        self.assertEqual((len(buffer), buffer.dropped), (count, 0))
+        self.assertRecords(buffer.arrays(), range(count))
+        self.assertRecords(buffer.latest(2), range(count - 2, count))  # From memory, the spilled chunks are gone
+
+    def test_unlink_frees_memory_and_spill_file(self):
+        buffer = TraceBuffer(capacity=CAPACITY, overflow=OVERFLOW_SPILL)
+        fill(buffer, CAPACITY + 1)
+        name, spill_path = buffer._shm.name, buffer.spill_path
+        self.assertTrue(os.path.exists(spill_path))
+        buffer.close()
+        buffer.unlink()
+        self.assertFalse(os.path.exists(spill_path))
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=name)
+
+    def test_unknown_overflow_mode(self):
+        with self.assertRaises(ValueError):
+            TraceBuffer(capacity=CAPACITY, overflow='drop')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Wiring map of every MCU, kept between runs.
+
+When an MCU has tested all its lines it stores which lines worked in which
+role and which ended blacklisted, one JSON file per fingerprint of its name
+and line names. On the next start MCU(..., wiring_cache=...) confirms the
+cached working lines with short VERIFY pulses instead of full handshakes
+and runs the full discovery only for lines that fail the confirmation or
+were blacklisted. A changed line set has another fingerprint and starts
+from scratch.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+def fingerprint(mcu_name, line_names):
+    """Stable key of an MCU and its line set, the order of the lines does not matter"""
+    key = json.dumps([mcu_name, sorted(line_names)])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+class WiringCache:
+    """Directory of cached wiring maps.
+
+    Every MCU writes its own file and replaces it atomically, so MCUs in
+    different processes can share one directory.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, mcu_name, line_names):
+        return os.path.join(self.directory, f"{fingerprint(mcu_name, line_names)}.json")
+
+    def load(self, mcu_name, line_names):
+        """Cached map of this MCU and exactly this line set, None if there is none.
+
+        A map of another line set says nothing reliable about this one, a
+        changed line set runs the full discovery.
+        """
+        wiring = self._read(self._path(mcu_name, line_names))
+        if wiring is None or wiring.get('mcu_name') != mcu_name:
+            return None
+        if sorted(wiring.get('lines', ())) != sorted(line_names):
+            return None  # Fingerprint collision
+        return wiring
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, mcu_name, line_names, white_list, responder_list, black_list):
+        os.makedirs(self.directory, exist_ok=True)
+        wiring = {
+            'mcu_name': mcu_name,
+            'lines': list(line_names),
+            'white_list': list(white_list),  # Worked with this MCU as initiator
+            'responder_list': list(responder_list),  # Worked with this MCU as responder
+            'black_list': list(black_list),
+            'stored': datetime.now().isoformat(timespec='seconds'),
+        }
+        path = self._path(mcu_name, line_names)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(wiring, f, indent=2)
+        os.replace(temporary, path)
+
+    def forget(self, mcu_name, line_names):
+        try:
+            os.remove(self._path(mcu_name, line_names))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,81 @@
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from mcu import MCU
+from results import ResultsAggregator
+from shared_lines import SharedLine
+from simulation import Simulation
+from wiring_cache import WiringCache, fingerprint
+
+LINES = ["L1", "L2", "L3"]
+
+
+class WiringCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = WiringCache(os.path.join(directory.name, "wiring"))  # Created by the first store
+
+    def store(self, mcu_name="A", line_names=LINES):
+        self.cache.store(mcu_name, line_names, white_list=["L1"], responder_list=["L2"], black_list=["L3"])
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.load("A", LINES))
+        self.store()
+        wiring = self.cache.load("A", list(reversed(LINES)))  # The line order does not matter
+        self.assertEqual((wiring['white_list'], wiring['responder_list'], wiring['black_list']),
+                         (["L1"], ["L2"], ["L3"]))
+        self.assertIsNone(self.cache.load("B", LINES))
+        self.cache.forget("A", LINES)
+        self.assertIsNone(self.cache.load("A", LINES))
+
+    def test_other_line_set_is_ignored(self):
+        self.store()
+        self.assertNotEqual(fingerprint("A", LINES), fingerprint("A", LINES[:2]))
+        self.assertIsNone(self.cache.load("A", LINES[:2]))
+        self.assertIsNone(self.cache.load("A", LINES + ["L4"]))
+
+    def test_fingerprint_collision_is_ignored(self):
+        # Another line set stored under this line set's fingerprint
+        self.store(line_names=["X1", "X2"])
+        os.replace(self.cache._path("A", ["X1", "X2"]), self.cache._path("A", LINES))
+        self.assertIsNone(self.cache.load("A", LINES))
+
+    def test_corrupt_file_is_ignored(self):
+        self.store()
+        with open(self.cache._path("A", LINES), 'w') as f:
+            f.write('{"mcu_name": "A", "lines": [')
+        self.assertIsNone(self.cache.load("A", LINES))
+        self.store()  # Replaced by the next store
+        self.assertIsNotNone(self.cache.load("A", LINES))
+
+    def test_stored_by_the_mcus_and_confirmed_on_the_next_run(self):
+        runs = [self._discover() for _ in range(2)]
+        self.assertEqual(runs[0][0], runs[1][0])
+        self.assertLess(runs[1][1], runs[0][1])  # VERIFY pulses instead of full handshakes
+        with open(self.cache._path("A", LINES)) as f:
+            self.assertEqual(sorted(json.load(f)['lines']), LINES)
+
+    def _discover(self):
+        """(working lines per MCU, virtual seconds until both completed) of one run with the cache"""
+        random.seed(0)
+        sim = Simulation()
+        wiring = [(name, sim.add_line(SharedLine(sim.manager, name=name, clock=sim.clock))) for name in LINES]
+        for name in "AB":
+            sim.add_mcu(MCU(name, wiring, sim.output_queue, clock=sim.clock, wiring_cache=self.cache))
+        results = ResultsAggregator(sim.output_queue, ["A", "B"], clock=sim.clock)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sim.run(until=300.0, stop_when=results.poll)
+            sim.close()
+        self.assertTrue(results.done)
+        working = {(mcu, line) for (mcu, line), status in results.lines.items() if status['status'] == 'WORKING'}
+        return working, max(row['completed_at'] for row in results.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()